@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""Backfill estimated costs for products whose cost is NULL.
+
+Estimates come from pluggable strategies and are applied either as a
+single set-based UPDATE or by staging vectorized estimates in a temp table
+and joining it back with one UPDATE. No SQL is built from row values.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import column, insert, table, text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COST_RATIO = 0.6  # cost assumed to be 60% of price when nothing better is known
+DEFAULT_CHUNK_SIZE = 50000
+
+MISSING_COST_FILTER = "cost IS NULL AND price IS NOT NULL AND source = :source"
+
+class FixedRatioStrategy:
+    """Estimate cost as a fixed share of price."""
+
+    name = 'fixed'
+
+    def __init__(self, ratio=DEFAULT_COST_RATIO):
+        self.ratio = ratio
+
+    def prepare(self, conn, source):
+        """Nothing to stage for a constant ratio."""
+
+    def sql_expression(self):
+        """SQL for the estimated cost of a products row, with its bind parameters."""
+        return "price * :ratio", {'ratio': self.ratio}
+
+    def estimate(self, products):
+        """Vectorized estimate for a DataFrame with price and category columns."""
+        return products['price'].to_numpy(dtype=float) * self.ratio
+
+class CategoryRatioStrategy:
+    """Estimate cost from a per-category cost/price ratio.
+
+    Ratios can be given explicitly or learned as the median cost/price of
+    products in the same category that already have a cost.
+    """
+
+    name = 'category'
+
+    def __init__(self, ratios=None, default_ratio=DEFAULT_COST_RATIO):
+        self.ratios = dict(ratios or {})
+        self.default_ratio = default_ratio
+        self.learn = ratios is None
+
+    def prepare(self, conn, source):
+        """Learn ratios from known costs and stage them for the set-based UPDATE."""
+        if self.learn:
+            rows = conn.execute(text("""
+                SELECT category, percentile_cont(0.5) WITHIN GROUP (ORDER BY cost / price) AS ratio
+                FROM products
+                WHERE cost IS NOT NULL AND price > 0 AND source = :source
+                GROUP BY category
+            """), {'source': source})
+            self.ratios.update({category: float(ratio) for category, ratio in rows})
+
+        conn.execute(text(
+            "CREATE TEMP TABLE IF NOT EXISTS cost_ratios (category TEXT PRIMARY KEY, ratio NUMERIC) ON COMMIT DROP"
+        ))
+        if self.ratios:
+            conn.execute(
+                insert(table('cost_ratios', column('category'), column('ratio'))),
+                [{'category': category, 'ratio': ratio} for category, ratio in self.ratios.items()]
+            )
+
+    def sql_expression(self):
+        return (
+            "price * COALESCE((SELECT r.ratio FROM cost_ratios r WHERE r.category = products.category), :ratio)",
+            {'ratio': self.default_ratio}
+        )
+
+    def estimate(self, products):
+        ratios = products['category'].map(self.ratios).fillna(self.default_ratio).to_numpy(dtype=float)
+        return products['price'].to_numpy(dtype=float) * ratios
+
+STRATEGIES = {
+    FixedRatioStrategy.name: FixedRatioStrategy,
+    CategoryRatioStrategy.name: CategoryRatioStrategy,
+}
+
+def backfill_set_based(conn, strategy, source):
+    """Apply the strategy with one UPDATE ... WHERE cost IS NULL; returns rows updated."""
+    expression, params = strategy.sql_expression()
+    result = conn.execute(
+        text(f"UPDATE products SET cost = ROUND(({expression})::numeric, 2) WHERE {MISSING_COST_FILTER}"),
+        dict(params, source=source)
+    )
+    return result.rowcount
+
+def backfill_via_temp_table(conn, strategy, source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Estimate costs in pandas chunk by chunk, stage them and apply one joined UPDATE."""
+    conn.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS cost_estimates (id INTEGER PRIMARY KEY, cost NUMERIC(10, 2)) ON COMMIT DROP"
+    ))
+    estimates = table('cost_estimates', column('id'), column('cost'))
+
+    # Server-side cursor, so only one chunk of candidate rows is held in memory
+    chunks = pd.read_sql(
+        text(f"SELECT id, price, category FROM products WHERE {MISSING_COST_FILTER}"),
+        conn.execution_options(stream_results=True), params={'source': source}, chunksize=chunk_size
+    )
+    for products in chunks:
+        costs = np.round(strategy.estimate(products), 2)
+        conn.execute(insert(estimates), [
+            {'id': int(product_id), 'cost': float(cost)}
+            for product_id, cost in zip(products['id'].to_numpy(), costs)
+        ])
+
+    result = conn.execute(text("""
+        UPDATE products p SET cost = e.cost
+        FROM cost_estimates e
+        WHERE p.id = e.id AND p.cost IS NULL
+    """))
+    return result.rowcount
+
+def backfill_costs(engine, strategy=None, mode='set', source='lazada'):
+    """Fill in missing product costs in one transaction; returns rows updated."""
+    strategy = strategy or FixedRatioStrategy()
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        strategy.prepare(conn, source)
+        if mode == 'set':
+            updated = backfill_set_based(conn, strategy, source)
+        elif mode == 'temp':
+            updated = backfill_via_temp_table(conn, strategy, source)
+        else:
+            raise ValueError(f"Unknown backfill mode: {mode}")
+
+    elapsed = time.perf_counter() - started
+    rate = updated / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Backfilled cost for {updated} products with the {strategy.name} strategy "
+                f"in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return updated
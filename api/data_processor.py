@@ -1,54 +1,59 @@
 #!/usr/bin/env python
 import pandas as pd
 import os
-from sqlalchemy import create_engine
+import sys
+import argparse
+from sqlalchemy import text
 import logging
 import json
 
+# Shared modules (db) live at the repository root, the feature snapshot in the pricing engine
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'pricing_engine'))
+sys.path.insert(0, ROOT_DIR)
+import db
+from feature_snapshot import build_snapshot
+from result_cache import invalidate as invalidate_cached_results
+from cost_backfill import (STRATEGIES, DEFAULT_COST_RATIO, CategoryRatioStrategy,
+                           FixedRatioStrategy, backfill_costs)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def connect_to_database():
     """Connect to the database."""
-    db_host = os.environ.get('DB_HOST', 'db')
-    db_user = os.environ.get('DB_USER', 'postgres')
-    db_password = os.environ.get('DB_PASSWORD', 'postgres')
-    db_name = os.environ.get('DB_NAME', 'lazada_products')
-    
-    connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
-    return create_engine(connection_string)
+    return db.get_engine('postgres')
 
-def process_lazada_data():
-    """Process Lazada data for price optimization."""
+def process_lazada_data(strategy=None, mode='set', snapshot=True):
+    """Process Lazada data for price optimization.
+    
+    Unless snapshot is False, the optimizers' feature snapshot is rebuilt
+    afterwards so they see the new costs without querying the database.
+    """
     try:
         engine = connect_to_database()
         
-        # Get raw Lazada product data
-        query = """
-        SELECT * FROM products
-        WHERE source = 'lazada'
-        """
-        lazada_df = pd.read_sql(query, engine)
+        # Count Lazada products instead of loading them all
+        with engine.connect() as conn:
+            product_count = conn.execute(
+                text("SELECT COUNT(*) FROM products WHERE source = :source"), {'source': 'lazada'}
+            ).scalar()
         
-        if lazada_df.empty:
+        if not product_count:
             logger.warning("No Lazada products found in database")
             return False
         
-        # Calculate metrics needed for price optimization
-        for index, row in lazada_df.iterrows():
-            if pd.isna(row['cost']):
-                # Estimate cost if missing (example: 60% of price)
-                cost = row['price'] * 0.6
-                
-                # Update cost in database
-                update_query = f"""
-                UPDATE products
-                SET cost = {cost}
-                WHERE id = {row['id']}
-                """
-                engine.execute(update_query)
+        # Estimate missing costs (default: 60% of price) in one set-based pass
+        updated = backfill_costs(engine, strategy, mode=mode, source='lazada')
+        if updated:
+            # Costs feed the optimizers, so cached results for these products are stale
+            invalidate_cached_results()
+        
+        if snapshot:
+            meta = build_snapshot(engine)
+            logger.info(f"Built feature snapshot {meta['version']} with {meta['rows']} products")
                 
-        logger.info(f"Processed {len(lazada_df)} Lazada products")
+        logger.info(f"Processed {product_count} Lazada products")
         return True
     
     except Exception as e:
@@ -56,4 +61,24 @@ def process_lazada_data():
         return False
 
 if __name__ == "__main__":
-    process_lazada_data() 
\ No newline at end of file
+    # Inside docker-compose the database host is the "db" service
+    os.environ.setdefault('DB_HOST', 'db')
+    os.environ.setdefault('DB_PASSWORD', 'postgres')
+
+    parser = argparse.ArgumentParser(description='Prepare Lazada products for price optimization')
+    parser.add_argument('--cost-strategy', choices=sorted(STRATEGIES), default=FixedRatioStrategy.name,
+                        help='How missing costs are estimated')
+    parser.add_argument('--cost-ratio', type=float, default=DEFAULT_COST_RATIO,
+                        help='Cost/price ratio for the fixed strategy, fallback for the category strategy')
+    parser.add_argument('--backfill-mode', choices=['set', 'temp'], default='set',
+                        help='Single set-based UPDATE, or vectorized estimates staged in a temp table')
+    parser.add_argument('--skip-snapshot', action='store_true',
+                        help='Do not rebuild the optimizer feature snapshot afterwards')
+    args = parser.parse_args()
+    
+    if args.cost_strategy == CategoryRatioStrategy.name:
+        strategy = CategoryRatioStrategy(default_ratio=args.cost_ratio)
+    else:
+        strategy = FixedRatioStrategy(args.cost_ratio)
+    
+    process_lazada_data(strategy, mode=args.backfill_mode, snapshot=not args.skip_snapshot)
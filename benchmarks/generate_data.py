@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Generate synthetic Lazada seller-center exports for benchmarking.
+
+Output has the same columns as the bundled sellercenter CSV. Category
+hierarchies, price-range formats and name vocabulary are modelled on it,
+with configurable size, depth and cardinality.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Product Image', 'Product Name', 'Item Category', 'Price Range']
+
+ROOT_CATEGORIES = ['Electronics Accessories', 'Mobile Accessories', 'Computer Accessories',
+                   'Camera Accessories', 'Audio', 'Wearables', 'Home Appliances', 'Gaming']
+CATEGORY_WORDS = ['Chargers', 'Cables', 'Cases', 'Power Banks', 'Stands', 'Mice', 'Keyboards',
+                  'Adapters', 'Hubs', 'Stylus Pens', 'Covers', 'Lenses', 'Tripods', 'Cooling Fans',
+                  'Headphones', 'Speakers', 'Straps', 'Mounts', 'Screen Protectors', 'Storage']
+NAME_WORDS = ['USB', 'Type-C', 'Fast', 'Charging', 'Charger', 'Adapter', 'Cable', 'For', 'iPhone',
+              '15', 'Samsung', 'Huawei', 'Xiaomi', 'Universal', 'Quick', 'Charge', 'Plug', 'PD',
+              '20W', '65W', '120W', 'Wireless', 'Magnetic', 'Case', 'Cover', 'Soft', 'Silicone',
+              'Cute', 'Cartoon', 'Keychain', 'Mouse', 'Keyboard', 'Bluetooth', 'Gaming', 'RGB',
+              'Portable', 'Mini', 'Dual', 'Port', 'LED', 'Stand', 'Holder', 'Car', 'Power', 'Bank',
+              '10000mAh', '20000mAh', 'Original', 'Premium', 'Durable', '🔥', '【Ready Stock】']
+
+# Share of each price-range format in the output
+PRICE_FORMATS = {'single': 0.45, 'range': 0.45, 'thousands': 0.08, 'malformed': 0.02}
+
+def build_categories(cardinality, depth, rng):
+    """Return cardinality distinct "A > B > C" paths of the given depth."""
+    paths = set()
+    while len(paths) < cardinality:
+        levels = [rng.choice(ROOT_CATEGORIES)]
+        for level in range(1, depth):
+            word = rng.choice(CATEGORY_WORDS)
+            # Suffix deeper levels so large cardinalities stay distinct
+            levels.append(f"{word} {rng.integers(1, max(2, cardinality // 10))}" if level > 1 else word)
+        paths.add(' > '.join(levels))
+    return np.array(sorted(paths), dtype=object)
+
+def build_prices(rows, formats, rng):
+    """Return an object array of price-range strings in the requested format mix."""
+    kinds = rng.choice(list(formats), size=rows, p=np.array(list(formats.values())) / sum(formats.values()))
+    low = np.round(rng.lognormal(mean=2.5, sigma=1.0, size=rows), 2)
+    high = np.round(low * rng.uniform(1.0, 4.0, size=rows), 2)
+
+    prices = np.empty(rows, dtype=object)
+    single = kinds == 'single'
+    prices[single] = [f"{value:g}" for value in low[single]]
+    ranged = kinds == 'range'
+    prices[ranged] = [f"{a:g}-{b:g}" for a, b in zip(low[ranged], high[ranged])]
+    thousands = kinds == 'thousands'
+    prices[thousands] = [f"{a * 100:,.0f}-{b * 100:,.0f}" for a, b in zip(low[thousands], high[thousands])]
+    malformed = kinds == 'malformed'
+    prices[malformed] = rng.choice(['', 'N/A', '12..5', '9-', 'call'], size=int(malformed.sum()))
+    return prices
+
+def generate_export(rows, category_depth=3, category_cardinality=60, price_formats=None,
+                    name_words=(6, 16), seed=0):
+    """Build a synthetic seller-center export as a DataFrame."""
+    rng = np.random.default_rng(seed)
+    categories = build_categories(category_cardinality, category_depth, rng)
+    # Skewed category popularity, like the real top-product lists
+    weights = 1.0 / np.arange(1, len(categories) + 1)
+    category_column = rng.choice(categories, size=rows, p=weights / weights.sum())
+
+    vocabulary = np.array(NAME_WORDS, dtype=object)
+    lengths = rng.integers(name_words[0], name_words[1] + 1, size=rows)
+    words = rng.choice(vocabulary, size=(rows, name_words[1]))
+    names = [' '.join(row[:length]) for row, length in zip(words, lengths)]
+
+    hashes = rng.integers(0, 2 ** 63, size=(rows, 2), dtype=np.int64)
+    images = [f"https://img.lazcdn.com/g/p/{a:016x}{b:016x}.jpg_300x300q75.jpg_.webp" for a, b in hashes]
+
+    return pd.DataFrame({
+        'Product Image': images,
+        'Product Name': names,
+        'Item Category': category_column,
+        'Price Range': build_prices(rows, price_formats or PRICE_FORMATS, rng),
+    }, columns=COLUMNS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic Lazada seller-center export')
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of products')
+    parser.add_argument('--category-depth', type=int, default=3, help='Levels per category path')
+    parser.add_argument('--category-cardinality', type=int, default=60, help='Distinct category paths')
+    parser.add_argument('--malformed-share', type=float, default=PRICE_FORMATS['malformed'],
+                        help='Share of unparseable price ranges')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    formats = dict(PRICE_FORMATS, malformed=args.malformed_share)
+    df = generate_export(args.rows, args.category_depth, args.category_cardinality, formats, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df)} rows to {args.output}")
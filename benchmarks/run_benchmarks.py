@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""Benchmark the import and pricing hot paths on synthetic exports.
+
+Each benchmark runs in a fresh process so its peak RSS is its own. Results
+are printed and written as JSON; pass --compare with an earlier result file
+to see the change in throughput.
+
+By default the database steps run against a temporary SQLite file; --mysql
+uses the MySQL database configured through the usual DB_* / MYSQL_*
+variables instead (a scratch database, since products are inserted).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCHMARKS_DIR, '..')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'pricing_engine'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server', 'ml'))
+
+from generate_data import generate_export
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+SINGLE_OPTIMIZE_SAMPLE = 2000  # optimize_price is timed on a sample and reported as a rate
+
+SQLITE_SCHEMA = """
+CREATE TABLE categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_name TEXT NOT NULL,
+    parent_category_id INTEGER,
+    level INTEGER
+);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_name TEXT,
+    product_image_url TEXT,
+    category TEXT,
+    category_id INTEGER REFERENCES categories(id),
+    price_range TEXT,
+    min_price REAL,
+    max_price REAL
+);
+"""
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the %s placeholders used by the MySQL code paths."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, params=()):
+        return self._cursor.execute(statement.replace('%s', '?'), params)
+
+    def executemany(self, statement, seq_params):
+        return self._cursor.executemany(statement.replace('%s', '?'), seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class SQLiteConnection:
+    """sqlite3 connection handing out SQLiteCursor objects."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def open_database(use_mysql, workdir):
+    """Return a fresh connection for the database benchmarks."""
+    if use_mysql:
+        from db import mysql_connection
+        return mysql_connection()
+    path = os.path.join(workdir, f"bench-{os.getpid()}.sqlite")
+    if os.path.exists(path):
+        os.unlink(path)
+    conn = SQLiteConnection(path)
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
+
+def products_frame(df):
+    """Shape an export like the products table the optimizers read."""
+    import numpy as np
+    import pandas as pd
+    from price_parser import parse_price_ranges
+
+    min_price, _, _ = parse_price_ranges(df['Price Range'])
+    price = np.nan_to_num(min_price, nan=10.0)
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'id': np.arange(1, len(df) + 1),
+        'category': df['Item Category'].to_numpy(),
+        'price': price,
+        'cost': np.round(price * 0.6, 2),
+        'sales_velocity': rng.uniform(0, 5, len(df)),
+        'historical_sales': rng.integers(10, 500, len(df)).astype(float),
+        'historical_price': price,
+    })
+
+def bench_csv_read(csv_file, options):
+    from csv_stream import read_csv_chunks
+    started = time.perf_counter()
+    rows = sum(len(df) for df in read_csv_chunks(csv_file))
+    return rows, time.perf_counter() - started
+
+def bench_parse_price_ranges(csv_file, options):
+    import pandas as pd
+    from price_parser import parse_price_ranges
+    price_ranges = pd.read_csv(csv_file, usecols=['Price Range'])['Price Range']
+    started = time.perf_counter()
+    parse_price_ranges(price_ranges)
+    return len(price_ranges), time.perf_counter() - started
+
+def bench_category_resolve(csv_file, options):
+    import pandas as pd
+    from category_resolver import CategoryTrie
+    categories = pd.read_csv(csv_file, usecols=['Item Category'])['Item Category']
+    conn = open_database(options['mysql'], options['workdir'])
+    cursor = conn.cursor()
+    try:
+        started = time.perf_counter()
+        trie = CategoryTrie.load(cursor)
+        trie.resolve(cursor, categories.dropna().unique())
+        conn.commit()
+        elapsed = time.perf_counter() - started
+    finally:
+        cursor.close()
+        conn.close()
+    return len(categories), elapsed
+
+def bench_insert_products(csv_file, options):
+    import pandas as pd
+    from bulk_loader import insert_products, product_rows
+    from category_resolver import CategoryTrie
+    df = pd.read_csv(csv_file)
+    conn = open_database(options['mysql'], options['workdir'])
+    cursor = conn.cursor()
+    try:
+        category_ids, _ = CategoryTrie.load(cursor).resolve(cursor, df['Item Category'].dropna().unique())
+        conn.commit()
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                rows = product_rows(df, category_ids)
+            finally:
+                sys.stdout = stdout
+        started = time.perf_counter()
+        insert_products(conn, rows, batch_size=options['batch_size'], report=False)
+        elapsed = time.perf_counter() - started
+    finally:
+        cursor.close()
+        conn.close()
+    return len(rows), elapsed
+
+def bench_optimize_price(csv_file, options):
+    import pandas as pd
+    from price_optimizer import optimize_price
+    products = products_frame(pd.read_csv(csv_file)).head(SINGLE_OPTIMIZE_SAMPLE)
+    parameters = {'competitor_price': 20.0}
+    # Warm the model registry so the first call does not pay for the stat/load
+    optimize_price(products.iloc[[0]], parameters)
+    started = time.perf_counter()
+    for i in range(len(products)):
+        optimize_price(products.iloc[[i]], parameters)
+    return len(products), time.perf_counter() - started
+
+def bench_optimize_prices_batch(csv_file, options):
+    import pandas as pd
+    from optimize import optimize_prices
+    products = products_frame(pd.read_csv(csv_file))
+    started = time.perf_counter()
+    optimize_prices(products, {'optimizer': 'grid', 'grid_size': options['grid_size']})
+    return len(products), time.perf_counter() - started
+
+BENCHMARKS = {
+    'csv_read': bench_csv_read,
+    'parse_price_ranges': bench_parse_price_ranges,
+    'category_resolve': bench_category_resolve,
+    'insert_products': bench_insert_products,
+    'optimize_price': bench_optimize_price,
+    'optimize_prices_batch': bench_optimize_prices_batch,
+}
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (ru_maxrss is bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_in_child(name, csv_file, options, results):
+    rows, seconds = BENCHMARKS[name](csv_file, options)
+    results.put({'rows': rows, 'seconds': seconds, 'peak_rss_mb': peak_rss_mb()})
+
+def run_benchmark(name, csv_file, options):
+    """Run one benchmark in a fresh process and return its result record."""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_in_child, args=(name, csv_file, options, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {'benchmark': name, 'error': f"exit code {process.exitcode}"}
+    result = results.get()
+    seconds = result['seconds']
+    return {
+        'benchmark': name,
+        'rows': result['rows'],
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(result['rows'] / seconds, 1) if seconds > 0 else None,
+        'peak_rss_mb': round(result['peak_rss_mb'], 1),
+    }
+
+def ensure_export(size, data_dir, seed):
+    """Generate the synthetic export for a size once and reuse it across runs."""
+    path = os.path.join(data_dir, f"lazada-synthetic-{size}-{seed}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {size} rows -> {path}")
+        generate_export(size, seed=seed).to_csv(path, index=False)
+    return path
+
+def compare(results, baseline_file):
+    """Print the throughput change against a previous result file."""
+    with open(baseline_file) as f:
+        baseline = {(r['benchmark'], r['size']): r for r in json.load(f)['results'] if 'error' not in r}
+    print(f"\nCompared with {baseline_file}:")
+    for result in results:
+        before = baseline.get((result['benchmark'], result['size']))
+        if before is None or 'error' in result or not before['rows_per_second']:
+            continue
+        change = result['rows_per_second'] / before['rows_per_second'] - 1
+        print(f"  {result['benchmark']:<24} {result['size']:>9}  {change:+.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import and pricing hot paths')
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=DEFAULT_SIZES, help='Comma-separated row counts (default: 10000,100000,1000000)')
+    parser.add_argument('--only', type=lambda value: value.split(','), default=list(BENCHMARKS),
+                        help=f"Comma-separated benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'lazada-benchmarks'),
+                        help='Where synthetic exports are generated and cached')
+    parser.add_argument('--output', default='benchmark-results.json', help='JSON file for the results')
+    parser.add_argument('--compare', help='Earlier result file to compare throughput against')
+    parser.add_argument('--mysql', action='store_true', help='Run database steps against MySQL instead of SQLite')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per insert batch')
+    parser.add_argument('--grid-size', type=int, default=200, help='Candidate prices per product for batch optimization')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data')
+    args = parser.parse_args()
+
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    options = {'mysql': args.mysql, 'workdir': args.data_dir,
+               'batch_size': args.batch_size, 'grid_size': args.grid_size}
+
+    results = []
+    for size in args.sizes:
+        csv_file = ensure_export(size, args.data_dir, args.seed)
+        for name in args.only:
+            result = dict(run_benchmark(name, csv_file, options), size=size)
+            results.append(result)
+            if 'error' in result:
+                print(f"{name:<24} {size:>9}  failed: {result['error']}")
+            else:
+                print(f"{name:<24} {size:>9}  {result['seconds']:>9.3f}s  "
+                      f"{result['rows_per_second']:>12,.0f} rows/s  {result['peak_rss_mb']:>8.1f} MiB")
+
+    report = {
+        'meta': {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': 'mysql' if args.mysql else 'sqlite',
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Start-up budget of the per-request pricing CLI (pricing_engine/optimize.py).
+
+The API spawns one interpreter per request, so the time from interpreter
+start to the JSON answer matters more than throughput. Each measurement
+runs in a fresh interpreter. By default the child optimizes an in-memory
+product, so the database round-trip is left out; pass --product-id to
+time the real CLI against the configured Postgres database instead.
+
+The run fails (exit status 1) when the median exceeds --budget-ms or when
+the single-product path imports one of the heavy modules, so it can guard
+against regressions in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PRICING_DIR = os.path.join(BENCHMARKS_DIR, '..', 'pricing_engine')
+
+DEFAULT_BUDGET_MS = 100.0
+HEAVY_MODULES = ('numpy', 'pandas', 'sqlalchemy', 'joblib', 'sklearn')
+
+# What optimize.py does for --product_id, with the product row given instead of read
+CHILD_SCRIPT = """
+import sys
+sys.path.insert(0, {pricing_dir!r})
+import json
+import optimize
+product = {{'id': 1, 'category': 'Mobiles & Tablets > Mobile Accessories', 'price': 19.9, 'cost': 11.5,
+           'competitor_price': None, 'historical_sales': 120, 'historical_price': 21.0, 'sales_velocity': 3.5}}
+print(json.dumps(optimize.optimize_price(product, {parameters!r})))
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)), file=sys.stderr)
+"""
+
+def time_command(command, env=None):
+    """Wall time of one child process in ms, with its stdout and stderr."""
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command[:3])}... failed: {result.stderr.strip()}")
+    return elapsed, result.stdout, result.stderr
+
+def import_profile(top=10):
+    """Cumulative import time of optimize and its slowest imports (python -X importtime)."""
+    _, _, stderr = time_command([sys.executable, '-X', 'importtime', '-c',
+                                 f"import sys; sys.path.insert(0, {PRICING_DIR!r}); import optimize"])
+    modules = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                modules.append((name.strip(), int(cumulative) / 1000))
+    total = next((ms for name, ms in modules if name == 'optimize'), None)
+    slowest = sorted(((name, ms) for name, ms in modules if name != 'optimize'),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return total, slowest
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the start-up time of the pricing CLI')
+    parser.add_argument('--runs', type=int, default=15, help='Fresh interpreters to time')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='Fail when the median interpreter-to-JSON time is above this')
+    parser.add_argument('--parameters', default='{"optimizer": "grid", "competitor_price": 22.0}',
+                        help='Optimization parameters as JSON')
+    parser.add_argument('--product-id', type=int,
+                        help='Run the real CLI for this product against Postgres instead of an in-memory product')
+    parser.add_argument('--output', help='JSON file for the results')
+    args = parser.parse_args()
+
+    parameters = json.loads(args.parameters)
+    if args.product_id is not None:
+        command = [sys.executable, os.path.join(PRICING_DIR, 'optimize.py'),
+                   '--product_id', str(args.product_id), '--parameters', args.parameters]
+    else:
+        command = [sys.executable, '-c', CHILD_SCRIPT.format(pricing_dir=PRICING_DIR, parameters=parameters,
+                                                            heavy=HEAVY_MODULES)]
+
+    # Interpreter start-up alone, as the floor
+    baseline = min(time_command([sys.executable, '-c', 'pass'])[0] for _ in range(5))
+
+    timings, heavy_loaded = [], []
+    time_command(command)  # warm the OS file cache
+    for _ in range(args.runs):
+        elapsed, stdout, stderr = time_command(command)
+        json.loads(stdout.strip().splitlines()[-1])
+        timings.append(elapsed)
+        if args.product_id is None:
+            heavy_loaded = json.loads(stderr.strip().splitlines()[-1])
+
+    import_total, slowest = import_profile()
+    results = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'median_ms': round(statistics.median(timings), 1),
+        'min_ms': round(min(timings), 1),
+        'max_ms': round(max(timings), 1),
+        'interpreter_ms': round(baseline, 1),
+        'import_optimize_ms': round(import_total, 1) if import_total is not None else None,
+        'slowest_imports_ms': {name: round(ms, 1) for name, ms in slowest},
+        'heavy_modules_loaded': heavy_loaded,
+        'budget_ms': args.budget_ms,
+    }
+
+    print(f"interpreter to JSON: median {results['median_ms']} ms, min {results['min_ms']} ms, "
+          f"max {results['max_ms']} ms over {args.runs} runs (bare interpreter {results['interpreter_ms']} ms)")
+    print(f"import optimize: {results['import_optimize_ms']} ms; slowest imports:")
+    for name, ms in slowest:
+        print(f"  {name:40s} {ms:8.1f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if heavy_loaded:
+        print(f"FAIL: single-product path imported {', '.join(heavy_loaded)}")
+        failed = True
+    if results['median_ms'] > args.budget_ms:
+        print(f"FAIL: median {results['median_ms']} ms is over the {args.budget_ms} ms budget")
+        failed = True
+    if not failed:
+        print(f"OK: within the {args.budget_ms} ms budget")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import csv
+import os
+import tempfile
+import time
+
+from pipeline_metrics import count, stage
+from price_parser import parse_price_ranges, report_rejected, to_sql_values
+
+DEFAULT_BATCH_SIZE = 1000
+
+PRODUCT_COLUMNS = ('product_name', 'product_image_url', 'category', 'category_id',
+                   'price_range', 'min_price', 'max_price')
+
+INSERT_PRODUCTS_QUERY = """
+INSERT INTO products
+(product_name, product_image_url, category, category_id, price_range, min_price, max_price)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+def product_rows(df, category_ids, offset=0, stats=None, prices=None):
+    """Build PRODUCT_COLUMNS rows for one chunk of a seller-center export.
+
+    Price ranges are parsed for the whole chunk at once; unparseable cells
+    become NULL and are reported with their row number (offset + position).
+    prices, a (min_prices, max_prices) pair, skips that for a chunk parsed
+    earlier. When stats (a CategoryStats) is given, the chunk is folded into it.
+    """
+    if prices is None:
+        with stage('price_parse'):
+            min_prices, max_prices, rejected = parse_price_ranges(df['Price Range'])
+        count('rejected_prices', len(rejected))
+        report_rejected(rejected, offset=offset)
+    else:
+        min_prices, max_prices = prices
+    if stats is not None:
+        with stage('analytics'):
+            stats.update(df['Item Category'], min_prices, max_prices)
+    return list(zip(
+        df['Product Name'], df['Product Image'], df['Item Category'],
+        [category_ids.get(category) for category in df['Item Category']], df['Price Range'],
+        to_sql_values(min_prices), to_sql_values(max_prices)
+    ))
+
+def report_throughput(label, rows, started):
+    """Print the row count and rows per second since started."""
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    print(f"{label}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def batches(rows, batch_size):
+    """Yield lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_batched(conn, query, rows, batch_size=DEFAULT_BATCH_SIZE, label='Inserted', report_every=10,
+                   report=True, commit=True):
+    """Insert rows with executemany, committing after each batch unless commit is False.
+
+    mysql.connector rewrites an executemany INSERT into a single multi-row
+    VALUES statement, so each batch costs one round-trip. With commit=False
+    the rows stay part of the caller's transaction.
+    """
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    total = 0
+    try:
+        for batch_number, batch in enumerate(batches(rows, batch_size), 1):
+            with stage('insert'):
+                cursor.executemany(query, batch)
+            if commit:
+                with stage('commit'):
+                    conn.commit()
+            total += len(batch)
+            if report and batch_number % report_every == 0:
+                report_throughput(label, total, started)
+    finally:
+        cursor.close()
+    if report:
+        report_throughput(label, total, started)
+    return total
+
+def load_data_infile(conn, table, columns, rows, nullable_columns=(), label='Loaded', report=True):
+    """Stage rows in a temp file and ingest them with LOAD DATA LOCAL INFILE.
+
+    Every field is quoted and no escape character is used, so backslashes in
+    names are loaded verbatim. None is staged as an empty field, which is
+    turned back into NULL for the columns listed in nullable_columns.
+    The connection must be opened with allow_local_infile=True.
+    """
+    started = time.perf_counter()
+    total = 0
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator='\n')
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+                total += 1
+
+        targets = [f"@{column}" if column in nullable_columns else column for column in columns]
+        assignments = [f"{column} = NULLIF(@{column}, '')" for column in columns if column in nullable_columns]
+        set_clause = f"SET {', '.join(assignments)}" if assignments else ''
+
+        cursor = conn.cursor()
+        try:
+            with stage('insert'):
+                cursor.execute(
+                    f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY ',' ENCLOSED BY '"' ESCAPED BY ''
+                    LINES TERMINATED BY '\\n'
+                    ({', '.join(targets)})
+                    {set_clause}
+                    """,
+                    (path,)
+                )
+            with stage('commit'):
+                conn.commit()
+        finally:
+            cursor.close()
+    finally:
+        os.unlink(path)
+
+    if report:
+        report_throughput(label, total, started)
+    return total
+
+def insert_products(conn, rows, batch_size=DEFAULT_BATCH_SIZE, use_load_data=False, report=True):
+    """Bulk-insert product rows shaped like PRODUCT_COLUMNS; return the row count."""
+    if use_load_data:
+        return load_data_infile(conn, 'products', PRODUCT_COLUMNS, rows,
+                                nullable_columns=('category_id', 'min_price', 'max_price'),
+                                label='Products loaded', report=report)
+    return insert_batched(conn, INSERT_PRODUCTS_QUERY, rows, batch_size,
+                          label='Products inserted', report=report)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""Copy the catalog the importers load into MySQL over to the optimizers' Postgres.
+
+Rows are streamed from MySQL through an unbuffered cursor, written in
+batches as CSV into COPY FROM STDIN on a temporary staging table, and
+merged into the target table with one INSERT ... ON CONFLICT per batch.
+No rows are inserted one by one. A conflicting target row is only
+overwritten when the sync owns it (products: source = 'lazada'), so a
+product another source created under the same id is left alone.
+
+Each table syncs incrementally. Only rows whose watermark column
+(updated_at) is at or after the stored high-water mark are read, minus
+SYNC_OVERLAP seconds for transactions that committed late. The mark is
+kept in Postgres (sync_state) and committed in the same transaction as
+the rows, so a failed run is retried from the same point. Tables sync
+concurrently, each with its own pair of connections.
+
+Rows deleted from MySQL (import --delete-missing) never show up in an
+incremental read, so every run also streams the source's keys into a
+staging table and marks target rows whose key is gone as inactive
+(is_active = FALSE), the same tombstone the importers use for retired
+listings. They are not deleted: optimization history references them.
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from dotenv import load_dotenv
+
+from db import mysql_connection, postgres_connection
+from pipeline_metrics import count, metrics_json, pipeline_metrics, stage
+
+# Load environment variables (read by db when connections are opened)
+load_dotenv()
+
+DEFAULT_BATCH_SIZE = 50000
+SYNC_OVERLAP = int(os.environ.get('SYNC_OVERLAP_SECONDS', '60'))
+COPY_NULL = r'\N'
+
+# columns: (MySQL expression, Postgres column, Postgres type); update_columns are overwritten on conflict;
+# owner: SQL condition (columns qualified by the target name) on target rows this sync may overwrite or retire,
+# or None for all; retire: boolean column set FALSE on owned target rows whose key left the source, or None
+TableSpec = namedtuple('TableSpec', ['source', 'target', 'columns', 'key', 'watermark', 'update_columns',
+                                     'owner', 'retire'], defaults=(None, None))
+
+TABLES = {
+    'products': TableSpec(
+        source='products',
+        target='products',
+        columns=(
+            ('id', 'id', 'INTEGER'),
+            ('product_name', 'name', 'VARCHAR(255)'),
+            ('category', 'category', 'VARCHAR(255)'),
+            ('product_image_url', 'image_url', 'TEXT'),
+            ('min_price', 'price', 'DECIMAL(10, 2)'),
+            ('min_price', 'min_price', 'DECIMAL(10, 2)'),
+            ('max_price', 'max_price', 'DECIMAL(10, 2)'),
+            ("'lazada'", 'source', 'VARCHAR(50)'),
+            ('is_active', 'is_active', 'BOOLEAN'),
+            ('cluster_id', 'cluster_id', 'INTEGER'),
+            ('updated_at', 'updated_at', 'TIMESTAMP'),
+        ),
+        key='id',
+        watermark='updated_at',
+        # Optimizer-owned columns (cost, historical_*, ...) are never overwritten;
+        # a product without a parsed price keeps the one it had
+        update_columns={'name': None, 'category': None, 'image_url': None,
+                        'price': 'COALESCE(EXCLUDED.price, products.price)',
+                        'min_price': None, 'max_price': None, 'source': None, 'is_active': None,
+                        'cluster_id': None, 'updated_at': None},
+        # Only rows this sync brought in; another source's product with the same id is left alone
+        owner="products.source = 'lazada'",
+        retire='is_active',
+    ),
+    'category_analytics': TableSpec(
+        source='category_analytics',
+        target='category_analytics',
+        columns=(
+            ('category', 'category', 'VARCHAR(255)'),
+            ('product_count', 'product_count', 'INTEGER'),
+            ('avg_price', 'avg_price', 'DECIMAL(10, 2)'),
+            ('min_price', 'min_price', 'DECIMAL(10, 2)'),
+            ('max_price', 'max_price', 'DECIMAL(10, 2)'),
+            ('p50_price', 'p50_price', 'DECIMAL(10, 2)'),
+            ('p90_price', 'p90_price', 'DECIMAL(10, 2)'),
+            ('last_updated', 'last_updated', 'TIMESTAMP'),
+        ),
+        key='category',
+        watermark='last_updated',
+        update_columns={'product_count': None, 'avg_price': None, 'min_price': None, 'max_price': None,
+                        'p50_price': None, 'p90_price': None, 'last_updated': None},
+    ),
+}
+
+def ensure_target(cursor, spec):
+    """Create the target table if needed and add any missing synced columns."""
+    definitions = ', '.join(f"{column} {pg_type}" for _, column, pg_type in spec.columns)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {spec.target} ({definitions}, PRIMARY KEY ({spec.key}))")
+    for _, column, pg_type in spec.columns:
+        cursor.execute(f"ALTER TABLE {spec.target} ADD COLUMN IF NOT EXISTS {column} {pg_type}")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        table_name TEXT PRIMARY KEY,
+        high_water_mark TIMESTAMP,
+        rows_synced BIGINT NOT NULL DEFAULT 0,
+        synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def high_water_mark(cursor, spec):
+    cursor.execute("SELECT high_water_mark FROM sync_state WHERE table_name = %s", (spec.target,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_high_water_mark(cursor, spec, mark, rows):
+    cursor.execute(
+        """
+        INSERT INTO sync_state (table_name, high_water_mark, rows_synced, synced_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (table_name) DO UPDATE SET
+            high_water_mark = GREATEST(sync_state.high_water_mark, EXCLUDED.high_water_mark),
+            rows_synced = sync_state.rows_synced + EXCLUDED.rows_synced,
+            synced_at = EXCLUDED.synced_at
+        """,
+        (spec.target, mark, rows)
+    )
+
+def advance_sequence(cursor, spec):
+    """Move a serial key's sequence past the synced ids, so Postgres-side inserts do not collide."""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (spec.target, spec.key))
+    sequence = cursor.fetchone()[0]
+    if sequence is not None:
+        cursor.execute(f"SELECT setval(%s, (SELECT MAX({spec.key}) FROM {spec.target}))", (sequence,))
+
+def copy_buffer(rows):
+    """Serialize rows as COPY CSV text, with NULL as \\N."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows([COPY_NULL if value is None else value for value in row] for row in rows)
+    buffer.seek(0)
+    return buffer
+
+def retire_missing(source, pg_cursor, spec, batch_size=DEFAULT_BATCH_SIZE):
+    """Mark target rows whose key no longer exists in the source; returns how many were retired."""
+    column = spec.retire
+    source_key, _, key_type = next(entry for entry in spec.columns if entry[1] == spec.key)
+    staging = f"sync_{spec.target}_keys"
+    pg_cursor.execute(f"CREATE TEMPORARY TABLE {staging} ({spec.key} {key_type} PRIMARY KEY) ON COMMIT DROP")
+    copy_sql = f"COPY {staging} ({spec.key}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+
+    keys = 0
+    my_cursor = source.cursor(buffered=False)
+    try:
+        my_cursor.execute(f"SELECT {source_key} FROM {spec.source}")
+        while True:
+            with stage('sync_read'):
+                rows = my_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            with stage('sync_copy'):
+                pg_cursor.copy_expert(copy_sql, copy_buffer(rows))
+            keys += len(rows)
+    finally:
+        my_cursor.close()
+    if not keys:
+        # An empty source is far more likely the wrong database than a deleted catalog
+        return 0
+
+    with stage('sync_retire'):
+        pg_cursor.execute(f"""
+        UPDATE {spec.target} SET {column} = FALSE
+        WHERE {spec.owner or 'TRUE'} AND {spec.target}.{column} IS NOT FALSE
+          AND NOT EXISTS (SELECT 1 FROM {staging} k WHERE k.{spec.key} = {spec.target}.{spec.key})
+        """)
+        return pg_cursor.rowcount
+
+def merge_query(spec, staging):
+    columns = [column for _, column, _ in spec.columns]
+    updates = ', '.join(f"{column} = {expression or f'EXCLUDED.{column}'}"
+                        for column, expression in spec.update_columns.items())
+    query = (f"INSERT INTO {spec.target} ({', '.join(columns)}) "
+             f"SELECT {', '.join(columns)} FROM {staging} "
+             f"ON CONFLICT ({spec.key}) DO UPDATE SET {updates}")
+    # A conflicting row the sync does not own is skipped, not taken over
+    return f"{query} WHERE {spec.owner}" if spec.owner else query
+
+def sync_table(spec, full=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Sync one table; returns a summary dict."""
+    started = time.perf_counter()
+    source = mysql_connection()
+    target = postgres_connection()
+    rows_synced = retired = 0
+    try:
+        pg_cursor = target.cursor()
+        ensure_target(pg_cursor, spec)
+        mark = None if full else high_water_mark(pg_cursor, spec)
+
+        staging = f"sync_{spec.target}"
+        columns = [column for _, column, _ in spec.columns]
+        # Only the synced columns, so constraints on the target's other columns do not apply here
+        definitions = ', '.join(f"{column} {pg_type}" for _, column, pg_type in spec.columns)
+        pg_cursor.execute(f"CREATE TEMPORARY TABLE {staging} ({definitions}) ON COMMIT DROP")
+        copy_sql = f"COPY {staging} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        merge_sql = merge_query(spec, staging)
+
+        query = f"SELECT {', '.join(expression for expression, _, _ in spec.columns)} FROM {spec.source}"
+        params = ()
+        if mark is not None:
+            query += f" WHERE {spec.watermark} >= %s"
+            params = (mark - timedelta(seconds=SYNC_OVERLAP),)
+        watermark_index = [expression for expression, _, _ in spec.columns].index(spec.watermark)
+
+        # Unbuffered: rows come off the socket as they are fetched, never all at once
+        my_cursor = source.cursor(buffered=False)
+        new_mark = mark
+        try:
+            my_cursor.execute(query, params)
+            while True:
+                with stage('sync_read'):
+                    rows = my_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                batch_mark = max((row[watermark_index] for row in rows if row[watermark_index] is not None),
+                                 default=None)
+                if batch_mark is not None and (new_mark is None or batch_mark > new_mark):
+                    new_mark = batch_mark
+                with stage('sync_copy'):
+                    pg_cursor.copy_expert(copy_sql, copy_buffer(rows))
+                with stage('sync_merge'):
+                    pg_cursor.execute(merge_sql)
+                    count(f"rows_not_owned_{spec.target}", len(rows) - max(pg_cursor.rowcount, 0))
+                    pg_cursor.execute(f"TRUNCATE {staging}")
+                rows_synced += len(rows)
+        finally:
+            my_cursor.close()
+
+        retired = retire_missing(source, pg_cursor, spec, batch_size) if spec.retire else 0
+        if rows_synced:
+            advance_sequence(pg_cursor, spec)
+        save_high_water_mark(pg_cursor, spec, new_mark, rows_synced)
+        with stage('commit'):
+            target.commit()
+    except Exception:
+        target.rollback()
+        raise
+    finally:
+        source.close()
+        target.close()
+
+    count(f"rows_synced_{spec.target}", rows_synced)
+    count(f"rows_retired_{spec.target}", retired)
+    return {'table': spec.target, 'rows': rows_synced, 'retired': retired, 'full': full or mark is None,
+            'high_water_mark': str(new_mark) if new_mark is not None else None,
+            'seconds': round(time.perf_counter() - started, 2)}
+
+def sync_catalog(tables=None, full=False, jobs=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Sync several tables concurrently; returns {table: summary or error}."""
+    names = list(tables or TABLES)
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs or len(names)) as pool:
+        futures = {pool.submit(sync_table, TABLES[name], full, batch_size): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                print(f"Synced {name}: {results[name]['rows']} rows in {results[name]['seconds']}s")
+            except Exception as e:
+                results[name] = {'table': name, 'error': str(e)}
+                print(f"Failed to sync {name}: {e}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sync the MySQL catalog into the optimizers\' Postgres database')
+    parser.add_argument('--tables', type=lambda value: value.split(','), default=list(TABLES),
+                        help=f"Comma-separated tables to sync (default: {','.join(TABLES)})")
+    parser.add_argument('--full', action='store_true', help='Ignore the high-water marks and copy every row')
+    parser.add_argument('--jobs', type=int, help='Tables synced at once (default: all)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows per COPY batch')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Rebuild the optimizer feature snapshot when products changed')
+    parser.add_argument('--metrics-file', help='Prometheus textfile to write stage metrics to')
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.tables) - set(TABLES))
+    if unknown:
+        parser.error(f"Unknown tables: {', '.join(unknown)}")
+
+    results = {}
+    try:
+        results = sync_catalog(args.tables, full=args.full, jobs=args.jobs, batch_size=args.batch_size)
+        print(metrics_json(tables=results))
+        products = results.get('products', {})
+        if products.get('rows') or products.get('retired'):
+            # The optimizers read products from Postgres; their cached results and snapshot are now stale
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_engine'))
+            from result_cache import invalidate as invalidate_cached_results
+            invalidate_cached_results()
+            if args.snapshot:
+                import db
+                from feature_snapshot import build_snapshot
+                meta = build_snapshot(db.get_engine('postgres'))
+                print(f"Built feature snapshot {meta['version']} with {meta['rows']} products")
+    finally:
+        pipeline_metrics.write_prometheus('catalog_sync', args.metrics_file)
+    sys.exit(1 if any('error' in result for result in results.values()) else 0)
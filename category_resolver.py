@@ -0,0 +1,114 @@
+from pipeline_metrics import count, stage
+from schema_migrations import ensure_column
+
+CATEGORY_SEPARATOR = '>'
+
+def split_category_path(path):
+    """Split an "A > B > C" category path into stripped level names."""
+    return tuple(part.strip() for part in path.split(CATEGORY_SEPARATOR))
+
+def escape_like(text):
+    """Escape LIKE wildcards (and the backslash escape character) in a literal."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+class CategoryTrie:
+    """In-memory view of the categories table keyed by (parent_id, name)."""
+
+    def __init__(self):
+        self.nodes = {}
+
+    @classmethod
+    def load(cls, cursor):
+        """Load the whole categories table in one query."""
+        trie = cls()
+        with stage('category_resolve'):
+            cursor.execute("SELECT id, category_name, parent_category_id FROM categories ORDER BY id")
+            trie.add_rows(cursor.fetchall())
+        return trie
+
+    def add_rows(self, rows):
+        """Add (id, name, parent_id) rows; the lowest id wins for duplicate nodes."""
+        for category_id, name, parent_id in rows:
+            self.nodes.setdefault((parent_id, name), category_id)
+
+    def lookup(self, parts):
+        """Return the leaf id for a split path, or None if any level is missing."""
+        parent_id = None
+        for name in parts:
+            parent_id = self.nodes.get((parent_id, name))
+            if parent_id is None:
+                return None
+        return parent_id
+
+    def subtree(self, category_id):
+        """Ids of a category and every category below it."""
+        children = {}
+        for (parent_id, _), node_id in self.nodes.items():
+            children.setdefault(parent_id, []).append(node_id)
+        found, pending = set(), [category_id]
+        while pending:
+            node_id = pending.pop()
+            if node_id not in found:
+                found.add(node_id)
+                pending.extend(children.get(node_id, ()))
+        return found
+
+    def resolve(self, cursor, paths):
+        """Create missing categories level by level and map each path to its leaf id.
+
+        Each level costs one multi-row INSERT and one SELECT to read back the
+        new ids, regardless of how many categories it contains. Returns
+        (path_ids, added) where added lists the names of created categories.
+        """
+        with stage('category_resolve'):
+            path_ids, added = self._resolve(cursor, paths)
+        count('categories_added', len(added))
+        return path_ids, added
+
+    def _resolve(self, cursor, paths):
+        split_paths = {path: split_category_path(path) for path in paths}
+        depth = max((len(parts) for parts in split_paths.values()), default=0)
+        added = []
+
+        for level in range(1, depth + 1):
+            missing = []
+            seen = set()
+            for parts in split_paths.values():
+                if len(parts) < level:
+                    continue
+                parent_id = self.lookup(parts[:level - 1]) if level > 1 else None
+                key = (parent_id, parts[level - 1])
+                if key not in self.nodes and key not in seen:
+                    seen.add(key)
+                    missing.append((key[1], parent_id, level))
+
+            if not missing:
+                continue
+
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM categories")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                "INSERT INTO categories (category_name, parent_category_id, level) VALUES (%s, %s, %s)",
+                missing
+            )
+            cursor.execute(
+                "SELECT id, category_name, parent_category_id FROM categories WHERE id > %s ORDER BY id",
+                (last_id,)
+            )
+            self.add_rows(cursor.fetchall())
+            added.extend(name for name, _, _ in missing)
+
+        path_ids = {path: self.lookup(parts) for path, parts in split_paths.items()}
+        return path_ids, added
+
+def ensure_category_id_column(cursor, database):
+    """Add products.category_id to tables created before it existed."""
+    ensure_column(
+        cursor, database, 'products', 'category_id', 'INT NULL',
+        "ALTER TABLE products ADD CONSTRAINT fk_product_category "
+        "FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL"
+    )
+
+def resolve_categories(cursor, paths):
+    """Load the category trie and resolve paths in one go; returns (path_ids, added)."""
+    return CategoryTrie.load(cursor).resolve(cursor, paths)
@@ -0,0 +1,333 @@
+"""Per-category price aggregates computed while rows stream through an import.
+
+Each category keeps a count, min/max, a running mean and a quantile
+sketch for p50/p90. All of it is mergeable, so chunks, parallel writers
+and later delta imports can be combined without rescanning products.
+category_analytics stores the serialized state alongside the headline
+numbers, and the next import merges into it.
+
+Merging only ever adds rows. A category without stored state (rows
+written before the column existed), and any category whose listings an
+incremental run changed or retired, is rebuilt from its active products
+instead, so the state never drifts from the table.
+"""
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from schema_migrations import ensure_column
+
+SKETCH_ACCURACY = 0.01  # quantiles are within 1% of the true value
+QUANTILES = (0.5, 0.9)
+
+class QuantileSketch:
+    """Log-bucketed histogram with relative-error quantiles (DDSketch style).
+
+    A value x lands in bucket ceil(log_gamma(x)), so every value in a bucket
+    is within relative_accuracy of the bucket's representative value.
+    Merging two sketches is adding their bucket counts, and the number of
+    buckets grows with the log of the price range, not the row count.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def bucket_indexes(self, values):
+        """Bucket index of each positive value."""
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def add_counts(self, indexes, counts):
+        for index, value in zip(indexes, counts):
+            index = int(index)
+            self.bins[index] = self.bins.get(index, 0) + int(value)
+
+    def add(self, values):
+        """Add an array of non-negative values (NaN is ignored)."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            self.add_counts(*np.unique(self.bucket_indexes(positive), return_counts=True))
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different accuracy')
+        self.zero_count += other.zero_count
+        self.add_counts(other.bins.keys(), other.bins.values())
+        return self
+
+    def quantile(self, q):
+        """Estimated q-quantile, or None for an empty sketch."""
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_state(self):
+        indexes = sorted(self.bins)
+        return {'accuracy': self.relative_accuracy, 'zero': self.zero_count,
+                'bins': indexes, 'counts': [self.bins[index] for index in indexes]}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['accuracy'])
+        sketch.zero_count = state['zero']
+        sketch.add_counts(state['bins'], state['counts'])
+        return sketch
+
+class CategoryAggregate:
+    """Count, price min/max, running mean and price sketch for one category.
+
+    product_count counts every row; the price statistics only rows with a
+    parsed price, matching COUNT(*) and AVG/MIN/MAX over nullable columns.
+    """
+
+    def __init__(self):
+        self.product_count = 0
+        self.price_count = 0
+        self.mean_price = 0.0
+        self.min_price = math.inf
+        self.max_price = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add_summary(self, product_count, price_count, mean_price, min_price, max_price):
+        """Fold in the aggregate of a group of rows (e.g. one chunk)."""
+        self.product_count += product_count
+        if price_count:
+            total = self.price_count + price_count
+            # Weighted update keeps the mean exact without storing a sum that can grow unbounded
+            self.mean_price += (mean_price - self.mean_price) * price_count / total
+            self.price_count = total
+            self.min_price = min(self.min_price, min_price)
+            self.max_price = max(self.max_price, max_price)
+
+    def merge(self, other):
+        self.add_summary(other.product_count, other.price_count, other.mean_price,
+                         other.min_price, other.max_price)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def to_state(self):
+        return {
+            'product_count': self.product_count,
+            'price_count': self.price_count,
+            'mean_price': self.mean_price,
+            'min_price': self.min_price if self.price_count else None,
+            'max_price': self.max_price if self.price_count else None,
+            'sketch': self.sketch.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        aggregate = cls()
+        aggregate.product_count = state['product_count']
+        aggregate.price_count = state['price_count']
+        aggregate.mean_price = state['mean_price']
+        if state['price_count']:
+            aggregate.min_price = state['min_price']
+            aggregate.max_price = state['max_price']
+        aggregate.sketch = QuantileSketch.from_state(state['sketch'])
+        return aggregate
+
+class CategoryStats:
+    """Aggregates for every category seen so far."""
+
+    def __init__(self):
+        self.categories = {}
+
+    def update(self, categories, min_prices, max_prices):
+        """Fold in one chunk of rows: category names and parsed min/max price arrays.
+
+        The price of a row is the midpoint of its range, as in the old
+        AVG((min_price + max_price) / 2).
+        """
+        chunk = pd.DataFrame({
+            'category': np.asarray(categories, dtype=object),
+            'min_price': np.asarray(min_prices, dtype=np.float64),
+            'max_price': np.asarray(max_prices, dtype=np.float64),
+        })
+        chunk = chunk[chunk['category'].notna()]
+        if chunk.empty:
+            return
+        chunk['price'] = (chunk['min_price'] + chunk['max_price']) / 2
+
+        grouped = chunk.groupby('category', sort=False).agg(
+            product_count=('category', 'size'),
+            price_count=('price', 'count'),
+            mean_price=('price', 'mean'),
+            min_price=('min_price', 'min'),
+            max_price=('max_price', 'max'),
+        )
+        for category, row in zip(grouped.index, grouped.itertuples(index=False)):
+            self._aggregate(category).add_summary(
+                int(row.product_count), int(row.price_count),
+                float(row.mean_price), float(row.min_price), float(row.max_price)
+            )
+
+        # Sketch buckets for the whole chunk at once, then counted per (category, bucket)
+        priced = chunk[chunk['price'] > 0]
+        zeros = chunk[chunk['price'] == 0].groupby('category', sort=False).size()
+        for category, zero_count in zeros.items():
+            self._aggregate(category).sketch.zero_count += int(zero_count)
+        if not priced.empty:
+            sketch = QuantileSketch()
+            buckets = pd.DataFrame({'category': priced['category'].to_numpy(),
+                                    'bucket': sketch.bucket_indexes(priced['price'].to_numpy())})
+            counts = buckets.groupby(['category', 'bucket'], sort=False).size()
+            for (category, bucket), bucket_count in counts.items():
+                self._aggregate(category).sketch.add_counts([bucket], [bucket_count])
+
+    def _aggregate(self, category):
+        aggregate = self.categories.get(category)
+        if aggregate is None:
+            aggregate = self.categories[category] = CategoryAggregate()
+        return aggregate
+
+    def merge(self, other):
+        """Combine another CategoryStats (e.g. from a parallel writer) into this one."""
+        for category, aggregate in other.categories.items():
+            self._aggregate(category).merge(aggregate)
+        return self
+
+    def to_state(self):
+        return {category: aggregate.to_state() for category, aggregate in self.categories.items()}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.categories = {category: CategoryAggregate.from_state(aggregate)
+                            for category, aggregate in state.items()}
+        return stats
+
+def ensure_analytics_columns(cursor, database):
+    """Create category_analytics if needed and add the quantile and sketch-state columns."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS category_analytics (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        category VARCHAR(255) NOT NULL,
+        product_count INT NOT NULL,
+        avg_price DECIMAL(10,2) NOT NULL,
+        min_price DECIMAL(10,2) NOT NULL,
+        max_price DECIMAL(10,2) NOT NULL,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        UNIQUE KEY unique_category (category)
+    )
+    """)
+    ensure_column(cursor, database, 'category_analytics', 'p50_price', 'DECIMAL(10,2) NULL')
+    ensure_column(cursor, database, 'category_analytics', 'p90_price', 'DECIMAL(10,2) NULL')
+    ensure_column(cursor, database, 'category_analytics', 'stats_state', 'MEDIUMTEXT NULL')
+    ensure_column(cursor, database, 'products', 'is_active', 'BOOLEAN NOT NULL DEFAULT TRUE')
+
+def load_states(cursor, categories):
+    """Stored CategoryStats for the given categories (those without saved state are skipped)."""
+    stats = CategoryStats()
+    categories = list(categories)
+    for start in range(0, len(categories), 1000):
+        batch = categories[start:start + 1000]
+        cursor.execute(
+            f"SELECT category, stats_state FROM category_analytics "
+            f"WHERE stats_state IS NOT NULL AND category IN ({', '.join(['%s'] * len(batch))})",
+            batch
+        )
+        for category, state in cursor.fetchall():
+            stats.categories[category] = CategoryAggregate.from_state(json.loads(state))
+    return stats
+
+def stats_from_products(cursor, categories, fetch_size=50000):
+    """CategoryStats of the given categories computed from their active products.
+
+    Every category is present in the result, with an empty aggregate if it
+    has no active products left.
+    """
+    stats = CategoryStats()
+    categories = list(categories)
+    for category in categories:
+        stats._aggregate(category)
+    for start in range(0, len(categories), 1000):
+        batch = categories[start:start + 1000]
+        cursor.execute(
+            f"SELECT category, min_price, max_price FROM products "
+            f"WHERE is_active AND category IN ({', '.join(['%s'] * len(batch))})",
+            batch
+        )
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            stats.update([row[0] for row in rows],
+                         [np.nan if row[1] is None else float(row[1]) for row in rows],
+                         [np.nan if row[2] is None else float(row[2]) for row in rows])
+    return stats
+
+def save_category_stats(cursor, stats, merge=True, rebuild=()):
+    """Upsert category_analytics for every category in stats with one executemany.
+
+    With merge, stored state is folded in first, so a delta import adds to
+    the existing aggregates. Without it, stats replace them (full reloads).
+    Categories in rebuild, and with merge those without stored state, are
+    recomputed from products, which must already hold this run's rows.
+    Returns the number of categories written.
+    """
+    rebuild = set(rebuild)
+    if not stats.categories and not rebuild:
+        return 0
+    if merge:
+        stored = load_states(cursor, stats.categories)
+        rebuild.update(category for category in stats.categories if category not in stored.categories)
+        stats = stored.merge(stats)
+    aggregates = dict(stats.categories)
+    if rebuild:
+        aggregates.update(stats_from_products(cursor, rebuild).categories)
+
+    rows = []
+    for category, aggregate in aggregates.items():
+        priced = aggregate.price_count > 0
+        p50, p90 = (aggregate.sketch.quantile(q) for q in QUANTILES)
+        rows.append((
+            category,
+            aggregate.product_count,
+            round(float(aggregate.mean_price), 2) if priced else 0,
+            float(aggregate.min_price) if priced else 0,
+            float(aggregate.max_price) if priced else 0,
+            None if p50 is None else round(float(p50), 2),
+            None if p90 is None else round(float(p90), 2),
+            json.dumps(aggregate.to_state(), separators=(',', ':')),
+        ))
+
+    cursor.executemany(
+        """
+        INSERT INTO category_analytics
+        (category, product_count, avg_price, min_price, max_price, p50_price, p90_price, stats_state)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            product_count = VALUES(product_count),
+            avg_price = VALUES(avg_price),
+            min_price = VALUES(min_price),
+            max_price = VALUES(max_price),
+            p50_price = VALUES(p50_price),
+            p90_price = VALUES(p90_price),
+            stats_state = VALUES(stats_state),
+            last_updated = CURRENT_TIMESTAMP
+        """,
+        rows
+    )
+    return len(rows)
@@ -37,8 +37,9 @@ cron.schedule('0 0 * * *', async () => {
   console.log('Running data refresh job...');
   
   try {
-    // Run your import script
-    exec('python import_data_docker.py', (error, stdout, stderr) => {
+    // Run your import script, copy the changed catalog rows to the optimizers' Postgres,
+    // then refit the price elasticities from the latest price tests
+    exec('python import_data_docker.py --incremental && python catalog_sync.py --snapshot && python pricing_engine/elasticity.py', (error, stdout, stderr) => {
       if (error) {
         console.error(`Error: ${error.message}`);
         return;
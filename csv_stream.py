@@ -0,0 +1,68 @@
+import queue
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 50000
+
+_DONE = object()
+
+def prefetch(iterable, depth=1):
+    """Iterate over iterable on a background thread, keeping up to depth items ready.
+
+    Lets the next CSV chunk be read and parsed while the current one is being
+    written to the database. Exceptions raised by the producer are re-raised
+    in the consumer.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put(item)
+            items.put(_DONE)
+        except BaseException as e:
+            items.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while thread.is_alive():
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                thread.join(0.05)
+
+def read_csv_chunks(csv_file, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """Yield DataFrames of at most chunk_size rows, reading ahead one chunk."""
+    return prefetch(pd.read_csv(csv_file, chunksize=chunk_size, **kwargs))
+
+class ProgressReporter:
+    """Print cumulative rows and rows per second after each chunk."""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+
+    def update(self, rows):
+        self.rows += rows
+        self.chunks += 1
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed > 0 else float('inf')
+        print(f"{self.label}: chunk {self.chunks}, {self.rows} rows ({rate:,.0f} rows/s)")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""Shared, pooled database access for the Python entry points.
+
+One SQLAlchemy engine per database kind ('mysql' for the importers,
+'postgres' for the optimizers) is created per process and reused, with
+pool size and recycle time tunable from the environment. Every statement
+that goes through an engine or a connection handed out here is timed.
+
+Connection settings come from MYSQL_* / PG_* variables, falling back to
+the DB_* variables the scripts have always used. DB_PORT is the Postgres
+port in .env.example, so MySQL takes its port from MYSQL_PORT or 3306
+only.
+
+SQLAlchemy's mysqlconnector dialect hands out buffered cursors (execute
+reads the whole result set), so code that streams with fetchmany asks for
+cursor(buffered=False). The dialect also sets the FOUND_ROWS client flag,
+which makes cursor.rowcount count matched instead of changed rows; the
+MySQL engine turns it off again, so an UPDATE's rowcount is the number of
+rows it changed, as with a plain mysql.connector connection.
+
+SQLAlchemy is imported when the first engine is created, and logging
+when the first message is logged, so short-lived CLI processes that only
+need postgres_connection() start quickly.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+def _logger():
+    import logging
+    return logging.getLogger(__name__)
+
+DEFAULTS = {
+    'mysql': {'host': 'localhost', 'port': '3306', 'user': 'root', 'password': 'rootpassword'},
+    'postgres': {'host': 'localhost', 'port': '5432', 'user': 'postgres', 'password': ''},
+}
+ENV_PREFIXES = {'mysql': 'MYSQL', 'postgres': 'PG'}
+NO_GENERIC_FALLBACK = {('mysql', 'port')}
+DRIVERS = {'mysql': 'mysql+mysqlconnector', 'postgres': 'postgresql+psycopg2'}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def pool_settings():
+    """Pool tuning from the environment (read when an engine is created)."""
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),  # seconds
+    }
+
+class QueryStats:
+    """Per-statement call counts and cumulative time, shared by all engines."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def record(self, statement, seconds):
+        key = ' '.join(str(statement).split())[:120]
+        with self._lock:
+            self.calls[key] += 1
+            self.seconds[key] += seconds
+        if seconds * 1000 >= float(os.environ.get('DB_SLOW_QUERY_MS', '500')):
+            _logger().warning(f"Slow query ({seconds * 1000:.0f} ms): {key}")
+        else:
+            _logger().debug(f"Query took {seconds * 1000:.1f} ms: {key}")
+
+    def snapshot(self):
+        """Return {statement: {'calls': n, 'seconds': total}} for all recorded statements."""
+        with self._lock:
+            return {key: {'calls': self.calls[key], 'seconds': round(self.seconds[key], 6)}
+                    for key in self.calls}
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.seconds.clear()
+
+query_stats = QueryStats()
+
+def connection_settings(kind):
+    """Return host/port/user/password/database for a database kind."""
+    prefix = ENV_PREFIXES[kind]
+    settings = {}
+    for key, default in DEFAULTS[kind].items():
+        name = key.upper()
+        if (kind, key) not in NO_GENERIC_FALLBACK:
+            default = os.environ.get(f"DB_{name}", default)
+        settings[key] = os.environ.get(f"{prefix}_{name}", default)
+    settings['database'] = os.environ.get(f"{prefix}_NAME", os.environ.get('DB_NAME', 'lazada_products'))
+    return settings
+
+def connection_url(kind):
+    """Build the SQLAlchemy URL for a database kind."""
+    s = connection_settings(kind)
+    return f"{DRIVERS[kind]}://{s['user']}:{s['password']}@{s['host']}:{s['port']}/{s['database']}"
+
+def _install_timing(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        query_stats.record(statement, time.perf_counter() - started)
+
+def get_engine(kind='postgres', **connect_args):
+    """Return the process-wide pooled engine for a database kind.
+
+    Engines with different connect_args (e.g. allow_local_infile) are pooled
+    separately.
+    """
+    key = (kind, tuple(sorted(connect_args.items())))
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                from sqlalchemy import create_engine
+                if kind == 'mysql':
+                    # Without the FOUND_ROWS flag the dialect adds, rowcount counts changed rows
+                    from mysql.connector.constants import ClientFlag
+                    connect_args = dict({'client_flags': ClientFlag.get_default()}, **connect_args)
+                engine = create_engine(
+                    connection_url(kind),
+                    pool_pre_ping=True,
+                    connect_args=connect_args,
+                    **pool_settings()
+                )
+                _install_timing(engine)
+                _engines[key] = engine
+    return engine
+
+def _discard_inherited_pools():
+    """Drop pooled connections inherited through fork without closing the parent's sockets."""
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_inherited_pools)
+
+class TimedCursor:
+    """DBAPI cursor wrapper that records the time of execute/executemany."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(statement, params, *args, **kwargs)
+        finally:
+            query_stats.record(statement, time.perf_counter() - started)
+
+    def executemany(self, statement, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(statement, seq_params, *args, **kwargs)
+        finally:
+            query_stats.record(statement, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class PooledConnection:
+    """Raw DBAPI connection checked out of an engine pool.
+
+    Behaves like the driver connection (cursor, commit, rollback, ...);
+    close() returns it to the pool instead of tearing down the socket.
+    Cursors are timed. Pass prepared=True to cursor() for server-side
+    prepared statements on MySQL.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy.exc import DBAPIError
+        try:
+            self._conn = engine.raw_connection()
+        except DBAPIError as e:
+            # Callers handle the driver's own exceptions (mysql.connector.Error)
+            raise e.orig from e
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def is_connected(self):
+        return self._conn.is_valid
+
+    def close(self):
+        if self._conn.is_valid:
+            self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def mysql_connection(allow_local_infile=False):
+    """Check a mysql.connector connection out of the shared MySQL pool."""
+    connect_args = {'allow_local_infile': True} if allow_local_infile else {}
+    return PooledConnection(get_engine('mysql', **connect_args))
+
+def postgres_connection(**connect_args):
+    """Open a direct, unpooled psycopg2 connection with timed cursors.
+
+    For one-shot CLI processes that run a query or two: it skips importing
+    SQLAlchemy and setting up a pool. connect_args (connect_timeout,
+    options, ...) go to psycopg2.connect. Close it when done.
+    """
+    import psycopg2
+    s = connection_settings('postgres')
+    conn = psycopg2.connect(host=s['host'], port=s['port'], user=s['user'], password=s['password'],
+                            dbname=s['database'], **connect_args)
+    return _TimedConnection(conn)
+
+class _TimedConnection:
+    """Driver connection whose cursors are timed."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+@contextmanager
+def timed(label):
+    """Time an arbitrary block and record it alongside query timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        query_stats.record(label, time.perf_counter() - started)
+
+def query_df(sql, params=None, kind='postgres'):
+    """Run a parameterized SELECT (":name" placeholders) into a DataFrame."""
+    import pandas as pd
+    from sqlalchemy import text
+    return pd.read_sql(text(sql), get_engine(kind), params=params or {})
+
+def wait_for_db(kind='mysql', timeout=60.0, initial_delay=0.5, max_delay=8.0):
+    """Probe the database with exponential backoff until it answers or timeout passes."""
+    import random
+    from sqlalchemy import text
+    engine = get_engine(kind)
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            return True
+        except Exception as e:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _logger().error(f"Database not ready after {attempt} attempts: {e}")
+                return False
+            sleep = min(delay, max_delay, remaining) * random.uniform(0.5, 1.0)
+            print(f"Database not ready yet (attempt {attempt}); retrying in {sleep:.1f}s...")
+            time.sleep(sleep)
+            delay *= 2
@@ -1,34 +1,42 @@
 CREATE DATABASE IF NOT EXISTS lazada_products;
 USE lazada_products;
 
+-- Categories table to manage product categories
+CREATE TABLE IF NOT EXISTS categories (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    category_name VARCHAR(255) NOT NULL,
+    parent_category_id INT,
+    level INT DEFAULT 1,
+    FOREIGN KEY (parent_category_id) REFERENCES categories(id) ON DELETE SET NULL
+);
+
 -- Products table to store Lazada product data
 CREATE TABLE IF NOT EXISTS products (
     id INT AUTO_INCREMENT PRIMARY KEY,
     product_name VARCHAR(255) NOT NULL,
     product_image_url VARCHAR(512) NOT NULL,
     category VARCHAR(255) NOT NULL,
+    category_id INT,
     price_range VARCHAR(50) NOT NULL,
     min_price DECIMAL(10, 2),
     max_price DECIMAL(10, 2),
+    product_key CHAR(40),
+    content_hash CHAR(40),
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    cluster_id INT, -- smallest product id among its near-duplicate listings (set by the importers)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-);
-
--- Categories table to manage product categories
-CREATE TABLE IF NOT EXISTS categories (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    category_name VARCHAR(255) NOT NULL,
-    parent_category_id INT,
-    level INT DEFAULT 1,
-    FOREIGN KEY (parent_category_id) REFERENCES categories(id) ON DELETE SET NULL
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL,
+    UNIQUE KEY idx_product_key (product_key)
 );
 
 -- Index for faster category lookups
 CREATE INDEX idx_product_category ON products(category);
 CREATE INDEX idx_product_price_min ON products(min_price);
 CREATE INDEX idx_product_price_max ON products(max_price);
+CREATE INDEX idx_product_cluster ON products(cluster_id);
 
--- Category analytics table (populated via triggers or scheduled jobs)
+-- Category analytics table (maintained incrementally by the importers)
 CREATE TABLE IF NOT EXISTS category_analytics (
     id INT AUTO_INCREMENT PRIMARY KEY,
     category VARCHAR(255) NOT NULL,
@@ -36,6 +44,9 @@ CREATE TABLE IF NOT EXISTS category_analytics (
     avg_price DECIMAL(10,2) NOT NULL,
     min_price DECIMAL(10,2) NOT NULL,
     max_price DECIMAL(10,2) NOT NULL,
+    p50_price DECIMAL(10,2),
+    p90_price DECIMAL(10,2),
+    stats_state MEDIUMTEXT, -- mergeable aggregate state (JSON) maintained by the importers
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     UNIQUE KEY unique_category (category)
 );
@@ -48,6 +59,8 @@ CREATE TABLE IF NOT EXISTS data_refresh_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
     status VARCHAR(20) NOT NULL,
     message TEXT,
+    source_file VARCHAR(512),
+    file_checksum CHAR(64),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -6,7 +6,8 @@ ADD COLUMN cost DECIMAL(10, 2),
 ADD COLUMN historical_sales INTEGER,
 ADD COLUMN historical_price DECIMAL(10, 2),
 ADD COLUMN sales_velocity FLOAT,
-ADD COLUMN competitor_price DECIMAL(10, 2);
+ADD COLUMN competitor_price DECIMAL(10, 2),
+ADD COLUMN is_active BOOLEAN DEFAULT TRUE;
 
 -- Create price optimization history table
 CREATE TABLE price_optimization_history (
@@ -22,6 +23,13 @@ CREATE TABLE price_optimization_history (
     is_applied BOOLEAN DEFAULT FALSE
 );
 
+-- Batches of optimization history written by the pricing workers (pricing_engine/history_writer.py)
+CREATE TABLE history_flushes (
+    batch_id TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    flushed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create price test results table
 CREATE TABLE price_test_results (
     id SERIAL PRIMARY KEY,
@@ -1,16 +1,11 @@
 import csv
-import mysql.connector
 from mysql.connector import Error
+from db import mysql_connection
 
 def import_data():
     try:
-        # Connect to MySQL database
-        connection = mysql.connector.connect(
-            host='localhost',
-            database='lazada_products',
-            user='your_username',
-            password='your_password'
-        )
+        # Connect to MySQL database (settings come from DB_* environment variables)
+        connection = mysql_connection()
         
         if connection.is_connected():
             cursor = connection.cursor()
@@ -1,68 +1,53 @@
-import pandas as pd
-import re
-import mysql.connector
 import os
+import argparse
+import sys
 import time
+from bulk_loader import DEFAULT_BATCH_SIZE, insert_products, product_rows
+from category_resolver import CategoryTrie, ensure_category_id_column
+from category_stats import CategoryStats, ensure_analytics_columns, save_category_stats
+from csv_stream import DEFAULT_CHUNK_SIZE, ProgressReporter, read_csv_chunks
+from incremental_sync import (IncrementalSync, ensure_refresh_log, ensure_sync_columns, file_checksum,
+                              last_successful_checksum, record_refresh)
+from near_duplicates import assign_clusters
+from pipeline_metrics import count, metrics_json, pipeline_metrics, profiled, stage
+from search_index import update_search_index
 
-# Define database connection parameters
-db_config = {
-    'host': os.getenv('DB_HOST', 'db'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', 'rootpassword'),
-    'database': os.getenv('DB_NAME', 'lazada_products')
-}
+# The optimizers' result cache lives in the pricing engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_engine'))
+from result_cache import invalidate as invalidate_cached_results
 
-def wait_for_db():
-    """Wait for database to be ready."""
-    max_retries = 30
-    retries = 0
+from db import connection_settings, mysql_connection, wait_for_db
+
+def import_lazada_products(csv_file, batch_size=DEFAULT_BATCH_SIZE, use_load_data=False,
+                           chunk_size=DEFAULT_CHUNK_SIZE, incremental=False, delete_missing=False,
+                           metrics_file=None):
+    """Import Lazada products from CSV file to MySQL database.
     
-    while retries < max_retries:
-        try:
-            conn = mysql.connector.connect(**db_config)
-            conn.close()
-            return True
-        except:
-            print(f"Database not ready yet. Retry {retries+1}/{max_retries}...")
-            retries += 1
-            time.sleep(2)
+    The file is streamed in chunks of chunk_size rows, so memory stays flat
+    regardless of file size. Products are inserted in multi-row batches of
+    batch_size, or staged to a temp file and ingested with LOAD DATA LOCAL
+    INFILE when use_load_data is set.
     
-    return False
-
-def extract_price_values(price_range):
-    """Extract minimum and maximum price values from a price range string."""
-    try:
-        # Handle different formats: single price or range
-        if isinstance(price_range, str):
-            if '-' in price_range:
-                # Range format: "min-max"
-                min_price, max_price = price_range.split('-')
-                return float(min_price.strip().replace(',', '')), float(max_price.strip().replace(',', ''))
-            else:
-                # Single price format
-                price = float(price_range.strip().replace(',', ''))
-                return price, price
-        else:
-            # Handle non-string values
-            return None, None
-    except Exception as e:
-        print(f"Error parsing price range '{price_range}': {e}")
-        return None, None
-
-def import_lazada_products(csv_file):
-    """Import Lazada products from CSV file to MySQL database."""
+    With incremental set, an unchanged file (same checksum as the last
+    successful run) is skipped, only new or changed rows are upserted and
+    rows an earlier import of the same file name loaded that are missing
+    now are marked inactive, or deleted when delete_missing is set.
+    
+    Per-stage timings and counters are stored as JSON in data_refresh_logs
+    and written as a Prometheus textfile to metrics_file (default:
+    $PROMETHEUS_TEXTFILE_DIR/lazada_import.prom, if set).
+    """
+    source_file = os.path.basename(csv_file)
+    checksum = None
     try:
-        # Read the CSV file
-        print(f"Reading data from {csv_file}...")
-        df = pd.read_csv(csv_file)
-        
         # Connect to the database
         print("Connecting to database...")
-        if not wait_for_db():
+        if not wait_for_db('mysql', timeout=60):
             print("Failed to connect to database after multiple retries.")
             return
             
-        conn = mysql.connector.connect(**db_config)
+        conn = mysql_connection(allow_local_infile=use_load_data)
+        database = connection_settings('mysql')['database']
         cursor = conn.cursor()
         
         # Check if tables exist, if not create them
@@ -82,93 +67,136 @@ def import_lazada_products(csv_file):
             product_name VARCHAR(255) NOT NULL,
             product_image_url VARCHAR(512) NOT NULL,
             category VARCHAR(255) NOT NULL,
+            category_id INT,
             price_range VARCHAR(50) NOT NULL,
             min_price DECIMAL(10, 2),
             max_price DECIMAL(10, 2),
+            product_key CHAR(40),
+            content_hash CHAR(40),
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL,
+            UNIQUE KEY idx_product_key (product_key)
         )
         """)
         
-        # Process each product
-        products_added = 0
-        categories_added = set()
+        # Load the category hierarchy once; new nodes are added chunk by chunk
+        ensure_category_id_column(cursor, database)
+        ensure_refresh_log(cursor, database)
+        ensure_analytics_columns(cursor, database)
+        categories = CategoryTrie.load(cursor)
+        stats = CategoryStats()
         
-        # First, insert categories
-        unique_categories = df['Item Category'].dropna().unique()
+        sync = None
+        if incremental:
+            ensure_sync_columns(cursor, database)
+            checksum = file_checksum(csv_file)
+            if last_successful_checksum(cursor, source_file) == checksum:
+                print(f"{csv_file} is unchanged since the last successful import; skipping.")
+                return
+            sync = IncrementalSync(conn, source_file, batch_size=batch_size, stats=stats)
         
-        for category in unique_categories:
-            # Parse hierarchy: main category > subcategory > sub-subcategory
-            category_parts = category.split('>')
-            parent_id = None
-            
-            for i, cat_part in enumerate(category_parts):
-                cat_name = cat_part.strip()
-                
-                # Check if this category level already exists with this parent
-                if parent_id is None:
-                    cursor.execute(
-                        "SELECT id FROM categories WHERE category_name = %s AND parent_category_id IS NULL",
-                        (cat_name,)
-                    )
-                else:
-                    cursor.execute(
-                        "SELECT id FROM categories WHERE category_name = %s AND parent_category_id = %s",
-                        (cat_name, parent_id)
-                    )
-                
-                result = cursor.fetchone()
-                
-                if result:
-                    # Category exists, use its ID as parent for next level
-                    parent_id = result[0]
-                else:
-                    # Insert new category
-                    cursor.execute(
-                        "INSERT INTO categories (category_name, parent_category_id, level) VALUES (%s, %s, %s)",
-                        (cat_name, parent_id, i+1)
-                    )
-                    parent_id = cursor.lastrowid
-                    categories_added.add(cat_name)
+        products_added = 0
+        categories_added = []
+        progress = ProgressReporter('Products imported')
         
-        # Then insert products
-        for _, row in df.iterrows():
-            product_name = row['Product Name']
-            product_image = row['Product Image']
-            category = row['Item Category']
-            price_range = row['Price Range']
+        # Stream the CSV file, reading the next chunk while this one is written
+        print(f"Reading data from {csv_file}...")
+        for df in pipeline_metrics.timed_iter('csv_read', read_csv_chunks(csv_file, chunk_size)):
+            count('rows_read', len(df))
+            unique_categories = df['Item Category'].dropna().unique()
+            category_ids, added = categories.resolve(cursor, unique_categories)
+            categories_added.extend(added)
             
-            # Extract min and max prices
-            min_price, max_price = extract_price_values(price_range)
+            # Categories must be visible before products are committed batch by batch
+            with stage('commit'):
+                conn.commit()
             
-            # Insert product
-            cursor.execute(
-                """
-                INSERT INTO products 
-                (product_name, product_image_url, category, price_range, min_price, max_price) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (product_name, product_image, category, price_range, min_price, max_price)
-            )
-            products_added += 1
+            # Parse the whole price column at once; bad cells become NULL and are reported
+            rows = product_rows(df, category_ids, offset=progress.rows,
+                                stats=stats if sync is None else None)
+            if sync is not None:
+                added_rows = sync.upsert(rows)
+            else:
+                added_rows = insert_products(conn, rows, batch_size=batch_size,
+                                             use_load_data=use_load_data, report=False)
+            products_added += added_rows
+            count('rows_written', added_rows)
+            progress.update(added_rows)
         
-        # Commit the transaction
+        summary = {'products': products_added, 'categories_added': len(categories_added)}
+        if sync is not None:
+            sync.finish(delete_missing=delete_missing)
+            print(f"Incremental sync: {sync.summary()}")
+            summary.update(sync.counts())
+        
+        # Fold this run's per-category aggregates into category_analytics in one batch
+        with stage('analytics'):
+            summary['analytics_categories'] = save_category_stats(
+                cursor, stats, merge=True, rebuild=sync.changed_categories if sync is not None else ())
+        # Exact and near-duplicate listings share a cluster_id
+        summary['dedup'] = assign_clusters(conn, database)
+        with stage('commit'):
+            conn.commit()
+        # Only now are this run's products appended to the local search index: it must never
+        # hold rows (or a watermark past rows) that a failed import rolled back
+        summary['search_indexed'] = update_search_index(conn, database, check_deleted=delete_missing)
+        record_refresh(cursor, 'success', metrics_json(**summary), source_file, checksum)
         conn.commit()
         
+        # Cached optimization results may describe products that just changed
+        if sync is not None:
+            changed = sync.inserted + sync.updated + sync.retired
+        else:
+            changed = products_added
+        if changed:
+            invalidate_cached_results()
+        
         print(f"Import completed: {products_added} products and {len(categories_added)} categories added.")
         
     except Exception as e:
         print(f"Error during import: {e}")
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
+            try:
+                record_refresh(cursor, 'error', metrics_json(error=str(e)), source_file, checksum)
+                conn.commit()
+            except Exception as log_error:
+                print(f"Could not record the failed run: {log_error}")
     finally:
         if 'cursor' in locals() and cursor:
             cursor.close()
         if 'conn' in locals() and conn.is_connected():
             conn.close()
+        pipeline_metrics.write_prometheus('import', metrics_file)
 
 if __name__ == "__main__":
+    # Inside docker-compose the database host is the "db" service
+    os.environ.setdefault('DB_HOST', 'db')
+
+    parser = argparse.ArgumentParser(description='Import Lazada products into MySQL')
+    parser.add_argument('csv_file', nargs='?', default="/app/Lazada_Popular Items_Top Product - sellercenter.csv.csv",
+                        help='Seller-center CSV export to import')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Rows per multi-row INSERT and commit')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Ingest through LOAD DATA LOCAL INFILE instead of INSERT batches')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='CSV rows read and written per chunk')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Upsert only new or changed rows and skip unchanged files')
+    parser.add_argument('--delete-missing', action='store_true',
+                        help='With --incremental, delete rows missing from the file instead of deactivating them')
+    parser.add_argument('--metrics-file', help='Prometheus textfile to write stage metrics to')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Dump cProfile and tracemalloc reports for this run to DIR')
+    args = parser.parse_args()
+    
     # Wait for the database to be ready
     time.sleep(10)  # Give MySQL container time to initialize
-    import_lazada_products("/app/Lazada_Popular Items_Top Product - sellercenter.csv.csv")
-    print("Lazada product import process completed.") 
\ No newline at end of file
+    with profiled('import_lazada_products', args.profile):
+        import_lazada_products(args.csv_file, batch_size=args.batch_size, use_load_data=args.load_data,
+                               chunk_size=args.chunk_size, incremental=args.incremental,
+                               delete_missing=args.delete_missing, metrics_file=args.metrics_file)
+    print("Lazada product import process completed.")
@@ -0,0 +1,212 @@
+import argparse
+import glob
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from bulk_loader import DEFAULT_BATCH_SIZE, insert_products, product_rows
+from category_resolver import CategoryTrie, ensure_category_id_column
+from category_stats import CategoryStats, ensure_analytics_columns, save_category_stats
+from csv_stream import DEFAULT_CHUNK_SIZE
+from db import connection_settings, mysql_connection
+from incremental_sync import ensure_sync_columns, record_refresh
+from near_duplicates import assign_clusters
+from pipeline_metrics import metrics_json, pipeline_metrics
+from price_parser import parse_price_ranges, report_rejected
+from search_index import update_search_index
+
+# The optimizers' result cache lives in the pricing engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_engine'))
+from result_cache import invalidate as invalidate_cached_results
+
+# Load environment variables (read by db when the connection pool is created)
+load_dotenv()
+
+REQUIRED_COLUMNS = ['Product Image', 'Product Name', 'Item Category', 'Price Range']
+
+# Per-process state for writer workers
+_writer_conn = None
+_category_ids = None
+
+def find_csv_files(patterns):
+    """Expand directories and glob patterns into a sorted list of CSV files."""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.csv')
+        files.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(files)
+
+def scan_file(csv_file, spill_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Validate and parse one export, spilling the parsed chunks for a writer.
+
+    Runs in a parse worker. The file is read and its prices parsed only
+    here: each chunk, with min_price and max_price added, is pickled to
+    spill_path for write_file. Only the small summary (category paths, row
+    statistics and category aggregates) is sent back.
+    """
+    summary = {'file': csv_file, 'spill': spill_path, 'rows': 0, 'rejected_prices': 0, 'categories': set(),
+               'stats': None, 'error': None}
+    try:
+        header = pd.read_csv(csv_file, nrows=0).columns
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            summary['error'] = f"missing columns: {', '.join(missing)}"
+            return summary
+
+        stats = CategoryStats()
+        with open(spill_path, 'wb') as spill:
+            for df in pd.read_csv(csv_file, usecols=REQUIRED_COLUMNS, chunksize=chunk_size):
+                min_prices, max_prices, rejected = parse_price_ranges(df['Price Range'])
+                report_rejected(rejected, offset=summary['rows'])
+                stats.update(df['Item Category'], min_prices, max_prices)
+                pickle.dump(df.assign(min_price=min_prices, max_price=max_prices), spill,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                summary['rows'] += len(df)
+                summary['categories'].update(df['Item Category'].dropna().unique())
+                summary['rejected_prices'] += len(rejected)
+        summary['stats'] = stats.to_state()
+    except Exception as e:
+        summary['error'] = str(e)
+    return summary
+
+def init_writer(category_ids):
+    """Open one DB connection per writer process and install the shared category map."""
+    global _writer_conn, _category_ids
+    _writer_conn = mysql_connection()
+    _category_ids = category_ids
+
+def write_file(csv_file, spill_path, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert one export, as parsed by scan_file, into products on this writer's connection.
+
+    Returns the row count and this file's stage metrics, which the parent
+    merges across writers.
+    """
+    # Workers are reused across files (and a forked one starts with the parent's metrics)
+    pipeline_metrics.reset()
+    started = time.perf_counter()
+    written = 0
+    with open(spill_path, 'rb') as spill:
+        while True:
+            try:
+                df = pickle.load(spill)
+            except EOFError:
+                break
+            rows = product_rows(df, _category_ids, prices=(df['min_price'].to_numpy(), df['max_price'].to_numpy()))
+            written += insert_products(_writer_conn, rows, batch_size=batch_size, report=False)
+    return {'file': csv_file, 'rows': written, 'seconds': round(time.perf_counter() - started, 2),
+            'metrics': pipeline_metrics.snapshot()}
+
+def import_directory(patterns, workers=None, writers=2, batch_size=DEFAULT_BATCH_SIZE,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import every matching export: parse in parallel, resolve categories once, write in parallel.
+
+    Returns the run summary that is also stored in data_refresh_logs.
+    """
+    started = time.perf_counter()
+    csv_files = find_csv_files(patterns)
+    print(f"Found {len(csv_files)} files to import.")
+
+    # Each file is parsed once; writers insert the parsed chunks from its spill file
+    with tempfile.TemporaryDirectory(prefix='import_directory-') as spill_dir:
+        # Parse and validate all files in parallel
+        scans = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan_file, csv_file, os.path.join(spill_dir, f"{index}.pkl"), chunk_size)
+                       for index, csv_file in enumerate(csv_files)]
+            for future in as_completed(futures):
+                scan = future.result()
+                scans.append(scan)
+                status = scan['error'] or f"{scan['rows']} rows"
+                print(f"Scanned {scan['file']}: {status}")
+
+        valid = [scan for scan in scans if scan['error'] is None]
+        failed = {scan['file']: scan['error'] for scan in scans if scan['error'] is not None}
+
+        # Resolve the union of all category paths once, so shared nodes are created once
+        conn = mysql_connection()
+        cursor = conn.cursor()
+        database = connection_settings('mysql')['database']
+        try:
+            ensure_category_id_column(cursor, database)
+            ensure_sync_columns(cursor, database)
+            ensure_analytics_columns(cursor, database)
+            all_categories = set().union(*(scan['categories'] for scan in valid)) if valid else set()
+            category_ids, categories_added = CategoryTrie.load(cursor).resolve(cursor, all_categories)
+            conn.commit()
+            print(f"Resolved {len(category_ids)} category paths ({len(categories_added)} new nodes).")
+
+            # Write files through a bounded number of connections
+            written = []
+            stats = CategoryStats()
+            if valid:
+                with ProcessPoolExecutor(max_workers=writers, initializer=init_writer,
+                                         initargs=(category_ids,)) as pool:
+                    futures = {pool.submit(write_file, scan['file'], scan['spill'], batch_size): scan
+                               for scan in valid}
+                    for future in as_completed(futures):
+                        try:
+                            result = future.result()
+                            stats.merge(CategoryStats.from_state(futures[future]['stats']))
+                            pipeline_metrics.merge(result.pop('metrics'))
+                            written.append(result)
+                            print(f"Imported {result['file']}: {result['rows']} rows in {result['seconds']}s")
+                        except Exception as e:
+                            failed[futures[future]['file']] = str(e)
+                            print(f"Failed to import {futures[future]['file']}: {e}")
+
+            # Partial aggregates of every written file are merged and upserted once
+            save_category_stats(cursor, stats, merge=True)
+            dedup = assign_clusters(conn, database) if written else None
+            conn.commit()
+            # After the commit, so the index never holds rows that were rolled back
+            search_indexed = update_search_index(conn, database) if written else 0
+        
+            elapsed = time.perf_counter() - started
+            rows = sum(result['rows'] for result in written)
+            summary = {
+                'files': len(csv_files),
+                'imported_files': len(written),
+                'failed_files': failed,
+                'rows': rows,
+                'rejected_prices': sum(scan['rejected_prices'] for scan in valid),
+                'categories_added': len(categories_added),
+                'search_indexed': search_indexed,
+                'dedup': dedup,
+                'seconds': round(elapsed, 2),
+                'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+            }
+            status = 'success' if not failed else ('partial' if written else 'error')
+            record_refresh(cursor, status, metrics_json(**summary), source_file=','.join(patterns))
+            conn.commit()
+            if rows:
+                invalidate_cached_results()
+        finally:
+            cursor.close()
+            conn.close()
+            pipeline_metrics.write_prometheus('import_directory')
+
+        print(f"Import run {status}: {rows} rows from {len(written)}/{len(csv_files)} files in {elapsed:.2f}s")
+        return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import every seller-center export in a directory or glob')
+    parser.add_argument('paths', nargs='+', help='Directories or glob patterns of CSV exports')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Parse/validate processes (default: one per CPU)')
+    parser.add_argument('--writers', type=int, default=2,
+                        help='Concurrent DB writer connections')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Rows per multi-row INSERT and commit')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='CSV rows read per chunk')
+    args = parser.parse_args()
+
+    import_directory(args.paths, workers=args.workers, writers=args.writers,
+                     batch_size=args.batch_size, chunk_size=args.chunk_size)
@@ -0,0 +1,287 @@
+import hashlib
+
+import numpy as np
+
+from bulk_loader import DEFAULT_BATCH_SIZE, insert_batched
+from pipeline_metrics import stage
+from schema_migrations import ensure_column
+
+# Columns written by the importer, in the order rows are produced
+SYNC_COLUMNS = ('product_name', 'product_image_url', 'category', 'category_id',
+                'price_range', 'min_price', 'max_price')
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def product_key(product_image_url):
+    """Stable identity of a listing across exports (its image URL)."""
+    return hashlib.sha1(str(product_image_url).encode('utf-8')).hexdigest()
+
+def content_hash(product_name, product_image_url, category, price_range):
+    """Hash of the exported fields; changes whenever the listing changes."""
+    content = '\x1f'.join(str(value) for value in (product_name, product_image_url, category, price_range))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def ensure_sync_columns(cursor, database):
+    """Add the columns incremental sync relies on to existing tables."""
+    ensure_column(
+        cursor, database, 'products', 'product_key', 'CHAR(40) NULL',
+        "CREATE UNIQUE INDEX idx_product_key ON products(product_key)"
+    )
+    ensure_column(cursor, database, 'products', 'content_hash', 'CHAR(40) NULL')
+    ensure_column(cursor, database, 'products', 'is_active', 'BOOLEAN NOT NULL DEFAULT TRUE')
+    ensure_column(
+        cursor, database, 'products', 'source_file', 'VARCHAR(512) NULL',
+        "CREATE INDEX idx_product_source_file ON products(source_file)"
+    )
+    ensure_refresh_log(cursor, database)
+
+def backfill_sync_keys(conn):
+    """Key rows written without a product_key (by full imports, or before the column existed).
+
+    Without this, the first incremental run would insert every listing of
+    an existing table again and then retire (or delete) the original rows.
+    Keys and hashes are computed in SQL exactly as product_key() and
+    content_hash() do. Only the lowest id per image URL, and only where no
+    row holds that key yet, is keyed (the key is unique); the duplicates
+    stay unkeyed and unowned, so finish() leaves them to near-duplicate
+    clustering. Returns the number of rows keyed.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS sync_backfill")
+        cursor.execute("""
+        CREATE TEMPORARY TABLE sync_backfill (id INT PRIMARY KEY, product_key CHAR(40) NOT NULL, KEY (product_key))
+        SELECT MIN(id) AS id, SHA1(product_image_url) AS product_key
+        FROM products
+        WHERE product_key IS NULL AND product_image_url IS NOT NULL
+        GROUP BY product_image_url
+        """)
+        cursor.execute("""
+        DELETE b FROM sync_backfill b
+        JOIN products p ON p.product_key = b.product_key
+        """)
+        # str(None) is 'None' in content_hash()
+        cursor.execute("""
+        UPDATE products p
+        JOIN sync_backfill b ON b.id = p.id
+        SET p.product_key = b.product_key,
+            p.content_hash = SHA1(CONCAT_WS(CHAR(31), COALESCE(p.product_name, 'None'), p.product_image_url,
+                                            COALESCE(p.category, 'None'), COALESCE(p.price_range, 'None')))
+        """)
+        keyed = cursor.rowcount
+        cursor.execute("DROP TEMPORARY TABLE sync_backfill")
+        conn.commit()
+    finally:
+        cursor.close()
+    return keyed
+
+def ensure_refresh_log(cursor, database):
+    """Create data_refresh_logs, with the columns record_refresh writes, if needed."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS data_refresh_logs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        status VARCHAR(20) NOT NULL,
+        message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    ensure_column(cursor, database, 'data_refresh_logs', 'source_file', 'VARCHAR(512) NULL')
+    ensure_column(cursor, database, 'data_refresh_logs', 'file_checksum', 'CHAR(64) NULL')
+
+def last_successful_checksum(cursor, source_file):
+    """Return the checksum of the last successful import of source_file, if any."""
+    cursor.execute(
+        """
+        SELECT file_checksum FROM data_refresh_logs
+        WHERE status = 'success' AND source_file = %s AND file_checksum IS NOT NULL
+        ORDER BY id DESC LIMIT 1
+        """,
+        (source_file,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def record_refresh(cursor, status, message, source_file=None, checksum=None):
+    """Insert a row into data_refresh_logs."""
+    cursor.execute(
+        "INSERT INTO data_refresh_logs (status, message, source_file, file_checksum) VALUES (%s, %s, %s, %s)",
+        (status, message, source_file, checksum)
+    )
+
+class IncrementalSync:
+    """Upsert only new or changed products and retire the ones that disappeared.
+
+    Rows are staged chunk by chunk in a temporary table and merged into
+    products with one set-based INSERT ... ON DUPLICATE KEY UPDATE per chunk,
+    skipping rows whose content hash is unchanged. Keys seen during the run
+    are collected in a second temporary table so missing rows can be marked
+    inactive (or deleted) in one statement at the end.
+
+    A listing belongs to the export file (source_file, its base name) that
+    last contained it. Only that file's listings are retired when they go
+    missing, so products loaded from other exports, or by other scripts,
+    are never touched.
+    """
+
+    def __init__(self, conn, source_file, batch_size=DEFAULT_BATCH_SIZE, stats=None):
+        self.conn = conn
+        self.source_file = source_file
+        self.batch_size = batch_size
+        # Newly inserted rows are folded into this CategoryStats, if given; categories whose
+        # existing listings changed or were retired cannot be updated by adding, so they are
+        # collected for save_category_stats(rebuild=...)
+        self.stats = stats
+        self.changed_categories = set()
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.retired = 0
+        self.backfilled = backfill_sync_keys(conn)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS sync_chunk")
+            cursor.execute("""
+            CREATE TEMPORARY TABLE sync_chunk (
+                product_key CHAR(40) PRIMARY KEY,
+                content_hash CHAR(40) NOT NULL,
+                product_name VARCHAR(255) NOT NULL,
+                product_image_url VARCHAR(512) NOT NULL,
+                category VARCHAR(255) NOT NULL,
+                category_id INT,
+                price_range VARCHAR(50) NOT NULL,
+                min_price DECIMAL(10, 2),
+                max_price DECIMAL(10, 2)
+            )
+            """)
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS sync_seen")
+            cursor.execute("CREATE TEMPORARY TABLE sync_seen (product_key CHAR(40) PRIMARY KEY)")
+        finally:
+            cursor.close()
+
+    def upsert(self, rows):
+        """Merge one chunk of rows shaped like SYNC_COLUMNS into products."""
+        keyed_rows = (
+            (product_key(row[1]), content_hash(row[0], row[1], row[2], row[4])) + tuple(row)
+            for row in rows
+        )
+        columns = ', '.join(SYNC_COLUMNS)
+        placeholders = ', '.join(['%s'] * (len(SYNC_COLUMNS) + 2))
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("DELETE FROM sync_chunk")
+            # Duplicate listings within the file keep their first occurrence
+            insert_batched(
+                self.conn,
+                f"INSERT IGNORE INTO sync_chunk (product_key, content_hash, {columns}) VALUES ({placeholders})",
+                keyed_rows, self.batch_size, report=False
+            )
+            cursor.execute("INSERT IGNORE INTO sync_seen SELECT product_key FROM sync_chunk")
+
+            cursor.execute("SELECT COUNT(*) FROM sync_chunk")
+            staged = cursor.fetchone()[0]
+            cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(p.content_hash = s.content_hash AND p.is_active), 0)
+            FROM sync_chunk s
+            JOIN products p ON p.product_key = s.product_key
+            """)
+            existing, unchanged = (int(value) for value in cursor.fetchone())
+
+            if self.stats is not None and staged > existing:
+                # Only new listings are added; aggregates cannot subtract changed or retired rows
+                cursor.execute("""
+                SELECT s.category, s.min_price, s.max_price
+                FROM sync_chunk s
+                LEFT JOIN products p ON p.product_key = s.product_key
+                WHERE p.id IS NULL
+                """)
+                new_rows = cursor.fetchall()
+                with stage('analytics'):
+                    self.stats.update(
+                        [row[0] for row in new_rows],
+                        [np.nan if row[1] is None else float(row[1]) for row in new_rows],
+                        [np.nan if row[2] is None else float(row[2]) for row in new_rows],
+                    )
+            if self.stats is not None and existing > unchanged:
+                # A changed listing may have moved between categories: both sides are stale
+                cursor.execute("""
+                SELECT DISTINCT p.category, s.category
+                FROM sync_chunk s
+                JOIN products p ON p.product_key = s.product_key
+                WHERE p.content_hash <> s.content_hash OR NOT p.is_active
+                """)
+                for old_category, new_category in cursor.fetchall():
+                    self.changed_categories.update(category for category in (old_category, new_category)
+                                                   if category is not None)
+
+            updates = ', '.join(f"{column} = VALUES({column})" for column in SYNC_COLUMNS)
+            with stage('insert'):
+                cursor.execute(f"""
+                INSERT INTO products (product_key, content_hash, {columns}, is_active)
+                SELECT s.product_key, s.content_hash, {', '.join('s.' + column for column in SYNC_COLUMNS)}, TRUE
+                FROM sync_chunk s
+                LEFT JOIN products p ON p.product_key = s.product_key
+                WHERE p.id IS NULL OR p.content_hash <> s.content_hash OR NOT p.is_active
+                ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash), {updates}, is_active = TRUE
+                """)
+            with stage('commit'):
+                self.conn.commit()
+        finally:
+            cursor.close()
+
+        self.inserted += staged - existing
+        self.updated += existing - unchanged
+        self.unchanged += unchanged
+        return staged
+
+    def finish(self, delete_missing=False):
+        """Mark inactive (or delete) this file's products that were not in this run."""
+        cursor = self.conn.cursor()
+        try:
+            # Every listing in this run now belongs to this file, including ones another export had
+            cursor.execute("""
+            UPDATE products p
+            JOIN sync_seen s ON s.product_key = p.product_key
+            SET p.source_file = %s
+            WHERE NOT (p.source_file <=> %s)
+            """, (self.source_file, self.source_file))
+            missing = """
+            FROM products p
+            LEFT JOIN sync_seen s ON s.product_key = p.product_key
+            WHERE s.product_key IS NULL AND p.source_file = %s
+            """
+            if self.stats is not None:
+                cursor.execute(f"SELECT DISTINCT p.category {missing} AND p.is_active AND p.category IS NOT NULL",
+                               (self.source_file,))
+                self.changed_categories.update(row[0] for row in cursor.fetchall())
+            if delete_missing:
+                cursor.execute(f"DELETE p {missing}", (self.source_file,))
+            else:
+                cursor.execute("""
+                UPDATE products p
+                LEFT JOIN sync_seen s ON s.product_key = p.product_key
+                SET p.is_active = FALSE
+                WHERE s.product_key IS NULL AND p.source_file = %s AND p.is_active
+                """, (self.source_file,))
+            self.retired = cursor.rowcount
+            self.conn.commit()
+        finally:
+            cursor.close()
+        return self.retired
+
+    def counts(self):
+        """What this run changed, as a dict."""
+        return {'inserted': self.inserted, 'updated': self.updated,
+                'unchanged': self.unchanged, 'retired': self.retired, 'backfilled': self.backfilled}
+
+    def summary(self):
+        """Describe what this run changed."""
+        return (f"{self.inserted} inserted, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {self.retired} retired")
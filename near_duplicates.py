@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""Near-duplicate product detection with MinHash and LSH banding.
+
+Names are normalized and cut into character shingles. Each name gets a
+MinHash signature: for every hash function, the smallest hash of its
+shingles. Two names agree on a signature position with probability equal
+to the Jaccard similarity of their shingle sets. Signatures are split into
+bands, and names sharing any whole band become candidate pairs; with
+16 bands of 8 rows, pairs above ~0.7 similarity almost always collide and
+dissimilar pairs almost never do. Candidates whose estimated similarity
+is above SIMILARITY_THRESHOLD are joined into clusters. This takes time
+linear in the number of products instead of comparing every pair.
+
+Every active product gets a cluster_id: the smallest product id in its
+cluster, so exact and near-duplicate listings share one id and unique
+products point at themselves. Names without a single letter or digit
+(NULL, emoji or punctuation only) say nothing about the product and are
+never clustered.
+"""
+import argparse
+import re
+import unicodedata
+
+import numpy as np
+
+from bulk_loader import DEFAULT_BATCH_SIZE, insert_batched
+from pipeline_metrics import count, stage
+from schema_migrations import ensure_column
+
+SHINGLE_SIZE = 5  # characters
+NUM_PERMUTATIONS = 128
+BANDS = 16  # NUM_PERMUTATIONS / BANDS rows per band
+SIMILARITY_THRESHOLD = 0.7
+SIGNATURE_BATCH = 1000  # names hashed per vectorized batch; small batches stay in cache
+FETCH_SIZE = 50000
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+MASK32 = np.uint64(0xFFFFFFFF)
+
+def normalize_name(name):
+    """Lowercase, NFKC-normalize and collapse punctuation and emoji to single spaces.
+
+    Returns '' for a name with no word characters.
+    """
+    text = NON_WORD_RE.sub(' ', unicodedata.normalize('NFKC', str(name or '')).lower()).strip()
+    # Short names still produce one full shingle
+    return text.ljust(SHINGLE_SIZE) if text else ''
+
+def shingle_hashes(names, size=SHINGLE_SIZE):
+    """32-bit hashes of every character shingle, with the index of the name each belongs to.
+
+    All names are hashed together: their UTF-8 bytes are concatenated and
+    a polynomial hash is computed for every window that does not cross a
+    name boundary.
+    """
+    encoded = [normalize_name(name).encode('utf-8') for name in names]
+    lengths = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    ends = np.cumsum(lengths)
+
+    windows = len(buffer) - size + 1
+    hashes = np.zeros(max(windows, 0), dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * np.uint64(257) + buffer[offset:offset + windows]
+    # Keep windows that lie inside one name
+    positions = np.arange(len(hashes))
+    owner = np.searchsorted(ends, positions, side='right')
+    keep = positions + size <= ends[np.minimum(owner, len(ends) - 1)]
+    hashes, owner = hashes[keep], owner[keep]
+    # Finalize (murmur3 fmix) so nearby shingles spread over all 32 bits
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= np.uint64(0xFF51AFD7ED558CCD)
+    hashes ^= hashes >> np.uint64(33)
+    return hashes & MASK32, owner
+
+class MinHasher:
+    """A fixed family of NUM_PERMUTATIONS multiply-shift hash functions."""
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        # Odd multipliers make (a * x + b) mod 2^64 a bijection; its top 32 bits are the hash
+        self.a = rng.integers(1, 2 ** 63, size=num_permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_permutations, dtype=np.uint64)
+        self.num_permutations = num_permutations
+
+    def signatures(self, names, batch_size=SIGNATURE_BATCH, permutations_per_pass=16):
+        """(len(names), num_permutations) uint32 MinHash signatures."""
+        names = list(names)
+        result = np.empty((len(names), self.num_permutations), dtype=np.uint32)
+        for batch_start in range(0, len(names), batch_size):
+            batch = names[batch_start:batch_start + batch_size]
+            hashes, owner = shingle_hashes(batch)
+            # Shingles are grouped by name, so each name's minimum is a reduceat over its run
+            run_starts = np.searchsorted(owner, np.arange(len(batch)))
+            permuted = np.empty((permutations_per_pass, len(hashes)), dtype=np.uint64)
+            for first in range(0, self.num_permutations, permutations_per_pass):
+                a = self.a[first:first + permutations_per_pass, None]
+                b = self.b[first:first + permutations_per_pass, None]
+                out = permuted[:len(a)]
+                # In place: this is the hot loop
+                np.multiply(a, hashes[None, :], out=out)
+                out += b
+                out >>= np.uint64(32)
+                result[batch_start:batch_start + len(batch), first:first + len(a)] = \
+                    np.minimum.reduceat(out, run_starts, axis=1).T
+        return result
+
+def _connected_components(size, left, right):
+    """Label of each node: the smallest node index reachable through the edges."""
+    labels = np.arange(size)
+    while True:
+        previous = labels.copy()
+        smaller = np.minimum(labels[left], labels[right])
+        np.minimum.at(labels, left, smaller)
+        np.minimum.at(labels, right, smaller)
+        # Pointer jumping: follow labels to their roots
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+def lsh_clusters(signatures, bands=BANDS, threshold=SIMILARITY_THRESHOLD):
+    """Cluster rows of a signature matrix; returns the representative row index of each row."""
+    rows, width = signatures.shape
+    band_width = width // bands
+    left, right = [], []
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * band_width:(band + 1) * band_width])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * band_width))).ravel()
+        order = np.argsort(keys, kind='stable')
+        same = keys[order][1:] == keys[order][:-1]
+        # Each member of a bucket is paired with the bucket's first row and with its sorted
+        # neighbour, so one dissimilar member does not cut the rest of the bucket off
+        positions = np.arange(1, rows)
+        first = np.maximum.accumulate(np.where(same, 0, positions))
+        left.extend((order[first[same]], order[:-1][same]))
+        right.extend((order[positions[same]], order[1:][same]))
+    left = np.concatenate(left) if left else np.empty(0, dtype=np.int64)
+    right = np.concatenate(right) if right else np.empty(0, dtype=np.int64)
+    if len(left) == 0:
+        return np.arange(rows)
+
+    pairs = np.unique(np.stack((np.minimum(left, right), np.maximum(left, right)), axis=1), axis=0)
+    similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    pairs = pairs[similarity >= threshold]
+    return _connected_components(rows, pairs[:, 0], pairs[:, 1])
+
+def find_clusters(ids, names, hasher=None):
+    """cluster_id (smallest product id in the cluster) for each product."""
+    ids = np.asarray(ids, dtype=np.int64)
+    names = list(names)
+    # Names without word characters stay unclustered, pointing at their own id
+    wordy = np.fromiter((bool(normalize_name(name)) for name in names), dtype=bool, count=len(names))
+    result = ids.copy()
+    if not wordy.any():
+        return result
+    hasher = hasher or MinHasher()
+    with stage('minhash'):
+        signatures = hasher.signatures(name for name, keep in zip(names, wordy) if keep)
+    with stage('lsh'):
+        representatives = lsh_clusters(signatures)
+    # Representatives are the lowest row in each cluster; map rows to the lowest id instead
+    clustered = ids[wordy]
+    cluster_ids = np.full(len(clustered), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(cluster_ids, representatives, clustered)
+    result[wordy] = cluster_ids[representatives]
+    return result
+
+def ensure_cluster_column(cursor, database):
+    ensure_column(cursor, database, 'products', 'is_active', 'BOOLEAN NOT NULL DEFAULT TRUE')
+    ensure_column(
+        cursor, database, 'products', 'cluster_id', 'INT NULL',
+        "CREATE INDEX idx_product_cluster ON products(cluster_id)"
+    )
+
+def assign_clusters(conn, database, batch_size=DEFAULT_BATCH_SIZE, fetch_size=FETCH_SIZE):
+    """Recompute near-duplicate clusters of all active products and store changed cluster_ids.
+
+    Nothing is committed here: the caller commits together with the rest of
+    its import. Returns a summary dict with the number of products, clusters
+    and products that are duplicates of another listing.
+    """
+    cursor = conn.cursor()
+    try:
+        ensure_cluster_column(cursor, database)
+        ids, names = [], []
+        # Unbuffered, so only one fetch of rows is held by the driver at a time
+        read_cursor = conn.cursor(buffered=False)
+        try:
+            with stage('dedup_read'):
+                read_cursor.execute("SELECT id, product_name FROM products WHERE is_active ORDER BY id")
+                while True:
+                    rows = read_cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for product_id, product_name in rows:
+                        ids.append(product_id)
+                        names.append(product_name)
+        finally:
+            read_cursor.close()
+
+        cluster_ids = find_clusters(ids, names)
+
+        with stage('dedup_write'):
+            cursor.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS product_clusters (
+                id INT PRIMARY KEY,
+                cluster_id INT NOT NULL
+            )
+            """)
+            cursor.execute("DELETE FROM product_clusters")
+            insert_batched(conn, "INSERT INTO product_clusters (id, cluster_id) VALUES (%s, %s)",
+                           zip(ids, cluster_ids.tolist()), batch_size, report=False, commit=False)
+            cursor.execute("""
+            UPDATE products p
+            JOIN product_clusters c ON c.id = p.id
+            SET p.cluster_id = c.cluster_id
+            WHERE NOT (p.cluster_id <=> c.cluster_id)
+            """)
+            changed = cursor.rowcount
+            cursor.execute("DROP TEMPORARY TABLE product_clusters")
+    finally:
+        cursor.close()
+
+    clusters = len(np.unique(cluster_ids))
+    count('duplicates', len(ids) - clusters)
+    return {'products': len(ids), 'clusters': clusters, 'duplicates': len(ids) - clusters,
+            'cluster_ids_changed': changed}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Assign near-duplicate cluster ids to products')
+    parser.add_argument('--csv', help='Report clusters in a seller-center export instead of the database')
+    parser.add_argument('--show', type=int, default=10, help='With --csv, largest clusters to print')
+    args = parser.parse_args()
+
+    if args.csv:
+        import pandas as pd
+        df = pd.read_csv(args.csv)
+        cluster_ids = find_clusters(np.arange(len(df)), df['Product Name'])
+        sizes = pd.Series(cluster_ids).value_counts()
+        print(f"{len(df)} rows, {len(sizes)} clusters, {len(df) - len(sizes)} duplicates")
+        for cluster_id, size in sizes[sizes > 1].head(args.show).items():
+            print(f"\n{size} listings:")
+            for name in df['Product Name'][cluster_ids == cluster_id].head(5):
+                print(f"  {name}")
+    else:
+        from dotenv import load_dotenv
+        from db import connection_settings, mysql_connection
+        load_dotenv()
+        conn = mysql_connection()
+        try:
+            print(assign_clusters(conn, connection_settings('mysql')['database']))
+            conn.commit()
+        finally:
+            conn.close()
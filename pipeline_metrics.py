@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""Per-stage timers and counters for the import and optimizer pipelines.
+
+Code paths wrap their work in stage('name'), bump counters with
+count('name', n) and report current levels (queue depths, last latency)
+with gauge('name', value); all of it accumulates in the process-wide
+pipeline_metrics.
+At the end of a run the snapshot is stored as JSON in data_refresh_logs
+and/or written as a Prometheus textfile (for node_exporter's textfile
+collector).
+
+Setting PIPELINE_PROFILE_DIR (or passing a directory to profiled()) dumps
+a cProfile and a tracemalloc report for that run.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRIC_PREFIX = 'lazada_pipeline'
+
+class StageMetrics:
+    """Cumulative seconds and call counts per stage, plus named counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work under a stage name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, timing each wait for the next item as a stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def gauge(self, name, value):
+        """Set a value that can go down as well as up; the latest one is reported."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Return the metrics as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'stages': {name: {'seconds': round(self.seconds[name], 6), 'calls': self.calls[name]}
+                           for name in self.seconds},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot() taken in another process (e.g. a pool worker) to these metrics."""
+        with self._lock:
+            for name, stage in snapshot['stages'].items():
+                self.seconds[name] += stage['seconds']
+                self.calls[name] += stage['calls']
+            for name, value in snapshot['counters'].items():
+                self.counters[name] += value
+            self.gauges.update(snapshot['gauges'])
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def to_prometheus(self, pipeline):
+        """Render the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        label = f'pipeline="{pipeline}"'
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds_total Time spent in each pipeline stage.",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_stage_seconds_total{{{label},stage="{name}"}} {stage["seconds"]}'
+                  for name, stage in sorted(snapshot['stages'].items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_calls_total Times each pipeline stage ran.",
+            f"# TYPE {METRIC_PREFIX}_stage_calls_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_stage_calls_total{{{label},stage="{name}"}} {stage["calls"]}'
+                  for name, stage in sorted(snapshot['stages'].items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_items_total Items processed, by counter.",
+            f"# TYPE {METRIC_PREFIX}_items_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_items_total{{{label},counter="{name}"}} {value}'
+                  for name, value in sorted(snapshot['counters'].items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_gauge Current value of each gauge.",
+            f"# TYPE {METRIC_PREFIX}_gauge gauge",
+        ]
+        lines += [f'{METRIC_PREFIX}_gauge{{{label},gauge="{name}"}} {value}'
+                  for name, value in sorted(snapshot['gauges'].items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_run_seconds Wall time of the last run.",
+            f"# TYPE {METRIC_PREFIX}_run_seconds gauge",
+            f"{METRIC_PREFIX}_run_seconds{{{label}}} {snapshot['elapsed_seconds']}",
+            f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds When the last run finished.",
+            f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}_last_run_timestamp_seconds{{{label}}} {time.time():.0f}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, pipeline, path=None):
+        """Write the textfile atomically; returns the path, or None when no target is configured.
+
+        path defaults to $PROMETHEUS_TEXTFILE_DIR/lazada_<pipeline>.prom.
+        """
+        if path is None:
+            directory = os.environ.get('PROMETHEUS_TEXTFILE_DIR')
+            if not directory:
+                return None
+            path = os.path.join(directory, f"lazada_{pipeline}.prom")
+        # The collector may read at any time, so never expose a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus(pipeline))
+        os.replace(tmp_path, path)
+        return path
+
+pipeline_metrics = StageMetrics()
+stage = pipeline_metrics.stage
+count = pipeline_metrics.count
+gauge = pipeline_metrics.gauge
+
+def metrics_json(**summary):
+    """Combine a run summary with the current metrics for data_refresh_logs."""
+    return json.dumps(dict(summary, metrics=pipeline_metrics.snapshot()))
+
+@contextmanager
+def profiled(name, directory=None, top=25):
+    """Opt-in cProfile + tracemalloc for one run.
+
+    Does nothing unless directory (or PIPELINE_PROFILE_DIR) is set. Writes
+    <name>-<timestamp>.prof (load with pstats or snakeviz) and
+    <name>-<timestamp>.memory.txt with the top allocation sites.
+    """
+    directory = directory or os.environ.get('PIPELINE_PROFILE_DIR')
+    if not directory:
+        yield
+        return
+
+    # Imported only when profiling, to keep CLI start-up light
+    import cProfile
+    import tracemalloc
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        memory = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.memory.txt", 'w') as f:
+            f.write(f"current={current / 1024 / 1024:.1f} MiB peak={peak / 1024 / 1024:.1f} MiB\n")
+            for stat in memory.statistics('lineno')[:top]:
+                f.write(f"{stat}\n")
+        print(f"Profile written to {base}.prof and {base}.memory.txt")
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# "2.8", "3.7-23.7", "1,299 - 2,499", "RM 12.50" (thousands separators and a
+# leading currency marker are allowed)
+PRICE_RANGE_PATTERN = (
+    r'^\s*(?:[^\d\s.,-]+\s*)?(?P<min>\d+(?:\.\d+)?)'
+    r'(?:\s*-\s*(?:[^\d\s.,-]+\s*)?(?P<max>\d+(?:\.\d+)?))?\s*$'
+)
+
+REJECTED_DTYPE = np.dtype([('row', np.int64), ('value', object), ('reason', 'U16')])
+
+def parse_price_ranges(price_ranges):
+    """Parse a whole Price Range column into float64 min/max arrays in one pass.
+
+    Returns (min_price, max_price, rejected). Unparseable cells are NaN in
+    both arrays and listed in rejected, a structured array of
+    (row, value, reason) where reason is 'missing', 'malformed' or
+    'min_above_max' and row is the position within price_ranges.
+    """
+    values = pd.Series(price_ranges, copy=False).reset_index(drop=True)
+    text = values.astype(str).str.replace(',', '', regex=False)
+    missing = (values.isna() | (text.str.strip() == '')).to_numpy()
+
+    parts = text.str.extract(PRICE_RANGE_PATTERN)
+    min_price = np.array(pd.to_numeric(parts['min'], errors='coerce'), dtype=np.float64)
+    max_price = np.array(pd.to_numeric(parts['max'], errors='coerce'), dtype=np.float64)
+
+    # A single price is both the minimum and the maximum
+    max_price = np.where(np.isnan(max_price), min_price, max_price)
+
+    malformed = ~missing & np.isnan(min_price)
+    inverted = ~missing & ~malformed & (min_price > max_price)
+    invalid = missing | malformed | inverted
+    min_price[invalid] = np.nan
+    max_price[invalid] = np.nan
+
+    rows = np.flatnonzero(invalid)
+    rejected = np.empty(len(rows), dtype=REJECTED_DTYPE)
+    rejected['row'] = rows
+    rejected['value'] = values.to_numpy(dtype=object)[rows]
+    rejected['reason'] = np.select(
+        [missing[rows], malformed[rows]], ['missing', 'malformed'], default='min_above_max'
+    )
+    return min_price, max_price, rejected
+
+def to_sql_values(prices):
+    """Convert a float64 price array into a list with None for NaN."""
+    return [None if np.isnan(price) else float(price) for price in prices]
+
+def report_rejected(rejected, offset=0, limit=5):
+    """Print how many price ranges were rejected and a few examples.
+
+    offset is added to row positions, e.g. the index of a chunk's first row.
+    """
+    if len(rejected) == 0:
+        return
+    print(f"{len(rejected)} price ranges could not be parsed:")
+    for row, value, reason in rejected[:limit]:
+        print(f"  row {row + offset}: {value!r} ({reason})")
+
+def backfill_price_columns(conn, batch_size=10000):
+    """Fill NULL min_price/max_price in products from price_range, batch by batch.
+
+    Returns (updated, rejected_count). Rows that cannot be parsed stay NULL
+    and are reported.
+    """
+    cursor = conn.cursor()
+    updated = 0
+    rejected_count = 0
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                """
+                SELECT id, price_range FROM products
+                WHERE min_price IS NULL AND id > %s
+                ORDER BY id LIMIT %s
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            last_id = ids[-1]
+
+            min_prices, max_prices, rejected = parse_price_ranges([row[1] for row in rows])
+            report_rejected(rejected)
+            rejected_count += len(rejected)
+
+            valid = ~np.isnan(min_prices)
+            cursor.executemany(
+                "UPDATE products SET min_price = %s, max_price = %s WHERE id = %s",
+                [(float(min_price), float(max_price), product_id)
+                 for min_price, max_price, product_id, ok in zip(min_prices, max_prices, ids, valid) if ok]
+            )
+            conn.commit()
+            updated += int(valid.sum())
+    finally:
+        cursor.close()
+    return updated, rejected_count
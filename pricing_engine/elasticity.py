@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+"""Price elasticities fitted offline from A/B price tests.
+
+Each row of price_test_results is a control and a test arm of the same
+product over the same window, so the within-test slope
+log(test_sales / control_sales) / log(test_price / control_price) is an
+elasticity observation with the product's demand level differenced out.
+The fit regresses log-demand on log-price through those differences for
+every product and every category node at once: sufficient statistics
+(sum dx^2, sum dx*dy) are summed per product with bincount and rolled up
+the "A > B > C" hierarchy level by level.
+
+Estimates are shrunk toward their parent: a node's elasticity is
+(Sxy + k * parent) / (Sxx + k), where k = noise variance / between-product
+variance, so a category with few tests stays close to its parent and the
+root stays close to DEFAULT_ELASTICITY. Products are shrunk toward their
+category the same way. Baseline sales (used when a product has no sales
+history) are the geometric mean of historical_sales per category, shrunk
+toward the parent with BASE_SALES_PRIOR pseudo-products.
+
+price_optimization_history holds the optimizers' predicted sales, not
+observed ones, so fitting to it would only recover the elasticity that
+produced them; it is not used.
+
+The table is a directory with elasticities.json (per-category values) and
+a float32 file indexed by product id (NaN where a product has no tests).
+Readers map the product file and look values up in O(1) without NumPy,
+so the single-product CLI can use it too; refits are picked up like new
+models in the model registry.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+# Shared modules (category_resolver) live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from category_resolver import split_category_path
+from grid_search import DEFAULT_ELASTICITY
+
+DEFAULT_ELASTICITY_DIR = (os.environ.get('ELASTICITY_DIR')
+                          or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elasticities'))
+TABLE_FILE = 'elasticities.json'
+DEFAULT_BASE_SALES = 100  # prior for baseline sales when a category has no history
+BASE_SALES_PRIOR = 5  # pseudo-products of the parent's baseline mixed into each category
+MIN_PRIOR_VARIANCE = 0.05  # floor on the between-product variance of elasticities
+ELASTICITY_RANGE = (-6.0, -0.1)
+KEEP_PRODUCT_FILES = 2
+
+TESTS_QUERY = """
+SELECT product_id, control_price, test_price, control_sales, test_sales
+FROM price_test_results
+WHERE control_price > 0 AND test_price > 0 AND control_sales > 0 AND test_sales > 0
+  AND control_price <> test_price
+"""
+
+PRODUCTS_QUERY = "SELECT id, category, historical_sales FROM products WHERE is_active IS NOT FALSE ORDER BY id"
+
+def category_key(category):
+    """Normalized "A > B > C" path, the key categories are stored under."""
+    return ' > '.join(split_category_path(category)) if category else ''
+
+def _category_nodes(categories):
+    """Index every prefix of the given paths; returns (keys, parents, depths, leaf index per path).
+
+    Node 0 is the root (empty path) above all top-level categories.
+    """
+    index = {'': 0}
+    keys, parents, depths = [''], [-1], [0]
+    leaves = []
+    for category in categories:
+        parts = split_category_path(category) if category else ()
+        parent = 0
+        for depth in range(1, len(parts) + 1):
+            key = ' > '.join(parts[:depth])
+            node = index.get(key)
+            if node is None:
+                node = index[key] = len(keys)
+                keys.append(key)
+                parents.append(parent)
+                depths.append(depth)
+            parent = node
+        leaves.append(parent)
+    return keys, parents, depths, leaves
+
+def _roll_up(np, values, parents, depths):
+    """Subtree sums: add each node's totals into its parent, deepest level first."""
+    totals = values.copy()
+    for depth in range(int(depths.max()), 0, -1):
+        nodes = np.flatnonzero(depths == depth)
+        np.add.at(totals, parents[nodes], totals[nodes])
+    return totals
+
+def _shrink_down(np, numerator, denominator, strength, root_prior, parents, depths):
+    """(numerator + strength * parent) / (denominator + strength), from the root down."""
+    estimate = np.empty(len(numerator))
+    estimate[0] = (numerator[0] + strength * root_prior) / (denominator[0] + strength)
+    for depth in range(1, int(depths.max()) + 1):
+        nodes = np.flatnonzero(depths == depth)
+        estimate[nodes] = ((numerator[nodes] + strength * estimate[parents[nodes]])
+                           / (denominator[nodes] + strength))
+    return estimate
+
+def fit_elasticities(products, tests):
+    """Fit the table from product rows (id, category, historical_sales) and test rows.
+
+    Test rows are (product_id, control_price, test_price, control_sales,
+    test_sales). Returns (table dict, product ids, product elasticities)
+    where the arrays hold only products with tests.
+    """
+    import numpy as np
+    ids = np.array([row[0] for row in products], dtype=np.int64)
+    categories = [row[1] for row in products]
+    history = np.array([np.nan if row[2] is None else float(row[2]) for row in products])
+
+    distinct = list(dict.fromkeys(categories))
+    keys, parents, depths, leaves = _category_nodes(distinct)
+    parents, depths = np.array(parents), np.array(depths)
+    leaf_of = dict(zip(distinct, leaves))
+    product_leaf = np.array([leaf_of[category] for category in categories], dtype=np.int64)
+    nodes = len(keys)
+
+    # Baseline sales: geometric mean of historical_sales per subtree
+    has_history = history > 0
+    log_sales = np.log(np.where(has_history, history, 1.0))
+    sales_count = _roll_up(np, np.bincount(product_leaf[has_history], minlength=nodes).astype(float),
+                           parents, depths)
+    sales_sum = _roll_up(np, np.bincount(product_leaf[has_history], weights=log_sales[has_history],
+                                         minlength=nodes), parents, depths)
+    base_sales = np.exp(_shrink_down(np, sales_sum, sales_count, BASE_SALES_PRIOR,
+                                     math.log(DEFAULT_BASE_SALES), parents, depths))
+
+    # Elasticity observations: one within-test log-log slope per test
+    tests = np.array([[float(value) for value in row] for row in tests], dtype=float).reshape(-1, 5)
+    test_ids = tests[:, 0].astype(np.int64)
+    order = np.argsort(ids)
+    position = np.minimum(np.searchsorted(ids, test_ids, sorter=order), max(len(ids) - 1, 0))
+    # Tests of products that no longer exist are dropped
+    known = ids[order[position]] == test_ids if len(ids) else np.zeros(len(test_ids), dtype=bool)
+    rows = order[position[known]]
+    dx = np.log(tests[known, 2] / tests[known, 1])
+    dy = np.log(tests[known, 4] / tests[known, 3])
+
+    product_sxx = np.bincount(rows, weights=dx * dx, minlength=len(ids))
+    product_sxy = np.bincount(rows, weights=dx * dy, minlength=len(ids))
+    sxx = _roll_up(np, np.bincount(product_leaf, weights=product_sxx, minlength=nodes), parents, depths)
+    sxy = _roll_up(np, np.bincount(product_leaf, weights=product_sxy, minlength=nodes), parents, depths)
+
+    # Shrinkage strength k = noise variance / between-product variance of the true elasticities
+    tested = product_sxx > 0
+    fitted = int(tested.sum())
+    if fitted > 1 and len(dx) > fitted:
+        raw = np.zeros(len(ids))
+        raw[tested] = product_sxy[tested] / product_sxx[tested]
+        # Noise from the residuals around each product's own slope
+        noise = max(float(np.sum((dy - raw[rows] * dx) ** 2)) / (len(dx) - fitted), 1e-6)
+        # DerSimonian-Laird moment estimate of the variance of products around their category
+        weights = product_sxx[tested] / noise
+        leaf = product_leaf[tested]
+        pooled = sxy[leaf] / sxx[leaf]
+        q = float(np.sum(weights * (raw[tested] - pooled) ** 2))
+        # q is measured around each leaf's pooled estimate, so its expectation sums W - sum(w^2) / W per leaf
+        leaf_weight = np.bincount(leaf, weights=weights, minlength=nodes)
+        leaf_weight_sq = np.bincount(leaf, weights=weights ** 2, minlength=nodes)
+        grouped = leaf_weight > 0
+        scale = float(np.sum(leaf_weight[grouped] - leaf_weight_sq[grouped] / leaf_weight[grouped]))
+        spread = (q - (fitted - int(grouped.sum()))) / scale if scale > 0 else 0.0
+        strength = noise / max(float(spread), MIN_PRIOR_VARIANCE)
+    else:
+        noise, strength = None, 1.0
+    elasticity = np.clip(_shrink_down(np, sxy, sxx, strength, DEFAULT_ELASTICITY, parents, depths),
+                         *ELASTICITY_RANGE)
+    product_elasticity = np.clip((product_sxy[tested] + strength * elasticity[product_leaf[tested]])
+                                 / (product_sxx[tested] + strength), *ELASTICITY_RANGE)
+
+    table = {
+        'fitted_at': time.time(),
+        'tests': int(len(dx)),
+        'products_fitted': int(tested.sum()),
+        'noise_variance': noise,
+        'shrinkage_strength': strength,
+        'default': [round(float(elasticity[0]), 4), round(float(base_sales[0]), 2)],
+        'categories': {key: [round(float(elasticity[node]), 4), round(float(base_sales[node]), 2)]
+                       for node, key in enumerate(keys) if node},
+    }
+    return table, ids[tested], product_elasticity
+
+def write_table(table, product_ids, product_elasticity, directory=DEFAULT_ELASTICITY_DIR):
+    """Publish a fitted table; the JSON file is replaced last, so readers never see a half-written table."""
+    import numpy as np
+    version = time.strftime('%Y%m%dT%H%M%S', time.gmtime(table['fitted_at'])) + f"-{os.getpid()}"
+    os.makedirs(directory, exist_ok=True)
+
+    # Direct id -> value array, as in the feature snapshot's row index
+    size = int(product_ids.max()) + 1 if len(product_ids) else 0
+    values = np.full(size, np.nan, dtype='<f4')
+    values[product_ids] = product_elasticity
+    products_file = f"products-{version}.f32"
+    values.tofile(os.path.join(directory, products_file))
+
+    table = dict(table, version=version, products_file=products_file)
+    path = os.path.join(directory, TABLE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(table, f)
+    os.replace(tmp_path, path)
+
+    # Older product files: readers that still map one keep working after the unlink
+    old = sorted(name for name in os.listdir(directory) if name.startswith('products-') and name != products_file)
+    for name in old[:max(len(old) - (KEEP_PRODUCT_FILES - 1), 0)]:
+        os.remove(os.path.join(directory, name))
+    return table
+
+class ElasticityTable:
+    """One fitted table: per-category values and the mapped per-product file."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, TABLE_FILE)) as f:
+            self.meta = json.load(f)
+        self.version = self.meta['version']
+        self.categories = self.meta['categories']
+        self.default = tuple(self.meta['default'])
+        self._products = None
+        with open(os.path.join(directory, self.meta['products_file']), 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self._products = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def category_values(self, category):
+        """(elasticity, base_sales) of a category, or of its nearest fitted ancestor."""
+        values = self.categories.get(category_key(category))
+        if values is not None:
+            return tuple(values)
+        parts = split_category_path(category) if category else ()
+        for depth in range(len(parts) - 1, 0, -1):
+            values = self.categories.get(' > '.join(parts[:depth]))
+            if values is not None:
+                return tuple(values)
+        return self.default
+
+    def product_elasticity(self, product_id):
+        """The product's own fitted elasticity, or None if it has no tests."""
+        offset = int(product_id) * 4
+        if self._products is None or offset < 0 or offset + 4 > len(self._products):
+            return None
+        value = struct.unpack_from('<f', self._products, offset)[0]
+        return None if math.isnan(value) else value
+
+    def elasticity(self, product_id, category):
+        value = self.product_elasticity(product_id) if product_id is not None else None
+        return value if value is not None else self.category_values(category)[0]
+
+    def base_sales(self, category):
+        return self.category_values(category)[1]
+
+    def elasticities(self, product_ids, categories):
+        """Vectorized elasticity for arrays of product ids and categories."""
+        import numpy as np
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        result = np.full(len(product_ids), np.nan)
+        if self._products is not None:
+            values = np.frombuffer(self._products, dtype='<f4')
+            inside = (product_ids >= 0) & (product_ids < len(values))
+            result[inside] = values[product_ids[inside]]
+        missing = np.isnan(result)
+        if missing.any():
+            by_category = {}
+            result[missing] = [by_category.setdefault(category, self.category_values(category)[0])
+                               for category in np.asarray(categories, dtype=object)[missing]]
+        return result
+
+class ElasticityReader:
+    """Keep the current table loaded and reload it when a refit replaces it."""
+
+    def __init__(self, directory=DEFAULT_ELASTICITY_DIR, check_interval=2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._table = None
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current ElasticityTable, or None if none has been fitted."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._refresh()
+                    self._checked_at = now
+        return self._table
+
+    def _refresh(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, TABLE_FILE))
+        except FileNotFoundError:
+            self._table, self._signature = None, None
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            try:
+                self._table = ElasticityTable(self.directory)
+                self._signature = signature
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load elasticity table: {e}", file=sys.stderr)
+                self._table = None
+
+reader = ElasticityReader()
+
+def get_table():
+    """The process-wide ElasticityTable, or None before the first fit."""
+    return reader.get()
+
+def demand_baseline(product_id, category, historical_sales, historical_price, price):
+    """(base_sales, base_price, elasticity) of one product's demand curve, as floats.
+
+    Without sales history the curve is anchored at the current price with
+    the category's baseline sales.
+    """
+    table = reader.get()
+    elasticity = table.elasticity(product_id, category) if table is not None else DEFAULT_ELASTICITY
+    if historical_sales is None or math.isnan(historical_sales):
+        base_sales = table.base_sales(category) if table is not None else DEFAULT_BASE_SALES
+        return float(base_sales), price, elasticity
+    if historical_price is None or math.isnan(historical_price):
+        return historical_sales, price, elasticity
+    return historical_sales, historical_price, elasticity
+
+def demand_baselines(product_ids, categories, historical_sales, historical_price, price):
+    """demand_baseline for arrays of products; returns three float arrays."""
+    import numpy as np
+    historical_sales = np.asarray(historical_sales, dtype=float)
+    historical_price = np.asarray(historical_price, dtype=float)
+    price = np.asarray(price, dtype=float)
+    table = reader.get()
+    if table is not None:
+        elasticity = table.elasticities(product_ids, categories)
+    else:
+        elasticity = np.full(len(price), DEFAULT_ELASTICITY)
+    no_sales = np.isnan(historical_sales)
+    base_sales = historical_sales.copy()
+    if no_sales.any():
+        categories = np.asarray(categories, dtype=object)
+        by_category = {}
+        base_sales[no_sales] = [by_category.setdefault(category, table.base_sales(category)
+                                                       if table is not None else DEFAULT_BASE_SALES)
+                                for category in categories[no_sales]]
+    base_price = np.where(no_sales | np.isnan(historical_price), price, historical_price)
+    return base_sales, base_price, elasticity
+
+def table_version():
+    """Version of the loaded table (part of result cache keys), or None."""
+    table = reader.get()
+    return table.version if table is not None else None
+
+def fit_from_database(conn, directory=DEFAULT_ELASTICITY_DIR):
+    """Read tests and products over a psycopg2 connection, fit and publish; returns the table."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(TESTS_QUERY)
+        tests = cursor.fetchall()
+        cursor.execute(PRODUCTS_QUERY)
+        products = cursor.fetchall()
+    finally:
+        cursor.close()
+    table, product_ids, values = fit_elasticities(products, tests)
+    return write_table(table, product_ids, values, directory)
+
+if __name__ == "__main__":
+    import db
+
+    # Inside docker-compose the database host is the "db" service
+    os.environ.setdefault('DB_HOST', 'db')
+    os.environ.setdefault('DB_PASSWORD', 'postgres')
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Fit per-category and per-product price elasticities')
+    parser.add_argument('--output', default=DEFAULT_ELASTICITY_DIR, help='Table directory')
+    args = parser.parse_args()
+
+    conn = db.postgres_connection()
+    try:
+        table = fit_from_database(conn, args.output)
+    finally:
+        conn.close()
+    print(f"Elasticity table {table['version']}: {table['tests']} tests, {table['products_fitted']} products, "
+          f"{len(table['categories'])} categories, root elasticity {table['default'][0]}")
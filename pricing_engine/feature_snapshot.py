@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""Columnar, memory-mapped snapshot of the product features the optimizers read.
+
+A snapshot is a directory of .npy column files plus meta.json, built from
+Postgres in one scan. Readers map the columns read-only, so every worker
+process shares one copy through the page cache, and find a product's row
+in O(1) through a direct id -> row index.
+
+Snapshots are published atomically: each build goes to its own version
+directory and the CURRENT file is swapped to point at it. Readers pick up
+new versions like the model registry picks up new models, and treat a
+snapshot older than max_age as missing, so callers fall back to the
+database.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+DEFAULT_SNAPSHOT_DIR = (os.environ.get('FEATURE_SNAPSHOT_DIR')
+                        or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+DEFAULT_MAX_AGE = float(os.environ.get('FEATURE_SNAPSHOT_MAX_AGE', '3600'))  # seconds
+KEEP_VERSIONS = 2
+BUILD_CHUNK_SIZE = 100000
+
+# Numeric feature columns, stored as float64 with NaN for NULL; updated_at is epoch seconds
+NUMERIC_COLUMNS = ('price', 'cost', 'competitor_price', 'historical_sales', 'historical_price', 'sales_velocity',
+                   'updated_at')
+
+SNAPSHOT_QUERY = """
+SELECT id, category, price, cost, competitor_price, historical_sales, historical_price, sales_velocity,
+       EXTRACT(EPOCH FROM updated_at) AS updated_at
+FROM products
+WHERE is_active IS NOT FALSE
+ORDER BY id
+"""
+
+def _write_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+
+def build_snapshot(engine, directory=DEFAULT_SNAPSHOT_DIR, chunk_size=BUILD_CHUNK_SIZE):
+    """Scan products once and publish a new snapshot version; returns its metadata."""
+    started = time.time()
+    ids, codes, numeric = [], [], {column: [] for column in NUMERIC_COLUMNS}
+    category_codes = {}
+
+    with engine.connect() as conn:
+        # Server-side cursor, so only one chunk of rows is held as Python objects
+        result = conn.execution_options(stream_results=True).execute(text(SNAPSHOT_QUERY))
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            ids.append(np.array(columns[0], dtype=np.int64))
+            codes.append(np.array([category_codes.setdefault(category or 'unknown', len(category_codes))
+                                   for category in columns[1]], dtype=np.int32))
+            for column, values in zip(NUMERIC_COLUMNS, columns[2:]):
+                # DECIMAL values arrive as Decimal and NULL as None; both convert to float64/NaN
+                numeric[column].append(np.array([np.nan if value is None else float(value) for value in values],
+                                                dtype=np.float64))
+
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    version = time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)) + f"-{os.getpid()}"
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = os.path.join(directory, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    _write_array(os.path.join(tmp_dir, 'id.npy'), ids)
+    _write_array(os.path.join(tmp_dir, 'category_code.npy'),
+                 np.concatenate(codes) if codes else np.empty(0, dtype=np.int32))
+    for column in NUMERIC_COLUMNS:
+        values = np.concatenate(numeric[column]) if numeric[column] else np.empty(0, dtype=np.float64)
+        _write_array(os.path.join(tmp_dir, f"{column}.npy"), values)
+    _write_array(os.path.join(tmp_dir, 'row_index.npy'), build_row_index(ids))
+
+    meta = {
+        'version': version,
+        'built_at': started,
+        'rows': int(len(ids)),
+        'categories': list(category_codes),
+        'columns': list(NUMERIC_COLUMNS),
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    os.rename(tmp_dir, os.path.join(directory, version))
+    _publish(directory, version)
+    _prune(directory, version)
+    return meta
+
+def build_row_index(ids):
+    """Direct id -> row lookup table (-1 where no product has that id).
+
+    Ids are serial, so the table stays close to the number of products.
+    """
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int32)
+    if ids.min() < 0:
+        raise ValueError('Product ids must be non-negative')
+    index = np.full(int(ids.max()) + 1, -1, dtype=np.int32)
+    index[ids] = np.arange(len(ids), dtype=np.int32)
+    return index
+
+def _publish(directory, version):
+    current = os.path.join(directory, 'CURRENT')
+    tmp_path = f"{current}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, current)
+
+def _prune(directory, current_version):
+    """Remove all but the newest KEEP_VERSIONS snapshot versions.
+
+    Readers that still map an old version keep working: unlinked files stay
+    valid until they are unmapped.
+    """
+    versions = sorted(name for name in os.listdir(directory)
+                      if not name.startswith('.') and os.path.isdir(os.path.join(directory, name)))
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current_version:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def current_version(directory=DEFAULT_SNAPSHOT_DIR):
+    """Return the published snapshot version, or None if none has been built."""
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class FeatureSnapshot:
+    """One memory-mapped snapshot version."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.version = self.meta['version']
+        self.built_at = self.meta['built_at']
+        self.categories = self.meta['categories']
+        self.row_index = np.load(os.path.join(path, 'row_index.npy'), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, 'id.npy'), mmap_mode='r')
+        self.category_code = np.load(os.path.join(path, 'category_code.npy'), mmap_mode='r')
+        self.columns = {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode='r')
+                        for column in self.meta['columns']}
+
+    def age(self):
+        """Seconds since the snapshot was built."""
+        return time.time() - self.built_at
+
+    def row(self, product_id):
+        """Row number of a product, or None if it is not in the snapshot."""
+        product_id = int(product_id)
+        if product_id < 0 or product_id >= len(self.row_index):
+            return None
+        row = int(self.row_index[product_id])
+        return row if row >= 0 else None
+
+    def lookup(self, product_id):
+        """Return the product's features as a dict, or None on a miss."""
+        row = self.row(product_id)
+        if row is None:
+            return None
+        features = {'id': int(self.ids[row]), 'category': self.categories[self.category_code[row]]}
+        for column, values in self.columns.items():
+            value = float(values[row])
+            features[column] = None if np.isnan(value) else value
+        return features
+
+    def product_frame(self, product_id):
+        """Return a one-row DataFrame shaped like get_product_data's result, or None on a miss.
+
+        NULL features are NaN, as they are when read from the database.
+        """
+        row = self.row(product_id)
+        if row is None:
+            return None
+        data = {'id': [int(self.ids[row])], 'category': [self.categories[self.category_code[row]]]}
+        data.update({column: [float(values[row])] for column, values in self.columns.items()})
+        return pd.DataFrame(data)
+
+class SnapshotReader:
+    """Keep the current snapshot mapped and switch when a new version is published."""
+
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR, max_age=DEFAULT_MAX_AGE, check_interval=2.0):
+        self.directory = directory
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current FeatureSnapshot, or None if there is none or it is stale."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._refresh()
+                    self._checked_at = now
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age() > self.max_age:
+            return None
+        return snapshot
+
+    def _refresh(self):
+        version = current_version(self.directory)
+        if version is None:
+            self._snapshot = None
+        elif self._snapshot is None or self._snapshot.version != version:
+            try:
+                self._snapshot = FeatureSnapshot(os.path.join(self.directory, version))
+            except (OSError, ValueError) as e:
+                print(f"Could not open feature snapshot {version}: {e}", file=sys.stderr)
+                self._snapshot = None
+
+reader = SnapshotReader()
+
+def get_product_features(product_id):
+    """One-row feature DataFrame from the process-wide snapshot; None on a miss or stale snapshot."""
+    snapshot = reader.get()
+    return snapshot.product_frame(product_id) if snapshot is not None else None
+
+if __name__ == "__main__":
+    # Shared modules (db) live at the repository root
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import db
+
+    # Inside docker-compose the database host is the "db" service
+    os.environ.setdefault('DB_HOST', 'db')
+    os.environ.setdefault('DB_PASSWORD', 'postgres')
+
+    parser = argparse.ArgumentParser(description='Build the memory-mapped product feature snapshot')
+    parser.add_argument('--output', default=DEFAULT_SNAPSHOT_DIR, help='Snapshot directory')
+    args = parser.parse_args()
+
+    meta = build_snapshot(db.get_engine('postgres'), args.output)
+    print(f"Feature snapshot {meta['version']}: {meta['rows']} products, "
+          f"{len(meta['categories'])} categories")
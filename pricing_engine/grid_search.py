@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Vectorized grid-search price optimization.
+
+Evaluates the constant-elasticity demand curve and the profit function over a
+dense grid of candidate prices for many products at once, and picks the
+profit-maximising price per product within the given constraints.
+
+grid_search_price is the same search for one product in plain Python. NumPy
+is imported by the vectorized functions only, so a single-product CLI run
+does not pay for it.
+"""
+import math
+
+DEFAULT_ELASTICITY = -1.2
+DEFAULT_GRID_SIZE = 1000
+DEFAULT_MIN_MARGIN = 0.1        # price at least 10% above cost
+DEFAULT_MAX_PRICE_FACTOR = 2.0  # search up to 2x the current price when otherwise unbounded
+DEFAULT_CHUNK_SIZE = 2048       # products evaluated per block to bound memory
+
+def price_bounds(cost, current_price, competitor_price=None, min_margin=DEFAULT_MIN_MARGIN,
+                 max_price_change=None, competitor_ceiling=0.95,
+                 max_price_factor=DEFAULT_MAX_PRICE_FACTOR):
+    """Return per-product (lower, upper, feasible) arrays for the candidate price range."""
+    import numpy as np
+    cost = np.asarray(cost, dtype=float)
+    current_price = np.asarray(current_price, dtype=float)
+
+    lower = cost * (1 + min_margin)
+    upper = current_price * max_price_factor
+
+    if max_price_change is not None:
+        lower = np.maximum(lower, current_price * (1 - max_price_change))
+        upper = np.minimum(upper, current_price * (1 + max_price_change))
+
+    if competitor_price is not None:
+        competitor_price = np.broadcast_to(np.asarray(competitor_price, dtype=float), cost.shape)
+        # A non-positive competitor price means "unknown" and imposes no ceiling
+        ceiling = np.where(competitor_price > 0, competitor_price * competitor_ceiling, np.inf)
+        upper = np.minimum(upper, ceiling)
+
+    feasible = upper >= lower
+    # Infeasible products collapse to their lower bound (the margin floor wins)
+    upper = np.where(feasible, upper, lower)
+    return lower, upper, feasible
+
+def grid_search_prices(cost, current_price, base_sales, base_price, competitor_price=None,
+                       elasticity=DEFAULT_ELASTICITY, min_margin=DEFAULT_MIN_MARGIN,
+                       max_price_change=None, competitor_ceiling=0.95,
+                       max_price_factor=DEFAULT_MAX_PRICE_FACTOR,
+                       grid_size=DEFAULT_GRID_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Find the profit-maximising price for each product over a dense candidate grid.
+
+    All per-product arguments are broadcast to 1-D arrays of the same length.
+    Returns a dict of arrays: optimal_price, expected_sales, expected_revenue,
+    expected_profit and feasible.
+    """
+    import numpy as np
+    cost = np.atleast_1d(np.asarray(cost, dtype=float))
+    n = cost.shape[0]
+    current_price = np.broadcast_to(np.asarray(current_price, dtype=float), (n,))
+    base_sales = np.broadcast_to(np.asarray(base_sales, dtype=float), (n,))
+    base_price = np.broadcast_to(np.asarray(base_price, dtype=float), (n,))
+    elasticity = np.broadcast_to(np.asarray(elasticity, dtype=float), (n,))
+
+    lower, upper, feasible = price_bounds(
+        cost, current_price, competitor_price, min_margin,
+        max_price_change, competitor_ceiling, max_price_factor
+    )
+
+    # Without a usable base price, demand is flat at base_sales
+    safe_base_price = np.where(base_price > 0, base_price, 1.0)
+    elasticity = np.where(base_price > 0, elasticity, 0.0)
+
+    steps = np.linspace(0.0, 1.0, grid_size)
+    optimal_price = np.empty(n)
+
+    for start in range(0, n, chunk_size):
+        block = slice(start, min(start + chunk_size, n))
+        lo = lower[block, None]
+        prices = lo + (upper[block, None] - lo) * steps
+        # Profit per candidate: (p - cost) * base_sales * (p / base_price) ** elasticity
+        profit = np.power(prices / safe_base_price[block, None], elasticity[block, None])
+        profit *= base_sales[block, None]
+        profit *= prices - cost[block, None]
+        best = np.argmax(profit, axis=1)
+        optimal_price[block] = prices[np.arange(prices.shape[0]), best]
+
+    expected_sales = base_sales * np.power(optimal_price / safe_base_price, elasticity)
+    expected_revenue = optimal_price * expected_sales
+    expected_profit = (optimal_price - cost) * expected_sales
+
+    return {
+        'optimal_price': optimal_price,
+        'expected_sales': expected_sales,
+        'expected_revenue': expected_revenue,
+        'expected_profit': expected_profit,
+        'feasible': feasible
+    }
+
+def _nan_min(a, b):
+    """min() that propagates NaN like np.minimum."""
+    return math.nan if math.isnan(a) or math.isnan(b) else min(a, b)
+
+def _nan_max(a, b):
+    return math.nan if math.isnan(a) or math.isnan(b) else max(a, b)
+
+def grid_search_price(cost, current_price, base_sales, base_price, competitor_price=None,
+                      elasticity=DEFAULT_ELASTICITY, min_margin=DEFAULT_MIN_MARGIN,
+                      max_price_change=None, competitor_ceiling=0.95,
+                      max_price_factor=DEFAULT_MAX_PRICE_FACTOR, grid_size=DEFAULT_GRID_SIZE):
+    """grid_search_prices for one product, with floats in and out (NaN for missing values).
+
+    Returns a dict with the same keys as grid_search_prices, holding scalars.
+    """
+    cost, current_price = float(cost), float(current_price)
+    base_sales, base_price = float(base_sales), float(base_price)
+
+    lower = cost * (1 + min_margin)
+    upper = current_price * max_price_factor
+    if max_price_change is not None:
+        lower = _nan_max(lower, current_price * (1 - max_price_change))
+        upper = _nan_min(upper, current_price * (1 + max_price_change))
+    if competitor_price is not None and float(competitor_price) > 0:
+        upper = _nan_min(upper, float(competitor_price) * competitor_ceiling)
+    feasible = upper >= lower
+    if not feasible:
+        upper = lower
+
+    # Without a usable base price, demand is flat at base_sales
+    if not base_price > 0:
+        base_price, elasticity = 1.0, 0.0
+
+    def demand(price):
+        # Same results as np.power, which Python's ** does not give for zero or negative ratios
+        ratio = price / base_price
+        if ratio > 0 or elasticity == 0 or math.isnan(ratio):
+            return base_sales * ratio ** elasticity
+        if ratio == 0:
+            return base_sales * (math.inf if elasticity < 0 else 0.0)
+        return math.nan
+
+    best_price, best_profit = lower, -math.inf
+    last = max(grid_size - 1, 1)
+    for step in range(grid_size):
+        price = lower + (upper - lower) * (step / last)
+        profit = (price - cost) * demand(price)
+        # np.argmax returns the first maximum (or the first NaN)
+        if profit > best_profit or (math.isnan(profit) and not math.isnan(best_profit)):
+            best_price, best_profit = price, profit
+            if math.isnan(profit):
+                break
+
+    expected_sales = demand(best_price)
+    return {
+        'optimal_price': best_price,
+        'expected_sales': expected_sales,
+        'expected_revenue': best_price * expected_sales,
+        'expected_profit': (best_price - cost) * expected_sales,
+        'feasible': feasible
+    }
+
+def constraints_from_parameters(parameters):
+    """Map request parameters onto grid_search_prices keyword arguments."""
+    constraints = {}
+    for key in ('min_margin', 'max_price_change', 'competitor_ceiling',
+                'max_price_factor', 'elasticity', 'grid_size'):
+        if parameters.get(key) is not None:
+            constraints[key] = parameters[key]
+    if 'grid_size' in constraints:
+        constraints['grid_size'] = int(constraints['grid_size'])
+    return constraints
@@ -0,0 +1,430 @@
+"""Write-behind persistence of optimization results to price_optimization_history.
+
+record() only appends the row to an in-memory buffer and to a local
+append-only spill file, so a request never waits on the database. A
+background thread flushes the buffer with one COPY when it holds
+HISTORY_FLUSH_ROWS rows or its oldest row is HISTORY_FLUSH_MS old.
+
+Each flush is a batch with its own id: the spill file is renamed to
+batch-<id>.jsonl before the COPY, and the batch id is inserted into
+history_flushes in the same transaction as the rows. The batch file is
+deleted after the commit. Every file is locked (flock) by the process
+writing it, so a starting process replays only the spill and batch files
+of processes that are gone. It skips batches whose id already committed,
+so a crash between the commit and the delete does not duplicate rows.
+Failed flushes stay queued and are retried on the next one, except a
+batch the database rejects for its data (DataError, IntegrityError, e.g.
+a product that no longer exists): retrying would fail forever and hold
+back every later batch, so it is renamed to failed-<id>.jsonl and
+counted instead.
+
+Short-lived processes (the pricing CLI) start the writer with
+flush=False, so nothing runs in the background, and call flush_and_close()
+before they exit: one COPY, with the connection and statement bounded by
+HISTORY_EXIT_FLUSH_TIMEOUT seconds. Rows it cannot write stay in the
+spill file. Any flushing process (the pricing worker, when idle) picks
+up unlocked spill files, and so does running this module.
+
+Metrics (pipeline_metrics): the history_flush stage times each flush;
+counters history_rows_flushed, history_flush_errors,
+history_batches_failed and history_rows_recovered; gauges history_backlog_rows,
+history_oldest_pending_seconds and history_flush_seconds_last.
+"""
+import csv
+import fcntl
+import glob
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Shared modules (db) live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db
+from pipeline_metrics import count, gauge, stage
+
+DEFAULT_SPILL_DIR = (os.environ.get('HISTORY_SPILL_DIR')
+                     or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history_spill'))
+DEFAULT_FLUSH_ROWS = int(os.environ.get('HISTORY_FLUSH_ROWS', '500'))
+DEFAULT_FLUSH_MS = float(os.environ.get('HISTORY_FLUSH_MS', '1000'))
+EXIT_FLUSH_TIMEOUT = float(os.environ.get('HISTORY_EXIT_FLUSH_TIMEOUT', '5'))  # seconds
+COPY_NULL = r'\N'
+
+HISTORY_COLUMNS = ('product_id', 'optimization_date', 'current_price', 'optimal_price', 'expected_sales',
+                   'expected_revenue', 'expected_profit', 'parameters')
+
+COPY_SQL = (f"COPY price_optimization_history ({', '.join(HISTORY_COLUMNS)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')")
+
+def history_row(product_id, result, parameters):
+    """The history row of one optimization result, timestamped now."""
+    return {
+        'product_id': int(product_id),
+        # The time of the optimization, not of the flush
+        'optimization_date': datetime.now(timezone.utc).isoformat(),
+        'current_price': result.get('current_price'),
+        'optimal_price': result.get('optimal_price'),
+        'expected_sales': result.get('expected_sales'),
+        'expected_revenue': result.get('expected_revenue'),
+        'expected_profit': result.get('expected_profit'),
+        'parameters': json.dumps(parameters or {}, sort_keys=True),
+    }
+
+def copy_value(value):
+    """A value as COPY writes it; NULL, NaN and +-inf (which DECIMAL cannot hold) become \\N."""
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        return COPY_NULL
+    return value
+
+def copy_buffer(rows):
+    """Serialize history rows as COPY CSV text."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow([copy_value(row.get(column)) for column in HISTORY_COLUMNS])
+    buffer.seek(0)
+    return buffer
+
+def is_permanent_error(error):
+    """Whether a batch failed for its data, so writing it again would fail again."""
+    try:
+        import psycopg2
+    except ImportError:
+        return False
+    return isinstance(error, (psycopg2.DataError, psycopg2.IntegrityError))
+
+class SpillFile:
+    """An append-only JSON-lines file, exclusively locked for as long as it is open.
+
+    The lock tells a starting process which files belong to a live writer
+    and which were left behind by one that died.
+    """
+
+    def __init__(self, path, handle):
+        self.path = path
+        self.handle = handle
+
+    @classmethod
+    def create(cls, directory):
+        """A new, empty pending-<id>.jsonl file.
+
+        It is created and locked under a name recovery does not look at, and
+        renamed once locked, so no other process can claim it in between.
+        """
+        name = uuid.uuid4().hex
+        spill = cls.claim(os.path.join(directory, f".pending-{name}.tmp"), create=True)
+        if spill is None:
+            raise OSError(f"Could not lock a new spill file in {directory}")
+        spill.rename(f"pending-{name}.jsonl")
+        return spill
+
+    @classmethod
+    def claim(cls, path, create=False):
+        """Open and lock a file; None if a live process holds it or it is gone."""
+        flags = os.O_RDWR | os.O_APPEND | (os.O_CREAT | os.O_EXCL if create else 0)
+        try:
+            handle = os.fdopen(os.open(path, flags, 0o644), 'a+', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        if not os.path.exists(path):
+            # Deleted or renamed by its owner between our open and lock
+            handle.close()
+            return None
+        return cls(path, handle)
+
+    def append(self, row):
+        self.handle.write(json.dumps(row) + '\n')
+        # In the OS page cache, so the row survives the process (not a power loss)
+        self.handle.flush()
+
+    def rows(self):
+        """Rows in the file; a line cut short by a crash is skipped."""
+        self.handle.seek(0)
+        rows = []
+        for line in self.handle:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+        return rows
+
+    def rename(self, name):
+        """Move the file within its directory; the lock stays with it."""
+        path = os.path.join(os.path.dirname(self.path), name)
+        os.rename(self.path, path)
+        self.path = path
+
+    def rename_to_batch(self):
+        """Turn this file into batch-<id>.jsonl; returns the batch id."""
+        batch_id = uuid.uuid4().hex
+        self.rename(f"batch-{batch_id}.jsonl")
+        return batch_id
+
+    def close(self):
+        """Release the file (and its lock) without deleting it."""
+        self.handle.close()
+
+    def delete(self):
+        os.remove(self.path)
+        self.handle.close()
+
+class HistoryWriter:
+    """Buffer optimization history rows and flush them to Postgres in batches."""
+
+    def __init__(self, spill_dir=DEFAULT_SPILL_DIR, flush_rows=DEFAULT_FLUSH_ROWS, flush_ms=DEFAULT_FLUSH_MS,
+                 connect=db.postgres_connection):
+        self.spill_dir = spill_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_ms / 1000
+        self.connect = connect
+        self._conn = None
+        self._buffer = []
+        self._oldest = None  # monotonic time of the oldest buffered row
+        self._batches = []  # (batch_id, rows, SpillFile) cut from the buffer, not yet committed
+        self._spill = None
+        self._lock = threading.Lock()  # buffer, batches and spill file
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+
+    def start(self, flush=True):
+        """Open a spill file and, unless flush is False, start the flush thread.
+
+        The flush thread first queues the rows of processes that are gone.
+        Without it, rows stay in the spill file for a flushing process.
+        """
+        with self._lock:
+            if self._spill is not None:
+                return
+            os.makedirs(self.spill_dir, exist_ok=True)
+            if flush:
+                self._recover()
+            self._spill = SpillFile.create(self.spill_dir)
+            self._closed = False
+            if flush:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def _recover(self):
+        recovered = 0
+        paths = (glob.glob(os.path.join(self.spill_dir, 'pending-*.jsonl'))
+                 + glob.glob(os.path.join(self.spill_dir, 'batch-*.jsonl')))
+        for path in sorted(paths):
+            spill = SpillFile.claim(path)
+            if spill is None:
+                continue
+            rows = spill.rows()
+            if not rows:
+                spill.delete()
+                continue
+            name = os.path.basename(path)
+            # A batch keeps its id, so one that already committed is not written twice
+            batch_id = name[len('batch-'):-len('.jsonl')] if name.startswith('batch-') else spill.rename_to_batch()
+            self._batches.append((batch_id, rows, spill))
+            recovered += len(rows)
+        if recovered:
+            count('history_rows_recovered', recovered)
+            print(f"Recovered {recovered} unflushed optimization history rows", file=sys.stderr)
+
+    def record(self, product_id, result, parameters):
+        """Queue one optimization result; returns immediately."""
+        if self._spill is None:
+            self.start()
+        row = history_row(product_id, result, parameters)
+        with self._lock:
+            spill = self._spill
+            assert spill is not None, 'record() after close()'
+            spill.append(row)
+            self._buffer.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._buffer) >= self.flush_rows:
+                self._wakeup.notify()
+            self._report()
+
+    def _report(self):
+        backlog = len(self._buffer) + sum(len(rows) for _, rows, _ in self._batches)
+        gauge('history_backlog_rows', backlog)
+        gauge('history_oldest_pending_seconds',
+              round(time.monotonic() - self._oldest, 3) if self._oldest is not None else 0)
+
+    def _run(self):
+        with self._lock:
+            while not self._closed:
+                age = time.monotonic() - self._oldest if self._oldest is not None else None
+                if len(self._buffer) < self.flush_rows and not self._batches and \
+                        (age is None or age < self.flush_interval):
+                    self._wakeup.wait(self.flush_interval - age if age is not None else self.flush_interval)
+                    if age is None and not self._closed:
+                        # Idle: pick up the spill files of CLI processes that have exited
+                        self._recover()
+                    continue
+                self._lock.release()
+                try:
+                    if not self.flush():
+                        # The database is unreachable; retry after a full interval
+                        time.sleep(self.flush_interval)
+                finally:
+                    self._lock.acquire()
+
+    def flush(self):
+        """Write the buffer and any queued batches now; returns False if a batch failed."""
+        with self._flush_lock:
+            with self._lock:
+                spill = self._spill
+                if self._buffer and spill is not None:
+                    # The spill file becomes the batch's file; new rows go to a fresh one
+                    batch_id = spill.rename_to_batch()
+                    self._batches.append((batch_id, self._buffer, spill))
+                    self._spill = SpillFile.create(self.spill_dir)
+                    self._buffer, self._oldest = [], None
+                batches = list(self._batches)
+
+            ok = True
+            for batch in batches:
+                batch_id, rows, spill = batch
+                try:
+                    self._write_batch(batch_id, rows)
+                except Exception as e:
+                    if not is_permanent_error(e):
+                        count('history_flush_errors')
+                        print(f"Could not flush optimization history: {e}", file=sys.stderr)
+                        self._discard_connection()
+                        ok = False
+                        break
+                    # Kept for inspection, out of the way of the batches behind it
+                    count('history_batches_failed')
+                    print(f"Optimization history batch {batch_id} rejected, kept as failed-{batch_id}.jsonl: {e}",
+                          file=sys.stderr)
+                    with self._lock:
+                        spill.rename(f"failed-{batch_id}.jsonl")
+                        spill.close()
+                        self._batches.remove(batch)
+                    continue
+                with self._lock:
+                    spill.delete()
+                    self._batches.remove(batch)
+            with self._lock:
+                self._report()
+            return ok
+
+    def _write_batch(self, batch_id, rows):
+        started = time.perf_counter()
+        conn = self._conn
+        if conn is None:
+            conn = self._conn = self.connect()
+            self._ensure_tables(conn)
+        cursor = conn.cursor()
+        try:
+            with stage('history_flush'):
+                cursor.execute("SELECT 1 FROM history_flushes WHERE batch_id = %s", (batch_id,))
+                if cursor.fetchone() is None:
+                    cursor.copy_expert(COPY_SQL, copy_buffer(rows))
+                    cursor.execute("INSERT INTO history_flushes (batch_id, rows) VALUES (%s, %s)",
+                                   (batch_id, len(rows)))
+                    conn.commit()
+                    count('history_rows_flushed', len(rows))
+                else:
+                    # Committed before a crash, but the batch file was never deleted
+                    conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        gauge('history_flush_seconds_last', round(time.perf_counter() - started, 6))
+
+    def _ensure_tables(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_flushes (
+                batch_id TEXT PRIMARY KEY,
+                rows INTEGER NOT NULL,
+                flushed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def _discard_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def flush_and_close(self, timeout=EXIT_FLUSH_TIMEOUT):
+        """Write this process's rows now, then close; returns False if they were left in the spill file.
+
+        For writers started with flush=False. Once connected, it also writes
+        the spill files earlier runs left behind. Connecting and each COPY
+        are bounded by timeout seconds.
+        """
+        if self._spill is None:
+            return True
+        ok = True
+        if self._thread is None and (self._buffer or self._batches):
+            try:
+                seconds = max(1, int(timeout))
+                self._conn = self.connect(connect_timeout=seconds, options=f"-c statement_timeout={seconds * 1000}")
+                self._ensure_tables(self._conn)
+                with self._lock:
+                    # Postgres is reachable: also write what earlier runs could not
+                    self._recover()
+                ok = self.flush()
+            except Exception as e:
+                ok = False
+                count('history_flush_errors')
+                print(f"Could not flush optimization history: {e}", file=sys.stderr)
+        self.close()
+        return ok
+
+    def close(self):
+        """Stop the flush thread and make a last flush; rows it cannot write stay in the spill files.
+
+        Without a flush thread (start(flush=False)) the spill file is only
+        released, for a flushing process to write.
+        """
+        with self._lock:
+            if self._spill is None:
+                return
+            self._closed = True
+            self._wakeup.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+            self.flush()
+        with self._lock:
+            spill, self._spill = self._spill, None
+            if spill is not None:
+                if self._buffer:
+                    spill.close()
+                else:
+                    spill.delete()
+            self._buffer, self._oldest = [], None
+            # Unwritten batches keep their files (and lose their locks) for the next process
+            for _, _, batch_spill in self._batches:
+                batch_spill.close()
+            self._batches = []
+        self._discard_connection()
+
+history_writer = HistoryWriter()
+
+if __name__ == "__main__":
+    # Write out whatever exited processes left in the spill directory
+    history_writer.start()
+    history_writer.close()
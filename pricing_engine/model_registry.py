@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""In-process registry of trained pricing models.
+
+Each model file is loaded once per process and re-checked at most every
+``check_interval`` seconds. When the file's mtime or size changes, the new
+version is loaded and swapped in atomically, so long-running workers pick up
+retrained models without a restart. A version that fails to load (a file
+still being written, a bad pickle) is reported and skipped: the previous
+model keeps serving until the file changes again.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import joblib
+except ImportError:  # joblib ships with scikit-learn, but is optional here
+    joblib = None
+
+LoadedModel = namedtuple('LoadedModel', ['model', 'version'])
+
+class _Entry:
+    """Current state of one registered model file."""
+
+    def __init__(self):
+        self.loaded = None
+        self.signature = None
+        self.checked_at = 0.0
+
+def file_version(path, chunk_size=1 << 20):
+    """Return a short content-hash version string for a model file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}@{digest.hexdigest()[:12]}"
+
+def load_model_file(path):
+    """Load a model file, memory-mapping large numeric arrays when possible."""
+    if joblib is not None:
+        # Arrays stored uncompressed by joblib.dump are mapped read-only, so
+        # worker processes share one physical copy through the page cache.
+        # Plain pickles load the same way, just without the mapping.
+        return joblib.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+class ModelRegistry:
+    """Load models once and hot-reload them when their files change."""
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the current LoadedModel for path, or None if the file does not exist."""
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.check_interval:
+            return entry.loaded
+
+        with self._lock:
+            entry = self._entries.setdefault(path, _Entry())
+            if now - entry.checked_at < self.check_interval and entry.signature is not None:
+                return entry.loaded
+            self._refresh(path, entry)
+            entry.checked_at = now
+            return entry.loaded
+
+    def _refresh(self, path, entry):
+        """Reload the model if the file was added, changed or removed."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            entry.signature = ('missing',)
+            entry.loaded = None
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == entry.signature:
+            return
+
+        try:
+            model = load_model_file(path)
+            version = file_version(path)
+        except Exception as e:
+            # Not retried until the signature changes (e.g. the writer finishes the file)
+            entry.signature = signature
+            current = entry.loaded.version if entry.loaded is not None else 'no model'
+            print(f"Could not load model {path}, keeping {current}: {e}", file=sys.stderr)
+            return
+        # Replace the whole tuple so readers never see a model/version mismatch
+        entry.loaded = LoadedModel(model, version)
+        entry.signature = signature
+
+    def clear(self):
+        """Forget all loaded models."""
+        with self._lock:
+            self._entries.clear()
+
+registry = ModelRegistry(float(os.environ.get('MODEL_CHECK_INTERVAL', '2.0')))
+
+def get_model(path):
+    """Return the LoadedModel for path from the process-wide registry."""
+    return registry.get(path)
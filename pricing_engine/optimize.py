@@ -1,92 +1,354 @@
 #!/usr/bin/env python
-import argparse
+"""Price optimization CLI, spawned once per request by the API.
+
+Start-up time is most of a single-product run, so this module imports only
+a few standard library modules, pipeline_metrics and the grid search at
+load time; db and argparse are imported by the code that runs the CLI. The
+single-product path reads one row with psycopg2 and works on plain floats.
+pandas and NumPy are imported only by the batch path, and the model
+registry only when a trained model is used. benchmarks/startup_time.py
+checks the budget.
+
+Results are appended to a local spill file and written to
+price_optimization_history by the pricing worker (history_writer.py), so a
+request does not wait on that insert.
+
+With --category and {"optimizer": "portfolio"}, the subtree is repriced
+jointly by portfolio.py instead of product by product.
+"""
 import json
-import pandas as pd
-import pickle
+import math
 import os
-from sqlalchemy import create_engine
+import sys
+
+# Shared modules (db, pipeline_metrics) live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pipeline_metrics import count, pipeline_metrics, profiled, stage
+from grid_search import grid_search_price, grid_search_prices, constraints_from_parameters
+
+MODEL_PATH = os.path.join('/app/pricing_engine/models', 'price_optimizer.pkl')
+
+# Columns the single-product path reads
+PRODUCT_COLUMNS = ('id', 'category', 'price', 'cost', 'competitor_price', 'historical_sales',
+                   'historical_price', 'sales_velocity')
 
 def connect_to_database():
     """Connect to the database."""
-    db_host = os.environ.get('DB_HOST', 'db')
-    db_user = os.environ.get('DB_USER', 'postgres')
-    db_password = os.environ.get('DB_PASSWORD', 'postgres')
-    db_name = os.environ.get('DB_NAME', 'lazada_products')
-    
-    connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
-    return create_engine(connection_string)
+    import db
+    return db.get_engine('postgres')
+
+def as_float(value):
+    """Database value as a float; NULL becomes NaN, as it does in a DataFrame."""
+    return math.nan if value is None else float(value)
+
+def get_product_record(conn, product_id):
+    """Return one product's features as a dict, or None if it does not exist or was retired.
+
+    A primary-key lookup over a direct connection; the feature snapshot
+    would need NumPy, whose import alone costs more than the query.
+    """
+    with stage('feature_lookup'):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products "
+                           "WHERE id = %s AND is_active IS NOT FALSE", (int(product_id),))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    return dict(zip(PRODUCT_COLUMNS, row)) if row is not None else None
 
-def get_product_data(engine, product_id):
-    """Retrieve product data from database."""
-    query = f"SELECT * FROM products WHERE id = {product_id}"
-    return pd.read_sql(query, engine)
+def get_products_data(engine, product_ids=None, category=None):
+    """Retrieve data for many products in a single query, by ID list or category subtree.
 
-def optimize_price(product_data, parameters):
-    """Optimize price based on product data and parameters."""
+    Listings retired by the importers (is_active false) are left out.
+    """
+    if product_ids is not None:
+        query = "SELECT * FROM products WHERE id = ANY(%(product_ids)s) AND is_active IS NOT FALSE ORDER BY id"
+        params = {'product_ids': [int(product_id) for product_id in product_ids]}
+    elif category is not None:
+        # Match the category itself and everything below it in the "A > B > C" hierarchy
+        query = ("SELECT * FROM products WHERE (category = %(category)s OR category LIKE %(subtree)s) "
+                 "AND is_active IS NOT FALSE ORDER BY id")
+        from category_resolver import escape_like
+        params = {'category': category, 'subtree': escape_like(category) + ' > %'}
+    else:
+        raise ValueError('Either product_ids or category is required')
+    import pandas as pd
+    return pd.read_sql(query, engine, params=params)
+
+def load_model():
+    """Return the current LoadedModel for the trained price model."""
+    from model_registry import get_model
+    with stage('model_load'):
+        loaded = get_model(MODEL_PATH)
+    if loaded is None:
+        raise FileNotFoundError(f"Model not found: {MODEL_PATH}")
+    return loaded
+
+def optimize_price(product, parameters):
+    """Optimize the price of one product (a dict from get_product_record)."""
+    if parameters.get('optimizer') == 'grid':
+        return optimize_price_grid(product, parameters)
+    
     # Load trained model
-    model_path = os.path.join('/app/pricing_engine/models', 'price_optimizer.pkl')
-    with open(model_path, 'rb') as f:
-        model = pickle.load(f)
+    loaded = load_model()
     
     # Feature engineering
-    features = prepare_features(product_data, parameters)
+    with stage('feature_prep'):
+        features = prepare_features(product, parameters)
     
-    # Predict optimal price
-    optimal_price = model.predict(features)[0]
+    # Predict optimal price; the model takes a one-row frame
+    with stage('predict'):
+        import pandas as pd
+        optimal_price = float(loaded.model.predict(pd.DataFrame([features]))[0])
     
     # Calculate expected metrics
-    expected_sales = calculate_expected_sales(optimal_price, product_data)
+    expected_sales = calculate_expected_sales(optimal_price, product)
     expected_revenue = optimal_price * expected_sales
-    expected_profit = calculate_expected_profit(optimal_price, expected_sales, product_data)
+    expected_profit = calculate_expected_profit(optimal_price, expected_sales, product)
+    
+    return {
+        'optimal_price': optimal_price,
+        'expected_sales': expected_sales,
+        'expected_revenue': expected_revenue,
+        'expected_profit': expected_profit,
+        'current_price': as_float(product['price']),
+        'model_version': loaded.version
+    }
+
+def optimize_price_grid(product, parameters):
+    """Grid search for one product in plain Python (same result as optimize_prices_grid)."""
+    current_price = as_float(product['price'])
+    base_sales, base_price, elasticity = product_demand(product)
+    constraints = constraints_from_parameters(parameters)
+    # An elasticity in the request overrides the fitted one
+    constraints.setdefault('elasticity', elasticity)
+    with stage('predict'):
+        result = grid_search_price(
+            as_float(product['cost']),
+            current_price,
+            base_sales,
+            base_price,
+            competitor_price=parameters.get('competitor_price'),
+            **constraints
+        )
     
     return {
-        'optimal_price': float(optimal_price),
-        'expected_sales': float(expected_sales),
-        'expected_revenue': float(expected_revenue),
-        'expected_profit': float(expected_profit),
-        'current_price': float(product_data['price'].iloc[0])
+        'optimal_price': result['optimal_price'],
+        'expected_sales': result['expected_sales'],
+        'expected_revenue': result['expected_revenue'],
+        'expected_profit': result['expected_profit'],
+        'current_price': current_price,
+        'feasible': result['feasible'],
+        'model_version': 'grid-search'
     }
 
-def prepare_features(product_data, parameters):
+def prepare_features(product, parameters):
     """Prepare features for the model."""
     # Implementation depends on your specific model requirements
     # This is a placeholder
-    return pd.DataFrame({
-        'category': [product_data['category'].iloc[0]],
-        'cost': [product_data['cost'].iloc[0]],
-        'competitor_price': [parameters.get('competitor_price', 0)],
-        'sales_velocity': [product_data['sales_velocity'].iloc[0]],
-        'season': [parameters.get('season', 'regular')]
-    })
+    return {
+        'category': product['category'],
+        'cost': as_float(product['cost']),
+        'competitor_price': parameters.get('competitor_price', 0),
+        'sales_velocity': as_float(product['sales_velocity']),
+        'season': parameters.get('season', 'regular')
+    }
+
+def product_demand(product):
+    """(base_sales, base_price, elasticity) from the fitted elasticity table."""
+    from elasticity import demand_baseline
+    return demand_baseline(product['id'], product['category'], as_float(product['historical_sales']),
+                           as_float(product['historical_price']), as_float(product['price']))
 
-def calculate_expected_sales(price, product_data):
+def calculate_expected_sales(price, product):
     """Calculate expected sales at the given price."""
-    # Simple price elasticity model as a placeholder
-    base_sales = product_data['historical_sales'].iloc[0]
-    base_price = product_data['historical_price'].iloc[0]
-    elasticity = -1.2  # Example elasticity coefficient
+    base_sales, base_price, elasticity = product_demand(product)
     
-    return base_sales * (price / base_price) ** elasticity
+    # As with NumPy floats, a zero base price means zero demand rather than an error
+    ratio = price / base_price if base_price else math.inf
+    return base_sales * ratio ** elasticity
 
-def calculate_expected_profit(price, sales, product_data):
+def calculate_expected_profit(price, sales, product):
     """Calculate expected profit."""
-    cost = product_data['cost'].iloc[0]
-    return (price - cost) * sales
+    return (price - as_float(product['cost'])) * sales
+
+def prepare_features_batch(products_data, parameters):
+    """Prepare the stacked feature matrix for many products."""
+    import numpy as np
+    import pandas as pd
+    n = len(products_data)
+    return pd.DataFrame({
+        'category': products_data['category'].to_numpy(),
+        'cost': products_data['cost'].to_numpy(),
+        'competitor_price': np.full(n, parameters.get('competitor_price', 0)),
+        'sales_velocity': products_data['sales_velocity'].to_numpy(),
+        'season': np.full(n, parameters.get('season', 'regular'), dtype=object)
+    })
+
+def products_demand(products_data):
+    """(base_sales, base_price, elasticity) arrays from the fitted elasticity table."""
+    from elasticity import demand_baselines
+    return demand_baselines(
+        products_data['id'].to_numpy(), products_data['category'].to_numpy(dtype=object),
+        products_data['historical_sales'].to_numpy(dtype=float),
+        products_data['historical_price'].to_numpy(dtype=float),
+        products_data['price'].to_numpy(dtype=float)
+    )
+
+def calculate_expected_sales_batch(prices, products_data):
+    """Calculate expected sales for many products at their given prices."""
+    base_sales, base_price, elasticity = products_demand(products_data)
+    return base_sales * (prices / base_price) ** elasticity
+
+def optimize_prices(products_data, parameters):
+    """Optimize prices for many products with a single model prediction."""
+    if products_data.empty:
+        return []
+    
+    if parameters.get('optimizer') == 'grid':
+        return optimize_prices_grid(products_data, parameters)
+    
+    import numpy as np
+    loaded = load_model()
+    
+    # One prediction over the stacked feature matrix
+    with stage('feature_prep'):
+        features = prepare_features_batch(products_data, parameters)
+    with stage('predict'):
+        optimal_prices = np.asarray(loaded.model.predict(features), dtype=float)
+    
+    # Calculate expected metrics as array operations
+    expected_sales = calculate_expected_sales_batch(optimal_prices, products_data)
+    expected_revenue = optimal_prices * expected_sales
+    expected_profit = (optimal_prices - products_data['cost'].to_numpy(dtype=float)) * expected_sales
+    
+    return [
+        {
+            'product_id': int(product_id),
+            'optimal_price': float(optimal_price),
+            'expected_sales': float(sales),
+            'expected_revenue': float(revenue),
+            'expected_profit': float(profit),
+            'current_price': float(current_price),
+            'model_version': loaded.version
+        }
+        for product_id, optimal_price, sales, revenue, profit, current_price in zip(
+            products_data['id'].to_numpy(), optimal_prices, expected_sales,
+            expected_revenue, expected_profit, products_data['price'].to_numpy(dtype=float)
+        )
+    ]
+
+def optimize_prices_grid(products_data, parameters):
+    """Search a dense price grid for the profit-maximising price of every product."""
+    current_price = products_data['price'].to_numpy(dtype=float)
+    base_sales, base_price, elasticity = products_demand(products_data)
+    constraints = constraints_from_parameters(parameters)
+    constraints.setdefault('elasticity', elasticity)
+    with stage('predict'):
+        result = grid_search_prices(
+            products_data['cost'].to_numpy(dtype=float),
+            current_price,
+            base_sales,
+            base_price,
+            competitor_price=parameters.get('competitor_price'),
+            **constraints
+        )
+    
+    return [
+        {
+            'product_id': int(product_id),
+            'optimal_price': float(optimal_price),
+            'expected_sales': float(sales),
+            'expected_revenue': float(revenue),
+            'expected_profit': float(profit),
+            'current_price': float(price),
+            'feasible': bool(feasible),
+            'model_version': 'grid-search'
+        }
+        for product_id, optimal_price, sales, revenue, profit, price, feasible in zip(
+            products_data['id'].to_numpy(), result['optimal_price'], result['expected_sales'],
+            result['expected_revenue'], result['expected_profit'], current_price, result['feasible']
+        )
+    ]
+
+def record_history(results, parameters):
+    """Write results (with product_id) to price_optimization_history before the CLI exits.
+
+    One bounded COPY (history_writer.flush_and_close); if Postgres cannot
+    take it, the rows stay in this process's spill file and the next
+    flushing process writes them.
+    """
+    from history_writer import history_writer
+    history_writer.start(flush=False)
+    for result in results:
+        history_writer.record(result['product_id'], result, parameters)
+    history_writer.flush_and_close()
 
 if __name__ == "__main__":
+    import argparse
+    import db
+
+    # Inside docker-compose the database host is the "db" service
+    os.environ.setdefault('DB_HOST', 'db')
+    os.environ.setdefault('DB_PASSWORD', 'postgres')
+
     parser = argparse.ArgumentParser(description='Optimize product price')
-    parser.add_argument('--product_id', type=int, required=True, help='Product ID')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--product_id', type=int, help='Product ID')
+    target.add_argument('--product_ids', type=str, help='Comma-separated product IDs for batch optimization')
+    target.add_argument('--category', type=str, help='Optimize every product in this category subtree')
     parser.add_argument('--parameters', type=str, required=True, help='Optimization parameters as JSON')
+    parser.add_argument('--metrics-file', help='Prometheus textfile to write stage metrics to')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Dump cProfile and tracemalloc reports for this run to DIR')
     
     args = parser.parse_args()
     parameters = json.loads(args.parameters)
+    status = 0
     
-    engine = connect_to_database()
-    product_data = get_product_data(engine, args.product_id)
-    
-    if product_data.empty:
-        print(json.dumps({'error': 'Product not found'}))
-        exit(1)
+    with profiled('optimize', args.profile):
+        if args.category is not None and parameters.get('optimizer') == 'portfolio':
+            # Joint repricing: the subtree comes from the importers' categories table in MySQL
+            from portfolio import optimize_category
+            conn = db.postgres_connection()
+            mysql_conn = db.mysql_connection()
+            try:
+                mysql_cursor = mysql_conn.cursor()
+                result = optimize_category(conn, mysql_cursor, args.category, parameters,
+                                           jobs=int(parameters['jobs']) if parameters.get('jobs') else None)
+                mysql_cursor.close()
+            except ValueError as e:
+                result = {'error': str(e)}
+                status = 1
+            finally:
+                mysql_conn.close()
+                conn.close()
+            print(json.dumps(result))
+            record_history(result.get('products', []), parameters)
+        elif args.product_id is None:
+            engine = connect_to_database()
+            product_ids = [int(product_id) for product_id in args.product_ids.split(',')] if args.product_ids else None
+            products_data = get_products_data(engine, product_ids=product_ids, category=args.category)
+            results = optimize_prices(products_data, parameters)
+            count('products_optimized', len(results))
+            print(json.dumps(results))
+            record_history(results, parameters)
+        else:
+            conn = db.postgres_connection()
+            try:
+                product_data = get_product_record(conn, args.product_id)
+            finally:
+                conn.close()
+            
+            if product_data is None:
+                print(json.dumps({'error': 'Product not found'}))
+                status = 1
+            else:
+                result = optimize_price(product_data, parameters)
+                count('products_optimized')
+                print(json.dumps(result))
+                record_history([dict(result, product_id=args.product_id)], parameters)
     
-    result = optimize_price(product_data, parameters)
-    print(json.dumps(result)) 
\ No newline at end of file
+    pipeline_metrics.write_prometheus('optimize', args.metrics_file)
+    exit(status)
@@ -0,0 +1,333 @@
+"""Joint price optimization of every product in a category subtree.
+
+Products in one leaf category compete for the same buyers, so raising one
+price moves some of its demand to its siblings. Demand is log-linear with
+an own-price elasticity and a cross-price elasticity within the leaf:
+
+    log q_i = log s_i + e_i * x_i + cross * sum_{j != i} w_j * x_j
+
+where x = log(price / base_price), s is the base sales and w_j is product
+j's share of the leaf's base revenue. The solver maximises the leaf's
+total profit sum((p_i - cost_i) * q_i) over the whole price vector at
+once, subject to:
+
+- a margin floor and the per-product bounds of grid_search.price_bounds,
+- a maximum average price change: mean(|p_i / current_i - 1|) <= limit.
+
+Each leaf is one solve. Gradients are O(n) array expressions (the cross
+term goes through the leaf total), so a leaf of thousands of SKUs takes
+milliseconds to a few seconds. The box-constrained problem is solved with
+SciPy's L-BFGS-B when SciPy is installed; the average-change constraint,
+or a missing SciPy, uses projected gradient ascent in NumPy, with the
+projection onto box and budget found by bisection. The leaves of a subtree
+are solved in parallel in a process pool.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from category_resolver import CategoryTrie, escape_like, split_category_path
+from elasticity import demand_baselines
+from grid_search import DEFAULT_ELASTICITY, DEFAULT_MAX_PRICE_FACTOR, DEFAULT_MIN_MARGIN, price_bounds
+from pipeline_metrics import count, stage
+
+try:
+    from scipy.optimize import minimize
+except ImportError:  # SciPy is optional; the NumPy solver covers every case
+    minimize = None
+
+DEFAULT_CROSS_ELASTICITY = 0.5
+DEFAULT_MAX_AVERAGE_CHANGE = None  # no limit unless the request sets one
+MIN_PRICE = 0.01
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-7  # stop when no relative price moves by more than this
+PROFIT_TOLERANCE = 1e-12  # or when STALLED_ITERATIONS in a row each add less than this share of the profit
+STALLED_ITERATIONS = 5
+PROJECTION_STEPS = 60  # bisection steps for the average-change projection
+
+PROBLEM_COLUMNS = ('id', 'category', 'price', 'cost', 'competitor_price', 'historical_sales', 'historical_price')
+
+class CategoryProblem:
+    """Arrays of one leaf category's demand model.
+
+    The solvers work in scaled relative changes u = (price / current - 1) *
+    scale, where scale is the square root of each product's revenue at its
+    current price. Profit curvature grows with revenue, so without it a
+    best seller and a slow mover would need step sizes orders of
+    magnitude apart.
+    """
+
+    def __init__(self, category, ids, cost, current_price, base_sales, base_price, competitor_price=None,
+                 elasticity=None, cross_elasticity=DEFAULT_CROSS_ELASTICITY,
+                 min_margin=DEFAULT_MIN_MARGIN, max_price_change=None, competitor_ceiling=0.95,
+                 max_price_factor=DEFAULT_MAX_PRICE_FACTOR, max_average_change=DEFAULT_MAX_AVERAGE_CHANGE):
+        self.category = category
+        self.ids = np.asarray(ids, dtype=np.int64)
+        n = len(self.ids)
+        self.cost = np.asarray(cost, dtype=float)
+        self.current_price = np.asarray(current_price, dtype=float)
+        base_sales = np.nan_to_num(np.asarray(base_sales, dtype=float))
+        base_price = np.asarray(base_price, dtype=float)
+        if elasticity is None:
+            elasticity = DEFAULT_ELASTICITY
+        elasticity = np.broadcast_to(np.asarray(elasticity, dtype=float), (n,))
+
+        # As in the grid search, a product without a usable base price has flat demand
+        usable = base_price > 0
+        self.log_base_price = np.log(np.where(usable, base_price, 1.0))
+        self.elasticity = np.where(usable, elasticity, 0.0)
+        self.base_sales = base_sales
+        revenue = np.where(usable, base_sales * base_price, 0.0)
+        total = revenue.sum()
+        self.weights = revenue / total if total > 0 else np.zeros(n)
+        self.cross_elasticity = float(cross_elasticity)
+
+        current_revenue = self.current_price * self.demand(self.current_price)
+        self.scale = np.sqrt(np.maximum(current_revenue, 1e-6))
+
+        lower, upper, self.feasible = price_bounds(
+            self.cost, self.current_price, competitor_price, min_margin,
+            max_price_change, competitor_ceiling, max_price_factor
+        )
+        lower = np.maximum(lower, MIN_PRICE)
+        upper = np.maximum(upper, lower)
+        self.lower = (lower / self.current_price - 1) * self.scale
+        self.upper = (upper / self.current_price - 1) * self.scale
+        self.budget = None if max_average_change is None else float(max_average_change) * n
+
+    def __len__(self):
+        return len(self.ids)
+
+    def changes(self, u):
+        """Relative price changes (price / current - 1) of a point."""
+        return u / self.scale
+
+    def prices(self, u):
+        return self.current_price * (1 + u / self.scale)
+
+    def demand(self, prices):
+        x = np.log(prices) - self.log_base_price
+        cross = self.cross_elasticity * (np.dot(self.weights, x) - self.weights * x)
+        return self.base_sales * np.exp(self.elasticity * x + cross)
+
+    def profit(self, u):
+        """Total profit and its gradient with respect to u."""
+        prices = self.prices(u)
+        sales = self.demand(prices)
+        margin = (prices - self.cost) * sales
+        total = margin.sum()
+        # d(profit)/d(price_k) = q_k + (e_k * m_k + cross * w_k * (M - m_k)) / p_k
+        gradient = sales + (self.elasticity * margin
+                            + self.cross_elasticity * self.weights * (total - margin)) / prices
+        return total, gradient * self.current_price / self.scale
+
+    def _shrink(self, v, lam):
+        # Minimizer of |u - v|^2 / 2 + lam * sum(|u_k| / scale_k) inside the box
+        return np.clip(np.sign(v) * np.maximum(np.abs(v) - lam / self.scale, 0.0), self.lower, self.upper)
+
+    def project(self, v):
+        """Closest point to v inside the box and, if set, the average-change budget.
+
+        Returns (point, feasible); when even the smallest changes the box
+        allows exceed the budget, that point is returned as infeasible.
+        """
+        clipped = np.clip(v, self.lower, self.upper)
+        if self.budget is None or np.abs(self.changes(clipped)).sum() <= self.budget:
+            return clipped, True
+        closest = np.clip(0.0, self.lower, self.upper)
+        if np.abs(self.changes(closest)).sum() > self.budget:
+            return closest, False
+        # A larger lam shrinks every change further towards zero; find the smallest one within budget
+        low, high = 0.0, float((np.abs(v) * self.scale).max())
+        for _ in range(PROJECTION_STEPS):
+            lam = (low + high) / 2
+            if np.abs(self.changes(self._shrink(v, lam))).sum() > self.budget:
+                low = lam
+            else:
+                high = lam
+        return self._shrink(v, high), True
+
+def _solve_box(problem, u):
+    """L-BFGS-B over the per-product bounds only; returns (u, iterations)."""
+    assert minimize is not None, 'L-BFGS-B needs scipy'
+    result = minimize(lambda point: tuple(-value for value in problem.profit(point)), u, jac=True,
+                      method='L-BFGS-B', bounds=np.column_stack((problem.lower, problem.upper)),
+                      options={'maxiter': MAX_ITERATIONS})
+    return np.clip(result.x, problem.lower, problem.upper), int(result.nit)
+
+def _solve_projected(problem, u):
+    """Projected gradient ascent with Barzilai-Borwein steps and backtracking; returns (u, iterations)."""
+    value, gradient = problem.profit(u)
+    step = 0.1 / max(float(np.abs(gradient).max()), 1e-12)
+    stalled = 0
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        while True:
+            candidate, _ = problem.project(u + step * gradient)
+            move = candidate - u
+            new_value, new_gradient = problem.profit(candidate)
+            # Armijo condition: accept once the step gains a fair share of what the gradient promised
+            if new_value >= value + 1e-4 * np.dot(gradient, move) or step < 1e-30:
+                break
+            step /= 2
+        # Barzilai-Borwein steps zig-zag, so one small gain alone does not mean convergence
+        stalled = stalled + 1 if new_value - value <= PROFIT_TOLERANCE * abs(value) else 0
+        done = float(np.abs(problem.changes(move)).max()) < TOLERANCE or stalled >= STALLED_ITERATIONS
+        curvature = np.dot(move, new_gradient - gradient)
+        step = np.dot(move, move) / -curvature if curvature < 0 else step * 2
+        u, value, gradient = candidate, new_value, new_gradient
+        if done:
+            return u, iteration
+    return u, MAX_ITERATIONS
+
+def solve_category(problem):
+    """Solve one leaf category; returns (summary, product results)."""
+    started = time.perf_counter()
+    u, feasible = problem.project(np.zeros(len(problem)))
+    solver = 'projected-gradient'
+    iterations = 0
+    if feasible:
+        if minimize is not None:
+            box_u, iterations = _solve_box(problem, u)
+            projected, _ = problem.project(box_u)
+            if np.allclose(projected, box_u):
+                u, solver = box_u, 'L-BFGS-B'
+            else:
+                # The budget binds: continue from the box solution with the projected solver
+                u, more = _solve_projected(problem, projected)
+                iterations += more
+        else:
+            u, iterations = _solve_projected(problem, u)
+
+    prices = problem.prices(u)
+    sales = problem.demand(prices)
+    current_sales = problem.demand(problem.current_price)
+    summary = {
+        'category': problem.category,
+        'products': len(problem),
+        'current_profit': float(((problem.current_price - problem.cost) * current_sales).sum()),
+        'expected_profit': float(((prices - problem.cost) * sales).sum()),
+        'average_change': float(np.abs(problem.changes(u)).mean()) if len(problem) else 0.0,
+        'feasible': bool(feasible),
+        'solver': solver,
+        'iterations': iterations,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    results = [
+        {
+            'product_id': int(product_id),
+            'category': problem.category,
+            'optimal_price': float(price),
+            'expected_sales': float(quantity),
+            'expected_revenue': float(price * quantity),
+            'expected_profit': float((price - cost) * quantity),
+            'current_price': float(current),
+            'feasible': bool(feasible and product_feasible),
+            'model_version': 'portfolio'
+        }
+        for product_id, price, quantity, cost, current, product_feasible in zip(
+            problem.ids, prices, sales, problem.cost, problem.current_price, problem.feasible
+        )
+    ]
+    return summary, results
+
+def solve_categories(problems, jobs=None):
+    """Solve every problem, one process per core; returns (summaries, product results)."""
+    # Largest first, so one big leaf does not start last
+    problems = sorted(problems, key=len, reverse=True)
+    with stage('portfolio_solve'):
+        if jobs == 1 or len(problems) <= 1:
+            solved = [solve_category(problem) for problem in problems]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                solved = list(pool.map(solve_category, problems))
+    summaries = [summary for summary, _ in solved]
+    results = [result for _, products in solved for result in products]
+    count('categories_optimized', len(summaries))
+    count('products_optimized', len(results))
+    return summaries, results
+
+def portfolio_constraints(parameters):
+    """Map request parameters onto CategoryProblem keyword arguments."""
+    constraints = {}
+    for key in ('elasticity', 'cross_elasticity', 'min_margin', 'max_price_change', 'competitor_ceiling',
+                'max_price_factor', 'max_average_change'):
+        if parameters.get(key) is not None:
+            constraints[key] = float(parameters[key])
+    return constraints
+
+def _floats(values):
+    """Database values as a float array; NULL becomes NaN."""
+    return np.array([np.nan if value is None else float(value) for value in values])
+
+def load_category_problems(conn, trie, category, parameters):
+    """Group the Postgres products in a category subtree into one problem per leaf.
+
+    The subtree comes from the categories hierarchy (a CategoryTrie loaded
+    from the importers' MySQL database); each product belongs to the
+    category node its "A > B > C" path resolves to. Returns (problems,
+    skipped) where skipped counts products without a cost or price.
+    """
+    parts = split_category_path(category)
+    root_id = trie.lookup(parts)
+    if root_id is None:
+        raise ValueError(f"Unknown category: {category}")
+    subtree = trie.subtree(root_id)
+
+    with stage('portfolio_read'):
+        cursor = conn.cursor()
+        try:
+            # Every path in the subtree starts with the root's top-level name; the trie decides the rest
+            cursor.execute(f"SELECT {', '.join(PROBLEM_COLUMNS)} FROM products "
+                           "WHERE category LIKE %s AND is_active IS NOT FALSE ORDER BY id",
+                           (escape_like(parts[0]) + '%',))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    node_of = {}
+    leaves = {}
+    skipped = 0
+    for row in rows:
+        path = row[1]
+        if path not in node_of:
+            node_of[path] = trie.lookup(split_category_path(path)) if path else None
+        node_id = node_of[path]
+        if node_id not in subtree:
+            continue
+        if row[2] is None or row[3] is None or not float(row[2]) > 0:
+            skipped += 1
+            continue
+        leaves.setdefault(node_id, (path, []))[1].append(row)
+
+    constraints = portfolio_constraints(parameters)
+    # An elasticity in the request overrides the fitted ones
+    requested_elasticity = constraints.pop('elasticity', None)
+    problems = []
+    for path, leaf_rows in leaves.values():
+        columns = list(zip(*leaf_rows))
+        current_price = _floats(columns[2])
+        base_sales, base_price, elasticity = demand_baselines(
+            columns[0], columns[1], _floats(columns[5]), _floats(columns[6]), current_price
+        )
+        problems.append(CategoryProblem(
+            ' > '.join(split_category_path(path)), columns[0],
+            cost=_floats(columns[3]), current_price=current_price,
+            base_sales=base_sales, base_price=base_price, competitor_price=_floats(columns[4]),
+            elasticity=elasticity if requested_elasticity is None else requested_elasticity, **constraints
+        ))
+    return problems, skipped
+
+def optimize_category(pg_conn, mysql_cursor, category, parameters, jobs=None):
+    """Jointly reprice a category subtree; returns a dict of category summaries and product results."""
+    trie = CategoryTrie.load(mysql_cursor)
+    problems, skipped = load_category_problems(pg_conn, trie, category, parameters)
+    summaries, results = solve_categories(problems, jobs)
+    return {
+        'category': category,
+        'current_profit': sum(summary['current_profit'] for summary in summaries),
+        'expected_profit': sum(summary['expected_profit'] for summary in summaries),
+        'skipped': skipped,
+        'categories': summaries,
+        'products': results,
+    }
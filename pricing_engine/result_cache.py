@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""Cache of price optimization results.
+
+Results are keyed by product, a canonical hash of the request parameters,
+the product's updated_at and the model version. So a changed product or
+a retrained model never serves an old answer. Lookups go through an
+in-process LRU with a TTL, then an optional SQLite file that several
+workers can share (RESULT_CACHE_PATH).
+
+Importers call invalidate() after changing products. It clears the
+shared tier and replaces a generation file (RESULT_CACHE_GENERATION_FILE)
+that every worker checks about once a second, so in-process entries are
+dropped too, with or without the shared tier. The file must be on a
+filesystem the importers and the workers share.
+
+The importers write MySQL and invalidate before catalog_sync.py has
+copied their changes to the optimizers' Postgres; until then a worker can
+cache results for the old rows again. catalog_sync.py invalidates once
+more after the copy, and the new updated_at changes the keys of the
+synced products anyway.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_SIZE', '10000'))
+DEFAULT_TTL = float(os.environ.get('RESULT_CACHE_TTL', '300'))  # seconds
+DEFAULT_GENERATION_FILE = (os.environ.get('RESULT_CACHE_GENERATION_FILE')
+                           or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result_cache.generation'))
+GENERATION_CHECK_INTERVAL = 1.0  # seconds between checks of the shared invalidation generation
+PRUNE_EVERY = 1000  # shared-tier writes between deletions of expired entries
+
+def canonical_parameters(parameters):
+    """Serialize parameters so equal dicts always produce the same string."""
+    return json.dumps(parameters or {}, sort_keys=True, separators=(',', ':'), default=str)
+
+def updated_at_token(value):
+    """Normalize updated_at from the database (timestamp) or the feature snapshot (epoch seconds)."""
+    # NULL arrives as None, NaN or NaT; NaN and NaT are the values not equal to themselves
+    if value is None or value != value:
+        return ''
+    if hasattr(value, 'timestamp'):
+        return f"{value.timestamp():.6f}"
+    return f"{float(value):.6f}"
+
+def cache_key(product_id, parameters, updated_at, model_version):
+    """Key for one optimization result."""
+    raw = '\x1f'.join([str(int(product_id)), canonical_parameters(parameters),
+                       updated_at_token(updated_at), str(model_version)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class LRUCache:
+    """Thread-safe LRU of (expires_at, value) with a per-entry TTL."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache:
+    """Result cache shared by processes through one SQLite file (WAL mode)."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value), time.time() + self.ttl))
+        conn.commit()
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def generation(self):
+        return self._connection().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def invalidate(self):
+        """Drop every entry and bump the generation so other processes clear their memory tier."""
+        conn = self._connection()
+        conn.execute("DELETE FROM results")
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+        conn.commit()
+
+    def prune(self):
+        """Delete expired entries; returns how many were removed."""
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+        conn.commit()
+        return removed
+
+def file_generation(path):
+    """Token of the generation file: it changes whenever publish_generation() replaces the file."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def publish_generation(path):
+    """Replace the generation file, which tells every worker to clear its memory tier."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(f"{time.time():.6f}\n")
+    # A new inode, so the token changes even within the filesystem's timestamp resolution
+    os.replace(tmp_path, path)
+
+class ResultCache:
+    """In-process LRU in front of an optional shared SQLite tier, with hit/miss counters."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, shared_path=None,
+                 generation_file=DEFAULT_GENERATION_FILE):
+        self.memory = LRUCache(max_entries, ttl)
+        self.shared = SQLiteCache(shared_path, ttl) if shared_path else None
+        self.generation_file = generation_file
+        self._generation = self._current_generation()
+        self._generation_checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'shared': 0}
+        self.misses = 0
+
+    def _current_generation(self):
+        return (file_generation(self.generation_file) if self.generation_file else None,
+                self.shared.generation() if self.shared else 0)
+
+    def _check_generation(self):
+        """Clear the memory tier if another process invalidated the cache."""
+        now = time.monotonic()
+        if now - self._generation_checked_at < GENERATION_CHECK_INTERVAL:
+            return
+        self._generation_checked_at = now
+        generation = self._current_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self.memory.clear()
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        self._check_generation()
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits['memory'] += 1
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                with self._lock:
+                    self.hits['shared'] += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.shared is not None:
+            self.shared.put(key, value)
+
+    def invalidate(self):
+        """Forget all results, in this process and in the shared tier."""
+        self.memory.clear()
+        if self.generation_file:
+            publish_generation(self.generation_file)
+        if self.shared is not None:
+            self.shared.invalidate()
+        self._generation = self._current_generation()
+
+    def stats(self):
+        """Hit/miss counters and the hit ratio."""
+        with self._lock:
+            hits = self.hits['memory'] + self.hits['shared']
+            total = hits + self.misses
+            return {
+                'memory_hits': self.hits['memory'],
+                'shared_hits': self.hits['shared'],
+                'misses': self.misses,
+                'hit_ratio': round(hits / total, 4) if total else None,
+                'entries': len(self.memory),
+            }
+
+result_cache = ResultCache(shared_path=os.environ.get('RESULT_CACHE_PATH') or None)
+
+def invalidate():
+    """Invalidate cached results after products changed (called by the importers)."""
+    result_cache.invalidate()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""Compact, array-backed in-memory view of the active rows of the products table.
+
+Every column is a NumPy array: product ids, interned category codes,
+float32 min/max prices, and names and image URLs stored as one UTF-8
+buffer each, addressed through an offsets array. Sorted price indexes
+answer range queries with binary search. A CSR-style category -> rows
+postings index answers category filters without scanning.
+
+A catalog can be saved as a directory of .npy files and loaded back
+memory-mapped, so several processes share one copy through the page
+cache.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from category_resolver import split_category_path
+
+CATALOG_QUERY = """
+SELECT id, product_name, product_image_url, category, min_price, max_price
+FROM products
+WHERE is_active
+ORDER BY id
+"""
+FETCH_SIZE = 50000
+
+ARRAY_NAMES = ('ids', 'category_codes', 'min_prices', 'max_prices', 'name_offsets', 'name_buffer',
+               'url_offsets', 'url_buffer', 'min_order', 'max_order', 'category_offsets', 'category_rows')
+
+def _encode_strings(values):
+    """Encode strings as UTF-8; returns (byte length of each value, concatenated buffer)."""
+    encoded = [('' if value is None else str(value)).encode('utf-8') for value in values]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    return lengths, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+def _string_column(lengths, buffer):
+    """Offsets for an encoded column: value i is buffer[offsets[i]:offsets[i + 1]]."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, buffer
+
+def _prices(values):
+    """Prices as float32, NULL as NaN."""
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float32)
+
+class _ColumnChunks:
+    """Accumulates fetched rows as one set of NumPy chunks per batch.
+
+    Each batch becomes compact arrays straight away, so a full table load
+    never holds every row as Python tuples at once.
+    """
+
+    DTYPES = {'ids': np.int64, 'category_codes': np.int32, 'min_prices': np.float32, 'max_prices': np.float32,
+              'name_lengths': np.int64, 'name_buffer': np.uint8, 'url_lengths': np.int64, 'url_buffer': np.uint8}
+
+    def __init__(self):
+        self.chunks = {name: [] for name in self.DTYPES}
+        self.category_lookup = {}
+
+    def add(self, rows):
+        """Add (id, name, image_url, category, min_price, max_price) tuples."""
+        if not rows:
+            return
+        ids, names, urls, categories, min_prices, max_prices = zip(*rows)
+        codes = [self.category_lookup.setdefault(category or '', len(self.category_lookup))
+                 for category in categories]
+        name_lengths, name_buffer = _encode_strings(names)
+        url_lengths, url_buffer = _encode_strings(urls)
+        for name, chunk in (('ids', np.array(ids, dtype=np.int64)), ('category_codes', np.array(codes, dtype=np.int32)),
+                            ('min_prices', _prices(min_prices)), ('max_prices', _prices(max_prices)),
+                            ('name_lengths', name_lengths), ('name_buffer', name_buffer),
+                            ('url_lengths', url_lengths), ('url_buffer', url_buffer)):
+            self.chunks[name].append(chunk)
+
+    def column(self, name):
+        """One column concatenated over all batches."""
+        chunks = self.chunks[name]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=self.DTYPES[name])
+
+def _price_order(prices):
+    """Row order by price with missing prices (NaN) sorted last."""
+    return np.argsort(prices, kind='stable').astype(np.int32)
+
+class ProductCatalog:
+    """Columnar product catalog with price-range and category indexes."""
+
+    def __init__(self, arrays, categories):
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        self.categories = list(categories)
+        self.category_lookup = {category: code for code, category in enumerate(self.categories)}
+        # Sorted price values are views of the indexes, gathered once
+        self.sorted_min = self.min_prices[self.min_order]
+        self.sorted_max = self.max_prices[self.max_order]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (id, name, image_url, category, min_price, max_price) tuples."""
+        chunks = _ColumnChunks()
+        chunks.add(list(rows))
+        return cls._from_chunks(chunks)
+
+    @classmethod
+    def from_columns(cls, ids, names, urls, category_codes, categories, min_prices, max_prices):
+        """Build the arrays and indexes from column sequences."""
+        arrays = {
+            'ids': np.asarray(ids, dtype=np.int64),
+            'category_codes': np.asarray(category_codes, dtype=np.int32),
+            'min_prices': np.asarray(min_prices, dtype=np.float32),
+            'max_prices': np.asarray(max_prices, dtype=np.float32),
+        }
+        arrays['name_offsets'], arrays['name_buffer'] = _string_column(*_encode_strings(names))
+        arrays['url_offsets'], arrays['url_buffer'] = _string_column(*_encode_strings(urls))
+        return cls._with_indexes(arrays, categories)
+
+    @classmethod
+    def _from_chunks(cls, chunks):
+        arrays = {name: chunks.column(name) for name in ('ids', 'category_codes', 'min_prices', 'max_prices')}
+        arrays['name_offsets'], arrays['name_buffer'] = _string_column(chunks.column('name_lengths'),
+                                                                       chunks.column('name_buffer'))
+        arrays['url_offsets'], arrays['url_buffer'] = _string_column(chunks.column('url_lengths'),
+                                                                     chunks.column('url_buffer'))
+        return cls._with_indexes(arrays, list(chunks.category_lookup))
+
+    @classmethod
+    def _with_indexes(cls, arrays, categories):
+        """Add the price and category indexes to the column arrays."""
+        arrays['min_order'] = _price_order(arrays['min_prices'])
+        arrays['max_order'] = _price_order(arrays['max_prices'])
+
+        # Postings: rows grouped by category code, located through category_offsets
+        arrays['category_rows'] = np.argsort(arrays['category_codes'], kind='stable').astype(np.int32)
+        counts = np.bincount(arrays['category_codes'], minlength=len(categories))
+        arrays['category_offsets'] = np.zeros(len(categories) + 1, dtype=np.int64)
+        np.cumsum(counts, out=arrays['category_offsets'][1:])
+        return cls(arrays, categories)
+
+    @classmethod
+    def load_from_db(cls, conn, fetch_size=FETCH_SIZE):
+        """Stream the active products into a catalog, one batch of NumPy chunks per fetch."""
+        chunks = _ColumnChunks()
+        # Unbuffered: the pooled MySQL connection would otherwise read every row on execute
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(CATALOG_QUERY)
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                chunks.add(batch)
+        finally:
+            cursor.close()
+        return cls._from_chunks(chunks)
+
+    def save(self, directory):
+        """Write the catalog as .npy files plus catalog.json, replacing any previous copy."""
+        tmp_dir = f"{directory}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp_dir, 'catalog.json'), 'w') as f:
+            json.dump({'rows': len(self), 'categories': self.categories}, f)
+
+        old_dir = f"{directory}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(directory):
+            os.rename(directory, old_dir)
+        os.rename(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved catalog; arrays are memory-mapped read-only unless mmap is False."""
+        with open(os.path.join(directory, 'catalog.json')) as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+                  for name in ARRAY_NAMES}
+        return cls(arrays, meta['categories'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        """Bytes held by the catalog arrays."""
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES) + self.sorted_min.nbytes + self.sorted_max.nbytes
+
+    # Row accessors
+
+    def row_of(self, product_id):
+        """Row number of a product id, or None (ids are sorted)."""
+        row = int(np.searchsorted(self.ids, product_id))
+        return row if row < len(self.ids) and self.ids[row] == product_id else None
+
+    def name(self, row):
+        return bytes(self.name_buffer[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    def image_url(self, row):
+        return bytes(self.url_buffer[self.url_offsets[row]:self.url_offsets[row + 1]]).decode('utf-8')
+
+    def category(self, row):
+        return self.categories[self.category_codes[row]]
+
+    def record(self, row):
+        """One product as a dict."""
+        min_price, max_price = float(self.min_prices[row]), float(self.max_prices[row])
+        return {
+            'id': int(self.ids[row]),
+            'product_name': self.name(row),
+            'product_image_url': self.image_url(row),
+            'category': self.category(row),
+            'min_price': None if np.isnan(min_price) else round(min_price, 2),
+            'max_price': None if np.isnan(max_price) else round(max_price, 2),
+        }
+
+    # Queries; each returns an int32 array of row numbers
+
+    def rows_with_min_price(self, low=-np.inf, high=np.inf):
+        """Rows whose min_price lies in [low, high]."""
+        start = np.searchsorted(self.sorted_min, low, side='left')
+        stop = np.searchsorted(self.sorted_min, high, side='right')
+        return self.min_order[start:stop]
+
+    def rows_with_max_price(self, low=-np.inf, high=np.inf):
+        """Rows whose max_price lies in [low, high]."""
+        start = np.searchsorted(self.sorted_max, low, side='left')
+        stop = np.searchsorted(self.sorted_max, high, side='right')
+        return self.max_order[start:stop]
+
+    def rows_in_price_range(self, low=-np.inf, high=np.inf):
+        """Rows whose [min_price, max_price] range overlaps [low, high]."""
+        starts_below = self.rows_with_min_price(high=high)
+        ends_above = self.rows_with_max_price(low=low)
+        # Intersect through the smaller side with a mask over all rows
+        small, large = sorted((starts_below, ends_above), key=len)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[large] = True
+        return np.sort(small[mask[small]])
+
+    def rows_in_category(self, category, subtree=False):
+        """Rows in a category, or with subtree also in every category below it."""
+        if subtree:
+            path = split_category_path(category)
+            codes = [code for code, name in enumerate(self.categories)
+                     if split_category_path(name)[:len(path)] == path]
+        else:
+            codes = [self.category_lookup[category]] if category in self.category_lookup else []
+        if not codes:
+            return np.empty(0, dtype=np.int32)
+        postings = [self.category_rows[self.category_offsets[code]:self.category_offsets[code + 1]]
+                    for code in codes]
+        return np.sort(np.concatenate(postings)) if len(postings) > 1 else np.asarray(postings[0])
+
+    def filter(self, category=None, low=None, high=None, subtree=True):
+        """Rows matching an optional category (subtree) and an optional overlapping price range."""
+        rows = None
+        if category is not None:
+            rows = self.rows_in_category(category, subtree=subtree)
+        if low is not None or high is not None:
+            in_range = self.rows_in_price_range(-np.inf if low is None else low,
+                                                np.inf if high is None else high)
+            rows = in_range if rows is None else np.intersect1d(rows, in_range, assume_unique=True)
+        return np.arange(len(self), dtype=np.int32) if rows is None else rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or query the array-backed product catalog')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help='Load products from MySQL and save the catalog')
+    build.add_argument('directory', help='Catalog directory')
+    query = subcommands.add_parser('query', help='Filter a saved catalog')
+    query.add_argument('directory', help='Catalog directory')
+    query.add_argument('--category', help='Category path (includes subcategories)')
+    query.add_argument('--min-price', type=float, help='Lower bound of the price range')
+    query.add_argument('--max-price', type=float, help='Upper bound of the price range')
+    query.add_argument('--limit', type=int, default=10, help='Products to print')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from dotenv import load_dotenv
+        from db import mysql_connection
+        load_dotenv()
+        conn = mysql_connection()
+        try:
+            catalog = ProductCatalog.load_from_db(conn)
+        finally:
+            conn.close()
+        catalog.save(args.directory)
+        print(f"Saved {len(catalog)} products in {len(catalog.categories)} categories "
+              f"({catalog.nbytes() / 1024 / 1024:.1f} MiB) to {args.directory}")
+    else:
+        catalog = ProductCatalog.load(args.directory)
+        rows = catalog.filter(args.category, args.min_price, args.max_price)
+        print(f"{len(rows)} matching products")
+        for row in rows[:args.limit]:
+            print(json.dumps(catalog.record(row), ensure_ascii=False))
@@ -0,0 +1,23 @@
+def column_exists(cursor, database, table, column):
+    """Return True if table.column exists in the given MySQL database."""
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        """,
+        (database, table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+def ensure_column(cursor, database, table, column, definition, *extra_statements):
+    """Add a column to tables created before it existed.
+
+    extra_statements (indexes, constraints) run only when the column is added.
+    Returns True if the column was added.
+    """
+    if column_exists(cursor, database, table, column):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    for statement in extra_statements:
+        cursor.execute(statement)
+    return True
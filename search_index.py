@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+"""On-disk inverted index for product search, with prefix lookup and BM25 ranking.
+
+Product names and category paths are tokenized into an index of segments.
+Each segment is a directory with a sorted term list and, per term, the
+sorted product ids containing it. Ids are stored as deltas and the deltas
+and term frequencies as varints, so postings take a byte or two per entry.
+
+Imports append a segment with the products changed since the last run
+(updated_at watermark). A product in a newer segment hides its entries
+in older ones, and retired or deleted products are recorded as
+tombstones. Once there are more than MAX_SEGMENTS segments they are merged
+into one. The MANIFEST file lists the live segments and is replaced
+atomically, so readers never see a half-written index.
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import re
+import shutil
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from pipeline_metrics import count, stage
+from schema_migrations import ensure_column
+
+DEFAULT_INDEX_DIR = (os.environ.get('SEARCH_INDEX_DIR')
+                     or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_index'))
+MAX_SEGMENTS = 8
+MAX_PREFIX_TERMS = 50  # terms a trailing prefix expands to, most frequent first
+FETCH_SIZE = 10000
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD_RE = re.compile(r'[^\W_]+')
+DIGIT_LETTER_RE = re.compile(r'\d+|[^\W\d_]+')
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', str(text)).lower()
+
+def tokenize(text):
+    """Lowercased word tokens of a name or category path.
+
+    Joined forms are added for hyphenated or dotted words ("USB-C" gives
+    usb, c and usbc), and digit/letter parts for mixed words ("120W" gives
+    120w, 120 and w). Symbols and emoji only separate words.
+    """
+    if not text:
+        return []
+    tokens = []
+    for chunk in normalize(text).split():
+        words = WORD_RE.findall(chunk)
+        for word in words:
+            tokens.append(word)
+            parts = DIGIT_LETTER_RE.findall(word)
+            if len(parts) > 1:
+                tokens.extend(parts)
+        if len(words) > 1:
+            tokens.append(''.join(words))
+    return tokens
+
+def document_tokens(product_name, category):
+    return tokenize(product_name) + tokenize(category)
+
+def encode_varints(values):
+    """LEB128-encode non-negative integers into a uint8 array."""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.uint8)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= (np.uint64(1) << np.uint64(shift))
+    starts = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for byte in range(int(lengths.max())):
+        has_byte = lengths > byte
+        payload = (values[has_byte] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (lengths[has_byte] > byte + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has_byte] + byte] = (payload | more).astype(np.uint8)
+    return out
+
+def decode_varints(buffer):
+    """Inverse of encode_varints."""
+    buffer = np.asarray(buffer, dtype=np.uint8)
+    if len(buffer) == 0:
+        return np.empty(0, dtype=np.int64)
+    last = (buffer & 0x80) == 0
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_of_byte = np.concatenate(([0], np.cumsum(last)[:-1]))
+    shifts = (np.arange(len(buffer)) - starts[value_of_byte]) * 7
+    parts = (buffer & 0x7F).astype(np.int64) << shifts
+    return np.add.reduceat(parts, starts)
+
+class Segment:
+    """One immutable, memory-mapped index segment."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'terms.json')) as f:
+            self.terms = json.load(f)
+        self.term_offsets = np.load(os.path.join(path, 'term_offsets.npy'), mmap_mode='r')
+        self.doc_freqs = np.load(os.path.join(path, 'doc_freqs.npy'), mmap_mode='r')
+        self.postings = np.load(os.path.join(path, 'postings.npy'), mmap_mode='r')
+        self.doc_ids = np.load(os.path.join(path, 'doc_ids.npy'))
+        self.doc_lengths = np.load(os.path.join(path, 'doc_lengths.npy'))
+        self.deleted = np.load(os.path.join(path, 'deleted.npy'))
+        self.live = np.ones(len(self.doc_ids), dtype=bool)
+
+    def term_index(self, term):
+        position = bisect.bisect_left(self.terms, term)
+        return position if position < len(self.terms) and self.terms[position] == term else None
+
+    def terms_with_prefix(self, prefix):
+        """(term, document frequency) pairs for every term starting with prefix."""
+        position = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            matches.append((self.terms[position], int(self.doc_freqs[position])))
+            position += 1
+        return matches
+
+    def read_postings(self, position):
+        """Product ids and term frequencies of one term, including superseded documents."""
+        values = decode_varints(self.postings[self.term_offsets[position]:self.term_offsets[position + 1]])
+        doc_count = len(values) // 2
+        return np.cumsum(values[:doc_count]), values[doc_count:]
+
+    def live_postings(self, term):
+        """(product ids, term frequencies, document lengths) of live documents containing term."""
+        position = self.term_index(term)
+        if position is None:
+            return None
+        docs, freqs = self.read_postings(position)
+        rows = np.searchsorted(self.doc_ids, docs)
+        keep = self.live[rows]
+        return docs[keep], freqs[keep], self.doc_lengths[rows[keep]]
+
+def write_segment(path, postings, doc_ids, doc_lengths, deleted=()):
+    """Write a segment from {term: (sorted product ids, term frequencies)}."""
+    tmp_dir = f"{path}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    terms = sorted(postings)
+    blocks = []
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    doc_freqs = np.empty(len(terms), dtype=np.int32)
+    for position, term in enumerate(terms):
+        docs, freqs = postings[term]
+        docs = np.asarray(docs, dtype=np.int64)
+        block = encode_varints(np.concatenate((np.diff(docs, prepend=0), np.asarray(freqs, dtype=np.int64))))
+        blocks.append(block)
+        offsets[position + 1] = offsets[position] + len(block)
+        doc_freqs[position] = len(docs)
+
+    with open(os.path.join(tmp_dir, 'terms.json'), 'w') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.save(os.path.join(tmp_dir, 'term_offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'doc_freqs.npy'), doc_freqs)
+    np.save(os.path.join(tmp_dir, 'postings.npy'),
+            np.concatenate(blocks) if blocks else np.empty(0, dtype=np.uint8))
+    np.save(os.path.join(tmp_dir, 'doc_ids.npy'), np.asarray(doc_ids, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'doc_lengths.npy'), np.asarray(doc_lengths, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, 'deleted.npy'), np.asarray(sorted(deleted), dtype=np.int64))
+    os.rename(tmp_dir, path)
+
+def build_postings(documents):
+    """Invert {product_id: tokens} into (postings, sorted ids, document lengths)."""
+    doc_ids = np.array(sorted(documents), dtype=np.int64)
+    doc_lengths = np.array([len(documents[doc_id]) for doc_id in doc_ids], dtype=np.int32)
+    inverted = defaultdict(lambda: ([], []))
+    for doc_id in doc_ids:
+        for term, frequency in Counter(documents[doc_id]).items():
+            docs, freqs = inverted[term]
+            docs.append(int(doc_id))
+            freqs.append(frequency)
+    return dict(inverted), doc_ids, doc_lengths
+
+def _sum_by_doc(docs, scores, reduce=np.add):
+    unique_docs, inverse = np.unique(docs, return_inverse=True)
+    totals = np.zeros(len(unique_docs), dtype=np.float64)
+    reduce.at(totals, inverse, scores)
+    return unique_docs, totals
+
+class SearchIndex:
+    """The segments listed in a directory's MANIFEST."""
+
+    def __init__(self, directory=DEFAULT_INDEX_DIR):
+        self.directory = directory
+        manifest_path = os.path.join(directory, 'MANIFEST')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'segments': [], 'next_segment': 1, 'watermark': None}
+        self.segments = [Segment(os.path.join(directory, name)) for name in self.manifest['segments']]
+        self._mark_live()
+
+    def _mark_live(self):
+        """Hide documents that a newer segment re-indexed or deleted."""
+        newer = np.empty(0, dtype=np.int64)
+        for segment in reversed(self.segments):
+            segment.live = ~np.isin(segment.doc_ids, newer)
+            newer = np.union1d(newer, np.concatenate((segment.doc_ids, segment.deleted)))
+        self.document_count = sum(int(segment.live.sum()) for segment in self.segments)
+        total_length = sum(int(segment.doc_lengths[segment.live].sum()) for segment in self.segments)
+        self.average_length = total_length / self.document_count if self.document_count else 0.0
+
+    @property
+    def watermark(self):
+        return self.manifest['watermark']
+
+    def live_ids(self):
+        ids = [segment.doc_ids[segment.live] for segment in self.segments]
+        return np.sort(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+
+    def _save_manifest(self, segments, watermark):
+        self.manifest = dict(self.manifest, segments=segments, watermark=watermark)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'MANIFEST')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, path)
+
+    def _new_segment_path(self):
+        name = f"segment-{self.manifest['next_segment']:06d}"
+        self.manifest['next_segment'] += 1
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, name)
+
+    def append(self, documents, deleted=(), watermark=None):
+        """Add a segment with {product_id: tokens}; deleted ids are removed from results.
+
+        Products already in the index are replaced by their new tokens.
+        """
+        names = [segment.name for segment in self.segments]
+        if documents or deleted:
+            postings, doc_ids, doc_lengths = build_postings(documents)
+            path = self._new_segment_path()
+            write_segment(path, postings, doc_ids, doc_lengths, deleted)
+            self.segments.append(Segment(path))
+            names.append(os.path.basename(path))
+        self._save_manifest(names, watermark if watermark is not None else self.watermark)
+        self._mark_live()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+
+    def compact(self):
+        """Merge all segments into one that holds only live documents."""
+        if len(self.segments) <= 1 and not any(len(segment.deleted) for segment in self.segments):
+            return
+        merged = defaultdict(lambda: ([], []))
+        for segment in self.segments:
+            for position, term in enumerate(segment.terms):
+                docs, freqs = segment.read_postings(position)
+                keep = segment.live[np.searchsorted(segment.doc_ids, docs)]
+                if keep.any():
+                    merged[term][0].append(docs[keep])
+                    merged[term][1].append(freqs[keep])
+        postings = {}
+        for term, (docs, freqs) in merged.items():
+            docs, freqs = np.concatenate(docs), np.concatenate(freqs)
+            order = np.argsort(docs, kind='stable')
+            postings[term] = (docs[order], freqs[order])
+        doc_ids = np.concatenate([segment.doc_ids[segment.live] for segment in self.segments])
+        doc_lengths = np.concatenate([segment.doc_lengths[segment.live] for segment in self.segments])
+        order = np.argsort(doc_ids, kind='stable')
+
+        old_paths = [segment.path for segment in self.segments]
+        path = self._new_segment_path()
+        write_segment(path, postings, doc_ids[order], doc_lengths[order])
+        self.segments = [Segment(path)]
+        self._save_manifest([os.path.basename(path)], self.watermark)
+        self._mark_live()
+        # Readers that still map the old segments keep working until they reopen the index
+        for old_path in old_paths:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def clear(self):
+        """Drop every segment (before a full rebuild)."""
+        old_paths = [segment.path for segment in self.segments]
+        self.segments = []
+        self._save_manifest([], None)
+        self._mark_live()
+        for old_path in old_paths:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def complete(self, prefix, limit=10):
+        """Indexed terms starting with prefix, most frequent first (autocomplete)."""
+        prefix = ''.join(WORD_RE.findall(normalize(prefix)))
+        frequencies = Counter()
+        for segment in self.segments:
+            for term, frequency in segment.terms_with_prefix(prefix):
+                frequencies[term] += frequency
+        return [term for term, _ in frequencies.most_common(limit)]
+
+    def _term_scores(self, term):
+        """BM25 score of term for every live document containing it."""
+        found = [postings for postings in (segment.live_postings(term) for segment in self.segments)
+                 if postings is not None and len(postings[0])]
+        if not found:
+            return None
+        docs, freqs, lengths = (np.concatenate(column) for column in zip(*found))
+        doc_freq = len(docs)
+        idf = math.log(1 + (self.document_count - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / self.average_length)
+        return docs, idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+
+    def search(self, query, limit=20, prefix=True):
+        """Top products for query as [(product_id, score)], best first.
+
+        With prefix, the last query word also matches longer terms
+        ("charg" finds "charger"), scored by its best-matching expansion.
+        """
+        terms = tokenize(query)
+        if not terms or self.document_count == 0:
+            return []
+        last_word = WORD_RE.findall(normalize(query))[-1]
+        groups = [[term] for term in dict.fromkeys(terms) if not (prefix and term == last_word)]
+        if prefix:
+            groups.append(self.complete(last_word, MAX_PREFIX_TERMS) or [last_word])
+
+        all_docs, all_scores = [], []
+        for group in groups:
+            scored = [scores for scores in (self._term_scores(term) for term in group) if scores is not None]
+            if scored:
+                # A document counts once per query word, with its best expansion
+                docs, scores = _sum_by_doc(np.concatenate([docs for docs, _ in scored]),
+                                           np.concatenate([scores for _, scores in scored]), np.maximum)
+                all_docs.append(docs)
+                all_scores.append(scores)
+        if not all_docs:
+            return []
+        docs, scores = _sum_by_doc(np.concatenate(all_docs), np.concatenate(all_scores))
+        if len(docs) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))
+        return [(int(docs[i]), round(float(scores[i]), 4)) for i in order]
+
+def update_search_index(conn, database, directory=DEFAULT_INDEX_DIR, rebuild=False, check_deleted=False,
+                        fetch_size=FETCH_SIZE):
+    """Index products changed since the last run as a new segment (the import stage).
+
+    rebuild re-indexes every product; check_deleted also drops indexed
+    products that no longer exist (after imports that delete rows).
+    Returns the number of products indexed.
+    """
+    cursor = conn.cursor()
+    try:
+        ensure_column(cursor, database, 'products', 'is_active', 'BOOLEAN NOT NULL DEFAULT TRUE')
+        index = SearchIndex(directory)
+        if rebuild:
+            index.clear()
+        # The database clock sets the watermark, so rows committed during the scan are picked up next time
+        cursor.execute("SELECT NOW()")
+        watermark = str(cursor.fetchone()[0])
+
+        documents, deleted = {}, set()
+        with stage('search_index'):
+            query = "SELECT id, product_name, category, is_active FROM products"
+            # Unbuffered, so only one fetch of rows is held by the driver at a time
+            read_cursor = conn.cursor(buffered=False)
+            try:
+                if index.watermark is not None:
+                    read_cursor.execute(f"{query} WHERE updated_at >= %s", (index.watermark,))
+                else:
+                    read_cursor.execute(query)
+                while True:
+                    rows = read_cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for product_id, product_name, category, is_active in rows:
+                        if is_active:
+                            documents[product_id] = document_tokens(product_name, category)
+                        else:
+                            deleted.add(product_id)
+            finally:
+                read_cursor.close()
+
+            if check_deleted and index.segments:
+                cursor.execute("SELECT id FROM products")
+                existing = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+                deleted.update(int(product_id) for product_id in np.setdiff1d(index.live_ids(), existing))
+
+            index.append(documents, deleted, watermark)
+    finally:
+        cursor.close()
+    count('search_indexed', len(documents))
+    count('search_removed', len(deleted))
+    return len(documents)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or query the product search index')
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help='Index directory')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help='Index products changed since the last build')
+    build.add_argument('--rebuild', action='store_true', help='Re-index every product')
+    build.add_argument('--check-deleted', action='store_true', help='Drop products deleted from the table')
+    search = subcommands.add_parser('search', help='Ranked search, as JSON')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20)
+    complete = subcommands.add_parser('complete', help='Autocomplete a prefix, as JSON')
+    complete.add_argument('prefix')
+    complete.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from dotenv import load_dotenv
+        from db import connection_settings, mysql_connection
+        load_dotenv()
+        conn = mysql_connection()
+        try:
+            indexed = update_search_index(conn, connection_settings('mysql')['database'], args.index_dir,
+                                          rebuild=args.rebuild, check_deleted=args.check_deleted)
+        finally:
+            conn.close()
+        print(f"Indexed {indexed} products into {args.index_dir}")
+    elif args.command == 'search':
+        results = SearchIndex(args.index_dir).search(args.query, args.limit)
+        print(json.dumps([{'id': product_id, 'score': score} for product_id, score in results]))
+    else:
+        print(json.dumps(SearchIndex(args.index_dir).complete(args.prefix, args.limit), ensure_ascii=False))
@@ -2,40 +2,78 @@
 import sys
 import json
 import os
+import argparse
+import socketserver
+import time
+import numpy as np
 import pandas as pd
-import pickle
-from sqlalchemy import create_engine
+
+# The model registry is shared with the pricing engine, the db module with the whole repo
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'pricing_engine'))
+sys.path.insert(0, ROOT_DIR)
+import db
+from pipeline_metrics import count, pipeline_metrics, profiled, stage
+from model_registry import get_model
+from feature_snapshot import get_product_features
+from result_cache import cache_key, result_cache
+from grid_search import grid_search_prices, constraints_from_parameters
+from elasticity import demand_baselines, table_version
+from history_writer import history_writer
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'price_optimizer.pkl')
+HEURISTIC_VERSION = 'heuristic'
+GRID_SEARCH_VERSION = 'grid-search'
+METRICS_WRITE_INTERVAL = 15  # seconds between Prometheus textfile updates in worker mode
+
+_metrics_written_at = 0.0
 
 def connect_to_database():
     """Connect to the database."""
-    db_host = os.environ.get('DB_HOST', 'localhost')
-    db_user = os.environ.get('DB_USER', 'postgres')
-    db_password = os.environ.get('DB_PASSWORD', '')
-    db_name = os.environ.get('DB_NAME', 'lazada_products')
-    
-    connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
-    return create_engine(connection_string)
+    return db.get_engine('postgres')
+
+def get_engine():
+    """Return the process-wide pooled engine, shared across worker requests."""
+    return connect_to_database()
+
+def load_model():
+    """Return the current LoadedModel from the registry; None if no model is available."""
+    with stage('model_load'):
+        return get_model(MODEL_PATH)
 
 def get_product_data(engine, product_id):
-    """Retrieve product data from database."""
-    query = f"SELECT * FROM products WHERE id = {product_id}"
-    return pd.read_sql(query, engine)
+    """Retrieve product data from the feature snapshot, or the database on a miss."""
+    with stage('feature_lookup'):
+        product_data = get_product_features(product_id)
+    if product_data is not None:
+        count('snapshot_hits')
+        return product_data
+    count('snapshot_misses')
+    # Retired listings are left out of the snapshot; a miss must not bring them back
+    query = "SELECT * FROM products WHERE id = %(product_id)s AND is_active IS NOT FALSE"
+    return pd.read_sql(query, engine, params={'product_id': int(product_id)})
 
 def optimize_price(product_data, parameters):
     """Optimize price based on product data and parameters."""
-    # Load trained model or use a simple calculation if model doesn't exist
-    model_path = os.path.join(os.path.dirname(__file__), 'models', 'price_optimizer.pkl')
+    if parameters.get('optimizer') == 'grid':
+        return optimize_prices_grid(product_data, parameters)[0]
     
-    try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
+    # Use the trained model or a simple calculation if model doesn't exist
+    loaded = load_model()
+    
+    if loaded is not None:
+        model_version = loaded.version
         
         # Feature engineering
-        features = prepare_features(product_data, parameters)
+        with stage('feature_prep'):
+            features = prepare_features(product_data, parameters)
         
         # Predict optimal price
-        optimal_price = model.predict(features)[0]
-    except (FileNotFoundError, IOError):
+        with stage('predict'):
+            optimal_price = loaded.model.predict(features)[0]
+    else:
+        model_version = HEURISTIC_VERSION
+        
         # Fallback if model doesn't exist: simple demand-based calculation
         current_price = product_data['price'].iloc[0]
         cost = product_data['cost'].iloc[0]
@@ -64,9 +102,41 @@ def optimize_price(product_data, parameters):
         'expected_sales': float(expected_sales),
         'expected_revenue': float(expected_revenue),
         'expected_profit': float(expected_profit),
-        'current_price': float(product_data['price'].iloc[0])
+        'current_price': float(product_data['price'].iloc[0]),
+        'model_version': model_version
     }
 
+def optimize_prices_grid(products_data, parameters):
+    """Search a dense price grid for the profit-maximising price of every product."""
+    current_price = products_data['price'].to_numpy(dtype=float)
+    base_sales, base_price, elasticity = get_demand_baseline(products_data)
+    constraints = constraints_from_parameters(parameters)
+    # An elasticity in the request overrides the fitted one
+    constraints.setdefault('elasticity', elasticity)
+    
+    with stage('predict'):
+        result = grid_search_prices(
+            products_data['cost'].to_numpy(dtype=float),
+            current_price,
+            base_sales,
+            base_price,
+            competitor_price=parameters.get('competitor_price'),
+            **constraints
+        )
+    
+    return [
+        {
+            'optimal_price': float(result['optimal_price'][i]),
+            'expected_sales': float(result['expected_sales'][i]),
+            'expected_revenue': float(result['expected_revenue'][i]),
+            'expected_profit': float(result['expected_profit'][i]),
+            'current_price': float(current_price[i]),
+            'feasible': bool(result['feasible'][i]),
+            'model_version': GRID_SEARCH_VERSION
+        }
+        for i in range(len(products_data))
+    ]
+
 def prepare_features(product_data, parameters):
     """Prepare features for the model."""
     # Implementation depends on your specific model requirements
@@ -79,18 +149,29 @@ def prepare_features(product_data, parameters):
         'season': [parameters.get('season', 'regular')]
     })
 
+def get_demand_baseline(products_data):
+    """Return (base_sales, base_price, elasticity) arrays for the demand curve of each product.
+
+    Elasticities and the baseline for products without sales history come
+    from the fitted elasticity table (pricing_engine/elasticity.py).
+    """
+    def column(name, dtype, default):
+        if name in products_data.columns:
+            return products_data[name].to_numpy(dtype=dtype)
+        return np.full(len(products_data), default, dtype=dtype)
+    
+    return demand_baselines(
+        column('id', np.int64, -1),
+        column('category', object, None),
+        column('historical_sales', float, np.nan),
+        column('historical_price', float, np.nan),
+        column('price', float, np.nan)
+    )
+
 def calculate_expected_sales(price, product_data):
     """Calculate expected sales at the given price."""
-    # Simple price elasticity model as a placeholder
-    if 'historical_sales' in product_data.columns and 'historical_price' in product_data.columns:
-        base_sales = product_data['historical_sales'].iloc[0]
-        base_price = product_data['historical_price'].iloc[0]
-    else:
-        # Fallback values if historical data is not available
-        base_sales = 100  # Arbitrary baseline sales
-        base_price = product_data['price'].iloc[0]
-    
-    elasticity = -1.2  # Example elasticity coefficient (negative means lower price = more sales)
+    base_sales, base_price, elasticity = get_demand_baseline(product_data)
+    base_sales, base_price, elasticity = base_sales[0], base_price[0], elasticity[0]
     
     if base_price == 0:  # Avoid division by zero
         return base_sales
@@ -102,14 +183,100 @@ def calculate_expected_profit(price, sales, product_data):
     cost = product_data['cost'].iloc[0]
     return (price - cost) * sales
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: price_optimizer.py [input_file] [output_file]")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+def current_model_version(parameters):
+    """Model version optimize_price will report for these parameters."""
+    if parameters.get('optimizer') == 'grid':
+        return GRID_SEARCH_VERSION
+    loaded = load_model()
+    return loaded.version if loaded is not None else HEURISTIC_VERSION
+
+def optimize_price_cached(product_id, product_data, parameters):
+    """optimize_price through the result cache; the result says whether it was cached."""
+    updated_at = product_data['updated_at'].iloc[0] if 'updated_at' in product_data.columns else None
+    # A refitted elasticity table changes the answer as much as a new model does
+    key = cache_key(product_id, parameters, updated_at, f"{current_model_version(parameters)}+{table_version()}")
+    result = result_cache.get(key)
+    if result is not None:
+        count('cache_hits')
+        return dict(result, cached=True)
     
+    count('cache_misses')
+    result = optimize_price(product_data, parameters)
+    result_cache.put(key, result)
+    return dict(result, cached=False)
+
+def handle_request(request):
+    """Handle a single optimization request and return the response dict."""
+    response = {'id': request.get('id')}
+    try:
+        product_data = get_product_data(get_engine(), request['productId'])
+        if product_data.empty:
+            response['error'] = 'Product not found'
+        else:
+            parameters = request.get('parameters') or {}
+            response.update(optimize_price_cached(request['productId'], product_data, parameters))
+            count('products_optimized')
+            # A cached result was recorded when it was computed
+            if not response['cached']:
+                history_writer.record(request['productId'], response, parameters)
+    except Exception as e:
+        count('errors')
+        response['error'] = str(e)
+    write_metrics()
+    return response
+
+def write_metrics(force=False):
+    """Refresh the worker's Prometheus textfile, at most every METRICS_WRITE_INTERVAL seconds."""
+    global _metrics_written_at
+    now = time.monotonic()
+    if force or now - _metrics_written_at >= METRICS_WRITE_INTERVAL:
+        _metrics_written_at = now
+        try:
+            pipeline_metrics.write_prometheus('price_optimizer')
+        except OSError as e:
+            print(f"Could not write metrics: {e}", file=sys.stderr)
+
+def handle_line(line):
+    """Decode one newline-delimited JSON request and encode its response."""
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return json.dumps({'id': None, 'error': f'Invalid request: {e}'})
+    if not isinstance(request, dict):
+        return json.dumps({'id': None, 'error': 'Invalid request: expected a JSON object'})
+    return json.dumps(handle_request(request))
+
+def serve_stdio():
+    """Serve newline-delimited JSON requests on stdin, one response per line on stdout."""
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        sys.stdout.write(handle_line(line) + '\n')
+        sys.stdout.flush()
+
+class WorkerRequestHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests over a Unix socket connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write((handle_line(line) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+def serve_socket(socket_path):
+    """Serve requests on a Unix socket until interrupted."""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, WorkerRequestHandler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+def run_once(input_file, output_file):
+    """Process a single request file and write the result file."""
     with open(input_file, 'r') as f:
         input_data = json.load(f)
     
@@ -125,6 +292,48 @@ if __name__ == "__main__":
         sys.exit(1)
     
     result = optimize_price(product_data, parameters)
-    
     with open(output_file, 'w') as f:
-        json.dump(result, f) 
\ No newline at end of file
+        json.dump(result, f)
+    
+    # One bounded COPY once the result is out; if Postgres cannot take it, the row stays spilled
+    history_writer.start(flush=False)
+    history_writer.record(product_id, result, parameters)
+    history_writer.flush_and_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Optimize product price',
+        usage='price_optimizer.py [input_file] [output_file] | --worker [--socket PATH]'
+    )
+    parser.add_argument('input_file', nargs='?', help='JSON file with productId and parameters')
+    parser.add_argument('output_file', nargs='?', help='File to write the optimization result to')
+    parser.add_argument('--worker', action='store_true',
+                        help='Run as a long-lived worker speaking newline-delimited JSON')
+    parser.add_argument('--socket', help='Unix socket path for worker mode (default: stdin/stdout)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Dump cProfile and tracemalloc reports for this process to DIR on exit')
+    
+    args = parser.parse_args()
+    
+    if not (args.worker or (args.input_file and args.output_file)):
+        parser.print_usage()
+        sys.exit(1)
+    
+    with profiled('price_optimizer', args.profile):
+        try:
+            if args.worker:
+                # Warm up the engine and model before accepting requests
+                get_engine()
+                load_model()
+                # Also writes the history rows that per-request CLI processes spill
+                history_writer.start()
+                if args.socket:
+                    serve_socket(args.socket)
+                else:
+                    serve_stdio()
+            else:
+                run_once(args.input_file, args.output_file)
+        finally:
+            # Write out buffered history; what cannot be written stays in the spill file for the next start
+            history_writer.close()
+            write_metrics(force=True)
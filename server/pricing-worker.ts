@@ -0,0 +1,79 @@
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import * as path from 'path';
+import * as readline from 'readline';
+import { OptimizationResult } from '../shared/schema';
+
+// Use path.resolve() instead of import.meta
+const __dirname = path.resolve();
+
+interface PendingRequest {
+  resolve: (result: OptimizationResult) => void;
+  reject: (error: Error) => void;
+}
+
+// Long-lived price_optimizer.py process speaking newline-delimited JSON,
+// so the interpreter, DB engine and model stay warm between requests
+class PricingWorker {
+  private worker: ChildProcessWithoutNullStreams | null = null;
+  private pending = new Map<number, PendingRequest>();
+  private nextId = 1;
+
+  private start(): ChildProcessWithoutNullStreams {
+    const worker = spawn(
+      process.env.PYTHON_PATH || 'python',
+      [path.join(__dirname, '..', 'ml', 'price_optimizer.py'), '--worker'],
+      { stdio: 'pipe' }
+    );
+
+    readline.createInterface({ input: worker.stdout }).on('line', (line: string) => {
+      let response: any;
+      try {
+        response = JSON.parse(line);
+      } catch (error) {
+        console.error('Invalid response from pricing worker:', line);
+        return;
+      }
+
+      const request = this.pending.get(response.id);
+      if (!request) {
+        return;
+      }
+      this.pending.delete(response.id);
+
+      if (response.error) {
+        request.reject(new Error(response.error));
+      } else {
+        delete response.id;
+        request.resolve(response as OptimizationResult);
+      }
+    });
+
+    worker.stderr.on('data', (data: Buffer) => {
+      console.error(`Pricing worker: ${data.toString()}`);
+    });
+
+    worker.on('exit', (code: number | null) => {
+      console.error(`Pricing worker exited with code ${code}`);
+      this.worker = null;
+      // Fail in-flight requests; the next request restarts the worker
+      this.pending.forEach((request) => request.reject(new Error('Pricing worker exited')));
+      this.pending.clear();
+    });
+
+    return worker;
+  }
+
+  optimize(productId: number, parameters: any): Promise<OptimizationResult> {
+    if (!this.worker) {
+      this.worker = this.start();
+    }
+
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      this.worker!.stdin.write(JSON.stringify({ id, productId, parameters }) + '\n');
+    });
+  }
+}
+
+export const pricingWorker = new PricingWorker();
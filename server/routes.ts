@@ -1,9 +1,8 @@
 import express from 'express';
-import { PythonShell } from 'python-shell';
 import * as path from 'path';
 import { v4 as uuidv4 } from 'uuid';
 import { pool } from './db';
-import * as fs from 'fs';
+import { pricingWorker } from './pricing-worker';
 import { OptimizationResult, Product } from '../shared/schema';
 
 // Use path.resolve() instead of import.meta
@@ -68,68 +67,17 @@ router.post('/api/optimize-price', async (req, res) => {
   try {
     const { productId, parameters } = req.body;
     
-    // Create temporary file for parameters
-    const paramFileName = path.join(__dirname, '..', 'temp', `params_${uuidv4()}.json`);
-    const resultFileName = path.join(__dirname, '..', 'temp', `result_${uuidv4()}.json`);
-    
-    // Ensure temp directory exists
-    if (!fs.existsSync(path.join(__dirname, '..', 'temp'))) {
-      fs.mkdirSync(path.join(__dirname, '..', 'temp'), { recursive: true });
+    // Run price optimization on the persistent worker
+    let result: OptimizationResult;
+    try {
+      result = await pricingWorker.optimize(productId, parameters);
+    } catch (error) {
+      console.error('Error running price optimization:', error);
+      return res.status(500).json({ error: 'Price optimization failed' });
     }
     
-    // Write parameters to file
-    fs.writeFileSync(paramFileName, JSON.stringify({
-      productId,
-      parameters
-    }));
-    
-    // Set up Python options
-    const options = {
-      mode: 'text',
-      pythonPath: process.env.PYTHON_PATH || 'python',
-      scriptPath: path.join(__dirname, '..', 'ml'),
-      args: [paramFileName, resultFileName]
-    };
-    
-    // Run price optimization
-    PythonShell.run('price_optimizer.py', options, (err: Error | null) => {
-      if (err) {
-        console.error('Error running price optimization:', err);
-        return res.status(500).json({ error: 'Price optimization failed' });
-      }
-      
-      // Read results
-      if (!fs.existsSync(resultFileName)) {
-        return res.status(500).json({ error: 'No optimization results found' });
-      }
-      
-      const resultData = fs.readFileSync(resultFileName, 'utf8');
-      const result = JSON.parse(resultData);
-      
-      // Clean up temporary files
-      fs.unlinkSync(paramFileName);
-      fs.unlinkSync(resultFileName);
-      
-      // Store optimization history in database
-      pool.query(`
-        INSERT INTO price_optimization_history (
-          product_id, current_price, optimal_price, expected_sales,
-          expected_revenue, expected_profit, parameters
-        ) VALUES ($1, $2, $3, $4, $5, $6, $7)
-      `, [
-        productId,
-        result.current_price,
-        result.optimal_price,
-        result.expected_sales,
-        result.expected_revenue,
-        result.expected_profit,
-        parameters
-      ]).catch((error: Error) => {
-        console.error('Error saving optimization history:', error);
-      });
-      
-      res.json(result);
-    });
+    // The pricing worker persists optimization history itself (pricing_engine/history_writer.py)
+    res.json(result);
   } catch (error) {
     console.error('Error in price optimization:', error);
     res.status(500).json({ error: 'Price optimization failed' });
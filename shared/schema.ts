@@ -26,6 +26,9 @@ export interface OptimizationResult {
   expected_revenue: number;
   expected_profit: number;
   current_price: number;
+  model_version?: string;
+  feasible?: boolean;
+  cached?: boolean;
 }
 
 export interface OptimizationParams {
@@ -0,0 +1,77 @@
+"""grid_search_price (single product, plain Python) against grid_search_prices (NumPy)."""
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pricing_engine'))
+from grid_search import grid_search_price, grid_search_prices
+
+KEYS = ('optimal_price', 'expected_sales', 'expected_revenue', 'expected_profit', 'feasible')
+
+def assert_same(scalar, vectorized, index=0):
+    for key in KEYS:
+        expected = vectorized[key][index]
+        actual = scalar[key]
+        if key == 'feasible':
+            assert actual == bool(expected), key
+        elif math.isnan(expected):
+            assert math.isnan(actual), key
+        else:
+            assert actual == pytest.approx(float(expected), rel=1e-9, abs=1e-9), key
+
+def random_products(count, seed=7):
+    rng = random.Random(seed)
+    products = []
+    for _ in range(count):
+        price = rng.uniform(1, 500)
+        products.append({
+            'cost': price * rng.uniform(0.2, 1.2),
+            'current_price': price,
+            'base_sales': rng.uniform(0, 200),
+            'base_price': price * rng.uniform(0.5, 1.5),
+            'competitor_price': rng.choice([None, 0.0, price * rng.uniform(0.6, 1.4)]),
+        })
+    return products
+
+@pytest.mark.parametrize('constraints', [
+    {},
+    {'elasticity': -2.5, 'min_margin': 0.05},
+    {'max_price_change': 0.1, 'competitor_ceiling': 0.9},
+    {'elasticity': -0.8, 'max_price_factor': 3.0, 'grid_size': 101},
+])
+def test_matches_vectorized_search(constraints):
+    products = random_products(200)
+    vectorized = grid_search_prices(
+        [p['cost'] for p in products], [p['current_price'] for p in products],
+        [p['base_sales'] for p in products], [p['base_price'] for p in products],
+        # A non-positive competitor price imposes no ceiling, like a missing one
+        competitor_price=[p['competitor_price'] or 0.0 for p in products],
+        **constraints
+    )
+    for index, product in enumerate(products):
+        scalar = grid_search_price(product['cost'], product['current_price'], product['base_sales'],
+                                   product['base_price'], competitor_price=product['competitor_price'],
+                                   **constraints)
+        assert_same(scalar, vectorized, index)
+
+@pytest.mark.parametrize('product', [
+    # No usable base price: demand is flat
+    {'cost': 10.0, 'current_price': 20.0, 'base_sales': 50.0, 'base_price': 0.0},
+    {'cost': 10.0, 'current_price': 20.0, 'base_sales': 50.0, 'base_price': math.nan},
+    # Missing cost or sales (NULL in the database)
+    {'cost': math.nan, 'current_price': 20.0, 'base_sales': 50.0, 'base_price': 18.0},
+    {'cost': 10.0, 'current_price': 20.0, 'base_sales': math.nan, 'base_price': 18.0},
+    # Margin floor above the competitor ceiling: infeasible
+    {'cost': 30.0, 'current_price': 20.0, 'base_sales': 50.0, 'base_price': 18.0, 'competitor_price': 25.0},
+    # Zero cost puts the first candidate at price zero
+    {'cost': 0.0, 'current_price': 20.0, 'base_sales': 50.0, 'base_price': 18.0},
+])
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')  # NumPy warns where both give NaN
+def test_matches_vectorized_search_on_edge_cases(product):
+    competitor_price = product.pop('competitor_price', None)
+    vectorized = grid_search_prices(**product, competitor_price=competitor_price)
+    scalar = grid_search_price(**product, competitor_price=competitor_price)
+    assert_same(scalar, vectorized)